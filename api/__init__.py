@@ -0,0 +1,3 @@
+"""
+Headless HTTP API (run with python -m api.server)
+"""
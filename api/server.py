@@ -0,0 +1,484 @@
+"""
+Headless async HTTP API over the processors package.
+
+Usage:
+    python -m api.server [--host 127.0.0.1 --port 8000]
+    uvicorn api.server:app --port 8000
+
+Endpoints (JSON bodies; "stream": true returns NDJSON lines as they are produced):
+    GET  /health
+    GET  /metrics
+    GET  /namespaces/{namespace}
+    POST /namespaces/{namespace}/ingest      multipart files, or {"documents": [{"file_name", "text"}]}
+    POST /namespaces/{namespace}/query       {"question", "language"?, "stream"?}
+    POST /namespaces/{namespace}/questions   {"topic", "question_type"?, "num_questions"?, "difficulty"?, ...}
+    POST /namespaces/{namespace}/concepts    {"topic"?, "language"?, "stream"?}
+
+Each namespace has its own index under API_STORAGE_DIR, loaded once and
+shared by every request. Blocking work runs in the thread pool so requests
+are served concurrently; LLM calls go through the shared client, scheduler
+(an "X-Session-Id" header identifies the caller for fairness), answer cache
+and single-flight layer like the Streamlit app.
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import contextvars
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.node_parser import SentenceSplitter
+
+from config.settings import (
+    API_STORAGE_DIR,
+    API_MAX_QUESTIONS,
+    API_CHUNK_SIZE_RANGE,
+    DEFAULT_LLM_MODEL,
+    DEFAULT_EMBED_MODEL,
+    DEFAULT_SUBJECT,
+    DEFAULT_LANGUAGE,
+    DEFAULT_CHUNK_SIZE,
+    CONCEPT_MAP_ENABLED
+)
+from config.subjects_en import SUBJECT_NAMES_EN
+from processors.answer_cache import get_answer_cache, normalize_question
+from processors.compression import QuestionQuery
+from processors.concept_extractor import get_concept_extraction_prompt
+from processors.concept_map import load_concept_map, find_concepts, render_concepts, start_concept_map_build
+from processors.concept_mapreduce import ConceptMapReducer
+from processors.document_processor import process_documents, save_index, get_index_generation
+from processors.indexing import create_french_subject_engine, create_english_subject_engine
+from processors.llm_client import get_llm, get_embed_model, get_llm_metrics
+from processors.openai_integration import generate_questions
+from processors.prompts import get_subject_system_prompt
+from processors.retrieval import retrieve_context
+from processors.scheduler import get_scheduler, request_context
+from processors.single_flight import get_single_flight, request_fingerprint
+from processors.synthesis import get_synthesis_stats
+from utils.streaming import iter_response_text
+
+_NAMESPACE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _sources(source_nodes):
+    return [{
+        "file_name": n.node.metadata.get("file_name"),
+        "page": n.node.metadata.get("page_label"),
+        "score": n.score,
+        "node_id": n.node.node_id
+    } for n in source_nodes]
+
+
+class Namespace:
+    """A loaded index with its models and (lazily built) per-language query engines"""
+
+    def __init__(self, name, persist_dir, metadata):
+        self.name = name
+        self.persist_dir = persist_dir
+        self.metadata = metadata
+        self.generation = metadata.get("generation")
+        self.subject = metadata.get("subject", DEFAULT_SUBJECT)
+        self.language = metadata.get("language", DEFAULT_LANGUAGE)
+        self.llm_model = metadata.get("llm_model", DEFAULT_LLM_MODEL)
+        self.llm = get_llm(self.llm_model)
+        self.embed_model = get_embed_model(metadata.get("embed_model", DEFAULT_EMBED_MODEL))
+        storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+        self.index = load_index_from_storage(storage_context, embed_model=self.embed_model)
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def subject_for(self, language):
+        return SUBJECT_NAMES_EN.get(self.subject.lower(), self.subject) if language == "en" else self.subject
+
+    def engine(self, language):
+        with self._lock:
+            if language not in self._engines:
+                create = create_french_subject_engine if language == "fr" else create_english_subject_engine
+                self._engines[language] = create(self.index, self.subject, self.llm)
+            return self._engines[language]
+
+    def answer(self, question, language):
+        """Start answering; returns (sources, chunk iterator, info) like the QA tab"""
+        subject = self.subject_for(language)
+        answer_cache = get_answer_cache()
+        scope = answer_cache.make_scope(self.generation, subject, language, self.llm_model)
+        cached, match_type, embedding = answer_cache.get(scope, question,
+                                                         embed_fn=self.embed_model.get_query_embedding)
+        if cached is not None:
+            return _sources(cached["source_nodes"]), iter([cached["answer"]]), {"cached": match_type}
+
+        engine = self.engine(language)
+        query_bundle = QuestionQuery(query_str=question, embedding=list(embedding))
+
+        def start_query():
+            response = engine.query(query_bundle)
+            return response, iter_response_text(response)
+
+        flight_key = request_fingerprint(
+            kind="qa",
+            question=normalize_question(question),
+            system_prompt=get_subject_system_prompt(subject, language),
+            scope=scope
+        )
+        flight, coalesced = get_single_flight().stream(flight_key, start_query)
+        response = flight.result()
+        source_nodes = getattr(response, "source_nodes", None) or []
+        info = {"cached": None, "coalesced": coalesced}
+
+        def chunks():
+            parts = []
+            for chunk in flight:
+                parts.append(chunk)
+                yield chunk
+            answer_cache.put(scope, question, "".join(parts), source_nodes, embedding)
+            info["synthesis"] = get_synthesis_stats(response)
+
+        return _sources(source_nodes), chunks(), info
+
+    def questions(self, topic, question_type, num_questions, difficulty, language):
+        """Start generating questions; returns (sources, item iterator, info)"""
+        subject = self.subject_for(language)
+
+        def start_generation():
+            context = retrieve_context(self.engine(language), topic)
+            items = generate_questions(
+                question_type=question_type,
+                num_questions=num_questions,
+                topic=topic,
+                subject=subject,
+                difficulty=difficulty,
+                relevant_content=context["text"],
+                llm_model_name=self.llm_model,
+                language=language,
+                stream=True,
+                context_passages=context["passages"]
+            )
+            return context, items
+
+        flight_key = request_fingerprint(
+            kind="questions", question_type=question_type, count=num_questions, topic=topic.lower().strip(),
+            subject=subject, difficulty=difficulty, language=language, model=self.llm_model,
+            generation=self.generation
+        )
+        flight, coalesced = get_single_flight().stream(flight_key, start_generation)
+        context = flight.result()
+        sources = sorted({p["file_name"] for p in context["passages"] if p["file_name"]})
+        return sources, iter(flight), {"coalesced": coalesced}
+
+    def concepts(self, topic, language):
+        """Start extracting concepts; returns (chunk iterator, info)"""
+        subject = self.subject_for(language)
+        concept_map = load_concept_map(self.generation, self.persist_dir)
+        if concept_map is not None:
+            if not topic:
+                return iter([concept_map["languages"][language]["markdown"]]), {"source": "concept_map"}
+            matches = find_concepts(concept_map, language, topic)
+            if matches:
+                return iter([render_concepts(matches, subject, topic, language)]), {"source": "concept_map"}
+
+        if topic:
+            prompt = get_concept_extraction_prompt(topic, subject, language)
+            engine = self.engine(language)
+
+            def start_query():
+                response = engine.query(prompt)
+                return response, iter_response_text(response)
+
+            flight_key = request_fingerprint(
+                kind="concepts", prompt=prompt, system_prompt=get_subject_system_prompt(subject, language),
+                model=self.llm_model, generation=self.generation
+            )
+            flight, coalesced = get_single_flight().stream(flight_key, start_query)
+            flight.result()
+            return iter(flight), {"source": "llm", "coalesced": coalesced}
+
+        extractor = ConceptMapReducer(self.llm, subject, language, persist_dir=self.persist_dir)
+        return extractor.stream(), {"source": "map_reduce", "stats": extractor.stats}
+
+
+class NamespaceRegistry:
+    """Namespaces loaded on first use and shared by all requests; reloaded after a new ingest.
+
+    Ingests into one namespace run one at a time and build into a staging
+    directory, which replaces the namespace's directory only once complete.
+    """
+
+    def __init__(self, root=API_STORAGE_DIR):
+        self.root = root
+        self._namespaces = {}
+        self._ingest_locks = {}
+        self._swap_locks = {}
+        self._lock = threading.Lock()
+
+    def _namespace_lock(self, locks, name):
+        with self._lock:
+            return locks.setdefault(name, threading.Lock())
+
+    def path(self, name):
+        if not _NAMESPACE.match(name):
+            raise APIError(400, "Namespace names use letters, digits, '-' and '_' (at most 64)")
+        return os.path.join(self.root, name)
+
+    def get(self, name):
+        persist_dir = self.path(name)
+        # Not while an ingest swaps the directory in
+        with self._namespace_lock(self._swap_locks, name):
+            generation = get_index_generation(persist_dir)
+            if generation is None:
+                raise APIError(404, f"Namespace '{name}' has no index; ingest documents first")
+            with self._lock:
+                namespace = self._namespaces.get(name)
+            if namespace is not None and namespace.generation == generation:
+                return namespace
+
+            def load():
+                with open(os.path.join(persist_dir, "metadata.json"), "r") as f:
+                    return Namespace(name, persist_dir, json.load(f))
+
+            # Concurrent first requests share a single load
+            namespace = get_single_flight().do(request_fingerprint(kind="load", namespace=name, generation=generation), load)
+        with self._lock:
+            self._namespaces[name] = namespace
+        return namespace
+
+    def ingest(self, name, files, subject, language, llm_model, embed_model_name, chunk_size):
+        """Index ``files`` ((file name, bytes) pairs) into a fresh generation of the namespace"""
+        persist_dir = self.path(name)
+        with self._namespace_lock(self._ingest_locks, name):
+            materials_dir = os.path.join(persist_dir, "materials")
+            os.makedirs(materials_dir, exist_ok=True)
+            paths = []
+            for file_name, data in files:
+                path = os.path.join(materials_dir, os.path.basename(file_name))
+                with open(path, "wb") as f:
+                    f.write(data)
+                paths.append(path)
+
+            # Chunk with this namespace's size; the global Settings belong to the app
+            embed_model = get_embed_model(embed_model_name)
+            result = process_documents(paths, embed_model, transformations=[SentenceSplitter(chunk_size=chunk_size)])
+            if not result or not result[0]:
+                raise APIError(422, "No readable content found in the uploaded documents")
+            index, valid_docs = result
+
+            # Requests keep reading the previous index until the new one is complete
+            staging = tempfile.mkdtemp(dir=self.root, prefix=f".{name}-")
+            try:
+                generation = save_index(index, embed_model_name, llm_model, chunk_size, subject, language, valid_docs,
+                                        persist_dir=staging)
+                previous = staging + "-previous"
+                with self._namespace_lock(self._swap_locks, name):
+                    # The uploaded materials are kept; the other files belong to the previous index
+                    os.rename(materials_dir, os.path.join(staging, "materials"))
+                    os.rename(persist_dir, previous)
+                    os.rename(staging, persist_dir)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+            shutil.rmtree(previous, ignore_errors=True)
+
+        if CONCEPT_MAP_ENABLED:
+            start_concept_map_build(get_llm(llm_model), subject, generation, persist_dir)
+        return {"namespace": name, "generation": generation, "documents": len(valid_docs)}
+
+
+registry = NamespaceRegistry()
+
+
+def _session(request):
+    return request.headers.get("x-session-id") or (request.client.host if request.client else None)
+
+
+def _int_option(options, key, default, minimum, maximum=None):
+    """An integer request option within [minimum, maximum]; anything else is a 400"""
+    value = options.get(key, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise APIError(400, f"'{key}' must be an integer")
+    if value < minimum or (maximum is not None and value > maximum):
+        bounds = f"between {minimum} and {maximum}" if maximum is not None else f"at least {minimum}"
+        raise APIError(400, f"'{key}' must be {bounds}")
+    return value
+
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise APIError(400, "Request body must be JSON")
+    if not isinstance(body, dict):
+        raise APIError(400, "Request body must be a JSON object")
+    return body
+
+
+def _ndjson(header, chunks, info, start_time, key="delta"):
+    """NDJSON stream: a header line, one line per chunk, then a summary line"""
+    yield json.dumps(header, ensure_ascii=False) + "\n"
+    for chunk in chunks:
+        yield json.dumps({key: chunk}, ensure_ascii=False) + "\n"
+    yield json.dumps({"done": True, "latency_s": round(time.time() - start_time, 3), **info}, ensure_ascii=False,
+                     default=str) + "\n"
+
+
+def _in_context(iterator, context):
+    """Advance a lazy iterator in ``context``, copied by the handler inside its request_context.
+
+    The response body is only iterated after the handler has returned, so the
+    context has to be captured before that for the priority class and session to apply.
+    """
+    while True:
+        try:
+            item = context.run(next, iterator)
+        except StopIteration:
+            return
+        yield item
+
+
+def _stream_response(lines, context):
+    return StreamingResponse(iterate_in_threadpool(_in_context(lines, context)), media_type="application/x-ndjson")
+
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def metrics(request):
+    return JSONResponse({
+        "client": get_llm_metrics(),
+        "scheduler": get_scheduler().snapshot(),
+        "single_flight": dict(get_single_flight().stats)
+    })
+
+
+async def namespace_info(request):
+    namespace = await run_in_threadpool(registry.get, request.path_params["namespace"])
+    return JSONResponse(dict(namespace.metadata, loaded=True))
+
+
+async def ingest(request):
+    name = request.path_params["namespace"]
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        files = [(upload.filename, await upload.read()) for upload in form.getlist("files")]
+        options = {k: v for k, v in form.items() if k != "files"}
+    else:
+        options = await _json_body(request)
+        # Inline documents are plain text, whatever their name
+        files = [(os.path.splitext(doc.get("file_name") or f"document_{i}")[0] + ".txt",
+                  doc.get("text", "").encode("utf-8"))
+                 for i, doc in enumerate(options.get("documents", []))]
+    if not files:
+        raise APIError(400, "No documents to ingest")
+    chunk_size = _int_option(options, "chunk_size", DEFAULT_CHUNK_SIZE, *API_CHUNK_SIZE_RANGE)
+    with request_context("ingestion", _session(request)):
+        result = await run_in_threadpool(
+            registry.ingest, name, files,
+            subject=options.get("subject", DEFAULT_SUBJECT),
+            language=options.get("language", DEFAULT_LANGUAGE),
+            llm_model=options.get("llm_model", DEFAULT_LLM_MODEL),
+            embed_model_name=options.get("embed_model", DEFAULT_EMBED_MODEL),
+            chunk_size=chunk_size
+        )
+    return JSONResponse(result)
+
+
+async def query(request):
+    body = await _json_body(request)
+    question = str(body.get("question", "")).strip()
+    if not question:
+        raise APIError(400, "'question' is required")
+    start_time = time.time()
+    with request_context("qa", _session(request)):
+        namespace = await run_in_threadpool(registry.get, request.path_params["namespace"])
+        language = body.get("language") or namespace.language
+        sources, chunks, info = await run_in_threadpool(namespace.answer, question, language)
+        if body.get("stream"):
+            return _stream_response(_ndjson({"sources": sources}, chunks, info, start_time), contextvars.copy_context())
+        answer = await run_in_threadpool(lambda: "".join(chunks))
+    return JSONResponse({"answer": answer, "sources": sources,
+                         "latency_s": round(time.time() - start_time, 3), **info})
+
+
+async def questions(request):
+    body = await _json_body(request)
+    topic = str(body.get("topic", "")).strip()
+    if not topic:
+        raise APIError(400, "'topic' is required")
+    num_questions = min(_int_option(body, "num_questions", 5, 1), API_MAX_QUESTIONS)
+    start_time = time.time()
+    with request_context("questions", _session(request)):
+        namespace = await run_in_threadpool(registry.get, request.path_params["namespace"])
+        language = body.get("language") or namespace.language
+        default_difficulty = "Moyen" if language == "fr" else "Medium"
+        sources, items, info = await run_in_threadpool(
+            namespace.questions, topic, body.get("question_type", "QCM"), num_questions,
+            body.get("difficulty", default_difficulty), language
+        )
+        if body.get("stream"):
+            return _stream_response(_ndjson({"sources": sources}, items, info, start_time, key="question"),
+                                    contextvars.copy_context())
+        items = await run_in_threadpool(list, items)
+    return JSONResponse({"questions": items, "sources": sources,
+                         "latency_s": round(time.time() - start_time, 3), **info})
+
+
+async def concepts(request):
+    body = await _json_body(request)
+    topic = str(body.get("topic", "")).strip()
+    start_time = time.time()
+    with request_context("concepts", _session(request)):
+        namespace = await run_in_threadpool(registry.get, request.path_params["namespace"])
+        language = body.get("language") or namespace.language
+        chunks, info = await run_in_threadpool(namespace.concepts, topic, language)
+        if body.get("stream"):
+            return _stream_response(_ndjson({"topic": topic}, chunks, info, start_time), contextvars.copy_context())
+        markdown = await run_in_threadpool(lambda: "".join(chunks))
+    return JSONResponse({"concepts": markdown, "latency_s": round(time.time() - start_time, 3), **info})
+
+
+async def api_error(request, exc):
+    return JSONResponse({"error": str(exc)}, status_code=exc.status)
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health),
+        Route("/metrics", metrics),
+        Route("/namespaces/{namespace}", namespace_info),
+        Route("/namespaces/{namespace}/ingest", ingest, methods=["POST"]),
+        Route("/namespaces/{namespace}/query", query, methods=["POST"]),
+        Route("/namespaces/{namespace}/questions", questions, methods=["POST"]),
+        Route("/namespaces/{namespace}/concepts", concepts, methods=["POST"])
+    ],
+    exception_handlers={APIError: api_error}
+)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Headless HTTP API over the teaching assistant processors")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,40 +6,36 @@ import os
 import shutil
 import streamlit as st
 from pathlib import Path
-from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.core import Settings
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # Import configuration
-from config import PERSIST_DIR, DEFAULT_LANGUAGE
+from config import PERSIST_DIR, DEFAULT_LANGUAGE, CONCEPT_MAP_ENABLED, INDEX_ARTIFACT
 from config.subjects import SUBJECT_CONFIGS_FR
 
 # Import utilities
-from utils import get_translation, init_session_state
+from utils import get_translation, init_session_state, enforce_session_budget
 
-# Import components
-from components import (
-    render_sidebar,
-    render_qa_tab,
-    render_question_generation_tab,
-    render_concepts_tab,
-    render_file_upload
-)
+# Import components (the tabs, like llama_index and openai, are only imported once an index is open,
+# so the upload page renders without loading the LLM stack)
+from components import render_sidebar, render_file_upload, render_memory_report
 
 # Import processors
-from processors import (
-    process_documents, 
-    save_index,
-    create_french_subject_engine,
-    create_english_subject_engine,
-    load_or_create_index
-)
+from processors import set_request_session
 
 
 def main():
+    # Serving nodes install the prebuilt index artifact (once per process) before its metadata is read
+    if INDEX_ARTIFACT:
+        from processors import ensure_artifact_installed
+        ensure_artifact_installed(INDEX_ARTIFACT)
+
     # Initialize session state FIRST
     init_session_state()
     
+    # LLM requests of this run are scheduled fairly against other sessions
+    script_ctx = get_script_run_ctx()
+    set_request_session(script_ctx.session_id if script_ctx else None)
+    
     # Store previous language for comparison
     if 'previous_language' not in st.session_state:
         st.session_state.previous_language = st.session_state.language
@@ -82,26 +78,12 @@ def main():
         st.info("Recreating query engine for new language..." if language == "en" else "Recréation du moteur de requête pour la nouvelle langue...")
         # We need to recreate the query engine with the new language
         try:
-            # Initialize LLM with saved settings
-            llm = OpenAI(
-                model=llm_model_name,
-                temperature=0.1,
-                max_tokens=2000
+            from processors import get_index_generation, get_shared_engine
+
+            # Reuse the open index; the engine for the new language is shared with other sessions
+            st.session_state.query_engine = get_shared_engine(
+                st.session_state.index, get_index_generation(), subject, language, llm_model_name
             )
-            
-            # Load existing index (no need to recreate it)
-            from llama_index.core import StorageContext, load_index_from_storage
-            storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-            index = load_index_from_storage(storage_context)
-            
-            # Create query engine based on the new language
-            if language == "fr":
-                query_engine = create_french_subject_engine(index, subject, llm)
-            else:
-                query_engine = create_english_subject_engine(index, subject, llm)
-            
-            # Update the query engine in session state
-            st.session_state.query_engine = query_engine
             st.session_state.previous_language = language
         except Exception as e:
             st.error(f"Error recreating query engine: {str(e)}")
@@ -146,57 +128,128 @@ def main():
     # Ensure query_engine is initialized before usage
     query_engine = None
 
+    # A prebuilt index artifact is opened directly, without ingesting documents
+    if INDEX_ARTIFACT and not st.session_state.processed_files:
+        with st.spinner(t("processing")):
+            try:
+                from llama_index.core import Settings
+                from processors import (
+                    ensure_artifact_installed,
+                    get_llm,
+                    get_embed_model,
+                    precompile_prompts,
+                    get_shared_index,
+                    get_shared_engine
+                )
+
+                metadata = ensure_artifact_installed(INDEX_ARTIFACT)
+                embed_model = get_embed_model(metadata["embed_model"])
+                llm = get_llm(llm_model_name)
+                Settings.llm = llm
+                Settings.embed_model = embed_model
+
+                # The index and engine are opened once per process and shared by all sessions
+                index = get_shared_index(metadata["generation"], embed_model)
+
+                # Build the static prompt prefixes once per process (cached afterwards)
+                precompile_prompts()
+
+                query_engine = get_shared_engine(
+                    index, metadata["generation"], subject, st.session_state.get("language", "fr"), llm_model_name
+                )
+
+                st.session_state.query_engine = query_engine
+                st.session_state.index = index
+                st.session_state.processed_files = True
+                st.session_state.current_subject = subject
+                st.session_state.show_questions_tab = True
+            except Exception as e:
+                st.error(f"Erreur lors du chargement de l'index: {str(e)}")
+
     # Process files when user clicks "OK"
     if st.button("OK"):
         with st.spinner(t("processing")):
             try:
-                # Initialize models with selected options
-                embed_model = OpenAIEmbedding(
-                    model=embed_model_name,
-                    embed_batch_size=10
-                )
-                llm = OpenAI(
-                    model=llm_model_name,
-                    temperature=0.1,
-                    max_tokens=2000
+                from llama_index.core import Settings
+                from processors import (
+                    process_documents,
+                    save_index,
+                    compute_index_version,
+                    load_index_metadata,
+                    update_index_metadata,
+                    start_concept_map_build,
+                    load_concept_map,
+                    get_llm,
+                    get_embed_model,
+                    precompile_prompts,
+                    request_context,
+                    share_index,
+                    get_shared_index,
+                    get_shared_engine
                 )
 
+                # Initialize models with selected options
+                # Both models share the pooled connections of the client layer
+                embed_model = get_embed_model(embed_model_name)
+                llm = get_llm(llm_model_name)
+
                 Settings.llm = llm
                 Settings.embed_model = embed_model
                 Settings.chunk_size = chunk_size
 
                 # Process all files in the materials folder
                 all_file_paths = st.session_state.uploaded_files
-                result = process_documents(all_file_paths, embed_model)
-
-                if not result:
-                    st.error(t("no_content"))
-                    st.stop()
-                index, valid_docs = result
-
-                # Save index and metadata
-                save_index(
-                    index=index, 
-                    embed_model_name=embed_model_name, 
-                    llm_model_name=llm_model_name,
-                    chunk_size=chunk_size,
-                    subject=subject,
-                    language=language,  # Use the current language
-                    valid_docs=valid_docs
-                )
-                st.success(f"{len(valid_docs)} documents traités avec succès !")
+                index_version = compute_index_version(all_file_paths, embed_model_name, chunk_size, Settings.chunk_overlap)
+                metadata = load_index_metadata()
 
-                # Create query engine based on language
-                current_language = st.session_state.get("language", "fr")
-                if current_language == "fr":
-                    query_engine = create_french_subject_engine(index, subject, llm)
+                if metadata and metadata.get("index_version") == index_version:
+                    # Same files, extraction, chunking and embedding model: the stored vectors are reused,
+                    # a new subject or language only changes the engine built on them
+                    generation = metadata["generation"]
+                    index = get_shared_index(generation, embed_model)
+                    update_index_metadata(subject=subject, language=language, llm_model=llm_model_name)
+                    st.success("Index existant réutilisé (mêmes documents et modèle d'embedding)." if language == "fr"
+                               else "Existing index reused (same documents and embedding model).")
                 else:
-                    query_engine = create_english_subject_engine(index, subject, llm)
-                
-                # Enhance query engine to include document source in responses
-                query_engine.include_source_metadata = True
+                    with request_context("ingestion"):
+                        result = process_documents(all_file_paths, embed_model)
+
+                    if not result:
+                        st.error(t("no_content"))
+                        st.stop()
+                    index, valid_docs = result
+
+                    # Save index and metadata
+                    generation = save_index(
+                        index=index,
+                        embed_model_name=embed_model_name,
+                        llm_model_name=llm_model_name,
+                        chunk_size=chunk_size,
+                        subject=subject,
+                        language=language,  # Use the current language
+                        valid_docs=valid_docs,
+                        index_version=index_version
+                    )
+                    st.success(f"{len(valid_docs)} documents traités avec succès !")
+
+                    # Other sessions open the new index from the shared cache instead of loading it again
+                    index = share_index(index, generation)
+
+                # Precompute the concept map in the background (again when only the subject changed);
+                # the concepts tab uses it once ready
+                if CONCEPT_MAP_ENABLED and load_concept_map(generation, subject=subject) is None:
+                    start_concept_map_build(llm, subject, generation)
+
+                # Build the static prompt prefixes once per process (cached afterwards)
+                precompile_prompts()
+
+                # Create query engine based on language
+                query_engine = get_shared_engine(
+                    index, generation, subject, st.session_state.get("language", "fr"), llm_model_name
+                )
 
                 st.session_state.query_engine = query_engine
+                st.session_state.index = index
                 st.session_state.processed_files = True
                 st.session_state.current_subject = subject
 
@@ -211,11 +264,20 @@ def main():
     if st.session_state.get('show_questions_tab', False):
         # Ensure tabs are initialized only after processing files and clicking "OK"
         if st.session_state.get('processed_files', False) and st.session_state.get('query_engine'):
-            tab1, tab2, tab3 = st.tabs([t("ask_questions"), t("generate_questions"), t("key_concepts")])
+            from components import (
+                render_qa_tab,
+                render_question_generation_tab,
+                render_concepts_tab,
+                render_bulk_qa_tab
+            )
+
+            bulk_label = "📋 Réponses en lot" if st.session_state.language == "fr" else "📋 Bulk Answers"
+            tab1, tab2, tab3, tab4 = st.tabs([t("ask_questions"), t("generate_questions"), t("key_concepts"), bulk_label])
 
+            # Each tab is a fragment: its widgets rerun only that tab, in its scheduler priority class
             with tab1:
                 # Render QA tab
-                responses = render_qa_tab(t, subject, st.session_state.query_engine, key_prefix="qa_tab_1")
+                responses = render_qa_tab(t, subject, st.session_state.query_engine, key_prefix="qa_tab_1", llm_model_name=llm_model_name)
                 # Handle responses
                 if responses:  # Ensure responses is not None
                     for response in responses:
@@ -229,7 +291,10 @@ def main():
                 render_question_generation_tab(t, subject, st.session_state.query_engine, llm_model_name)
 
             with tab3:
-                render_concepts_tab(t, subject, st.session_state.query_engine)
+                render_concepts_tab(t, subject, st.session_state.query_engine, llm_model_name)
+
+            with tab4:
+                render_bulk_qa_tab(t, subject, st.session_state.index, llm_model_name)
 
         elif (st.session_state.uploaded_files or google_drive_active) and not st.session_state.processed_files:
             st.warning("⏳ Documents téléchargés mais pas encore traités. Veuillez patienter...")
@@ -237,6 +302,10 @@ def main():
             st.info(t("upload_first"))
             st.image("https://via.placeholder.com/800x400?text=Téléchargez+des+documents+PDF%2FDOCX%2FTXT", use_column_width=True)
     
+    # Cached results are evicted once the session goes over its memory budget
+    memory_report = enforce_session_budget(session_id=script_ctx.session_id if script_ctx else None)
+    render_memory_report(memory_report)
+
     # Footer
     st.markdown("---")
     if st.session_state.language == "fr":
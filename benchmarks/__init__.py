@@ -0,0 +1,3 @@
+"""
+Performance benchmarks (run from the repository root with python -m benchmarks.<name>)
+"""
@@ -0,0 +1,168 @@
+"""
+Load test of the headless HTTP API.
+
+Usage:
+    python -m benchmarks.api_load_test --self-host [--requests 200 --concurrency 20 --stream]
+    python -m benchmarks.api_load_test --url http://127.0.0.1:8000 --namespace course1
+
+With --self-host the local OpenAI stand-in and the API are started in this
+process (in a temporary storage directory) and a sample course is ingested,
+so the test runs offline. Otherwise the namespace must already be ingested.
+Reports throughput, latency percentiles (and time to first chunk when
+streaming), errors and the API's scheduler and client metrics.
+"""
+
+import os
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+
+import httpx
+
+SAMPLE_TOPICS = [
+    ("élasticité-prix", "L'élasticité-prix mesure la sensibilité de la quantité demandée aux variations de prix."),
+    ("coût marginal", "Le coût marginal est le coût de production d'une unité supplémentaire."),
+    ("monnaie", "La monnaie sert d'intermédiaire des échanges, d'unité de compte et de réserve de valeur."),
+    ("inflation", "L'inflation est la hausse durable et généralisée du niveau des prix."),
+    ("chômage", "Le taux de chômage rapporte le nombre de chômeurs à la population active.")
+]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def self_host():
+    """Start the OpenAI stand-in and the API in this process; returns the API base URL"""
+    stub_port = _free_port()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{stub_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["API_STORAGE_DIR"] = tempfile.mkdtemp(prefix="api_load_test_")
+
+    # Imported only now so the settings pick up the environment above
+    import uvicorn
+    from benchmarks.stub_server import start_stub_server
+    from api.server import app
+
+    start_stub_server(port=stub_port, latency="lognormal:0.3,0.4", chunk_latency=0.01)
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="api-server", daemon=True).start()
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{url}/health")
+            return url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("API server did not start")
+
+
+def ingest_sample(url, namespace):
+    documents = [{"file_name": f"chapitre_{i + 1}", "text": " ".join([definition] * 20)}
+                 for i, (_, definition) in enumerate(SAMPLE_TOPICS)]
+    response = httpx.post(f"{url}/namespaces/{namespace}/ingest", json={"documents": documents}, timeout=300)
+    response.raise_for_status()
+    return response.json()
+
+
+async def run_load(url, namespace, questions, total, concurrency, stream, sessions):
+    """Send ``total`` query requests with at most ``concurrency`` in flight"""
+    latencies, first_chunks, errors = [], [], []
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=300, limits=limits) as client:
+        async def one(i):
+            body = {"question": questions[i % len(questions)], "stream": stream}
+            headers = {"X-Session-Id": f"load-{i % sessions}"}
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    if stream:
+                        async with client.stream("POST", f"/namespaces/{namespace}/query", json=body,
+                                                 headers=headers) as response:
+                            response.raise_for_status()
+                            first = None
+                            async for line in response.aiter_lines():
+                                if first is None and '"delta"' in line:
+                                    first = time.perf_counter() - start
+                            if first is not None:
+                                first_chunks.append(first)
+                    else:
+                        response = await client.post(f"/namespaces/{namespace}/query", json=body, headers=headers)
+                        response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError as e:
+                    errors.append(str(e))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        wall = time.perf_counter() - start
+        metrics = (await client.get("/metrics")).json()
+
+    def percentile(values, p):
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3) if ordered else None
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "stream": stream,
+        "errors": len(errors),
+        "wall_time_s": round(wall, 2),
+        "throughput_rps": round(total / wall, 2),
+        "mean_latency_s": round(statistics.mean(latencies), 3) if latencies else None,
+        "p50_latency_s": percentile(latencies, 0.5),
+        "p95_latency_s": percentile(latencies, 0.95),
+        "p99_latency_s": percentile(latencies, 0.99),
+        "p50_first_chunk_s": percentile(first_chunks, 0.5),
+        "p95_first_chunk_s": percentile(first_chunks, 0.95),
+        "first_errors": errors[:3],
+        "api_metrics": metrics
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the headless HTTP API")
+    parser.add_argument("--url", help="base URL of a running API")
+    parser.add_argument("--self-host", action="store_true", help="start the stand-in and the API in-process")
+    parser.add_argument("--namespace", default="loadtest")
+    parser.add_argument("--questions", help="file with one question per line")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=5, help="distinct X-Session-Id values")
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+
+    if args.self_host:
+        url = self_host()
+        print(json.dumps(ingest_sample(url, args.namespace)))
+    elif args.url:
+        url = args.url.rstrip("/")
+    else:
+        parser.error("pass --url or --self-host")
+
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        # A mix of repeated and distinct questions exercises the caches and single-flight
+        questions = [f"Qu'est-ce que {topic} ?" for topic, _ in SAMPLE_TOPICS]
+        questions += [f"Expliquez {topic} avec un exemple ({i})" for i in range(10) for topic, _ in SAMPLE_TOPICS]
+
+    summary = asyncio.run(run_load(url, args.namespace, questions, args.requests, args.concurrency,
+                                   args.stream, args.sessions))
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
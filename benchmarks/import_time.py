@@ -0,0 +1,119 @@
+"""
+Cold-start profile: import times (python -X importtime) and the first page render.
+
+Usage:
+    python -m benchmarks.import_time [--modules app processors.llm_client] [--top 15] [--render] [--repeat 3]
+
+For each module a fresh interpreter imports it with -X importtime; the
+report gives its cumulative import time, the heaviest imported packages and
+whether the LLM stack (llama_index, openai, ...) was loaded. --render also
+runs the first script run of app.py (the upload page, no index) with
+Streamlit's AppTest. Each measurement keeps the fastest of --repeat runs.
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages the upload page should not need
+HEAVY_PACKAGES = ["llama_index", "openai", "tiktoken", "httpx", "numpy", "fitz", "pdfminer", "docx", "sqlalchemy"]
+
+_RENDER_SCRIPT = """
+import sys, json, time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+elapsed = time.perf_counter() - start
+print(json.dumps({"render_ms": round(elapsed * 1000, 1), "exceptions": [e.value for e in at.exception],
+                  "loaded": sorted(p for p in sys.argv[2:] if p in sys.modules)}))
+"""
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    return env
+
+
+def parse_importtime(stderr):
+    """Parse -X importtime output into (name, depth, self_us, cumulative_us) rows"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def profile_import(module, cwd):
+    """Import ``module`` in a fresh interpreter; returns the parsed import rows"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=_env(), capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr)
+
+
+def summarize(module, rows, top):
+    total = next((cumulative for name, depth, _, cumulative in rows if name == module and depth == 0), None)
+    packages = {}
+    for name, _, self_us, _ in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    loaded = {name.split(".")[0] for name, _, _, _ in rows}
+    return {
+        "module": module,
+        "import_ms": round(total / 1000, 1) if total is not None else None,
+        "modules_imported": len(rows),
+        "heavy_loaded": [p for p in HEAVY_PACKAGES if p in loaded],
+        "heaviest_packages_ms": {package: round(us / 1000, 1) for package, us in heaviest}
+    }
+
+
+def render_upload_page(cwd):
+    """First script run of app.py with no index: time and heavy packages loaded"""
+    completed = subprocess.run(
+        [sys.executable, "-c", _RENDER_SCRIPT, os.path.join(ROOT, "app.py")] + HEAVY_PACKAGES,
+        cwd=cwd, env=_env(), capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"render failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile import time and the first page render")
+    parser.add_argument("--modules", nargs="+", default=["app", "processors", "processors.llm_client", "api.server"])
+    parser.add_argument("--top", type=int, default=10, help="heaviest packages listed per module")
+    parser.add_argument("--render", action="store_true", help="also time the first render of the upload page")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # An empty working directory: no ./storage or ./materials, like a fresh worker
+    with tempfile.TemporaryDirectory() as cwd:
+        report = []
+        for module in args.modules:
+            runs = [summarize(module, profile_import(module, cwd), args.top) for _ in range(args.repeat)]
+            report.append(min(runs, key=lambda run: run["import_ms"] or 0))
+        if args.render:
+            runs = [render_upload_page(cwd) for _ in range(args.repeat)]
+            report.append(dict(min(runs, key=lambda run: run["render_ms"]), module="app (upload page render)"))
+        created = sorted(os.listdir(cwd))
+
+    for entry in report:
+        print(json.dumps(entry, ensure_ascii=False))
+    print(json.dumps({"files_created_in_cwd": created}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Compare LLM input tokens, latency and answer quality with and without reranking
+and extractive context compression.
+
+Usage:
+    python -m benchmarks.rerank_benchmark --questions questions.jsonl [--subject economics --language en]
+
+The questions file holds one question per line, or JSON lines with a
+"question" field and an optional "reference" answer. When references are
+given, answer quality is reported as token-level F1 against them.
+"""
+
+import re
+import json
+import time
+import argparse
+import statistics
+from collections import Counter
+
+from llama_index.core import Settings, StorageContext, load_index_from_storage
+
+from config.settings import PERSIST_DIR, RERANK_CROSS_ENCODER_PATH
+from processors.indexing import create_french_subject_engine, create_english_subject_engine
+from processors.synthesis import get_synthesis_stats
+from processors.compression import QuestionQuery, get_compression_stats
+from processors.llm_client import get_llm, get_embed_model
+
+
+def load_questions(path):
+    """Read questions (and optional reference answers) from a text or JSONL file"""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                questions.append((item["question"], item.get("reference")))
+            else:
+                questions.append((line, None))
+    return questions
+
+
+def token_f1(prediction, reference):
+    """Token-level F1 between an answer and a reference answer"""
+    pred_tokens = re.findall(r"\w+", prediction.lower())
+    ref_tokens = re.findall(r"\w+", reference.lower())
+    common = sum((Counter(pred_tokens) & Counter(ref_tokens)).values())
+    if not common:
+        return 0.0
+    precision = common / len(pred_tokens)
+    recall = common / len(ref_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def run_config(name, engine, questions):
+    """Run every question through one engine configuration and aggregate the results"""
+    latencies, input_tokens, node_counts, scores, ratios = [], [], [], [], []
+    for question, reference in questions:
+        start = time.time()
+        response = engine.query(QuestionQuery(query_str=question))
+        latencies.append(time.time() - start)
+
+        compression = get_compression_stats(response.source_nodes)
+        ratios.append(compression["ratio"] if compression else 1.0)
+
+        stats = get_synthesis_stats(response) or {}
+        input_tokens.append(stats.get("input_tokens", 0))
+        node_counts.append(len(response.source_nodes))
+        if reference:
+            scores.append(token_f1(str(response), reference))
+
+    return {
+        "config": name,
+        "questions": len(questions),
+        "mean_latency_s": round(statistics.mean(latencies), 3),
+        "p95_latency_s": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))], 3),
+        "mean_input_tokens": round(statistics.mean(input_tokens), 1),
+        "mean_nodes": round(statistics.mean(node_counts), 2),
+        "mean_compression_ratio": round(statistics.mean(ratios), 3),
+        "mean_f1": round(statistics.mean(scores), 3) if scores else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", required=True)
+    parser.add_argument("--subject", default="économie")
+    parser.add_argument("--language", default="fr", choices=["fr", "en"])
+    parser.add_argument("--llm-model", default="gpt-4o-mini")
+    parser.add_argument("--persist-dir", default=PERSIST_DIR)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with open(f"{args.persist_dir}/metadata.json", "r") as f:
+        metadata = json.load(f)
+    Settings.embed_model = get_embed_model(metadata.get("embed_model", "text-embedding-3-small"))
+    llm = get_llm(args.llm_model)
+
+    storage_context = StorageContext.from_defaults(persist_dir=args.persist_dir)
+    index = load_index_from_storage(storage_context)
+    create_engine = create_french_subject_engine if args.language == "fr" else create_english_subject_engine
+
+    # (name, rerank mode, compression)
+    configs = [
+        ("baseline (top-6)", None, False),
+        ("mmr", "mmr", False),
+        ("mmr + compression", "mmr", True)
+    ]
+    if RERANK_CROSS_ENCODER_PATH:
+        configs.append(("cross_encoder + compression", "cross_encoder", True))
+
+    questions = load_questions(args.questions)
+    results = []
+    for name, mode, compress in configs:
+        engine = create_engine(index, args.subject, llm, streaming=False, rerank_mode=mode, compress=compress)
+        results.append(run_config(name, engine, questions))
+
+    header = ["config", "mean_latency_s", "p95_latency_s", "mean_input_tokens", "mean_nodes", "mean_compression_ratio", "mean_f1"]
+    print(" | ".join(header))
+    for row in results:
+        print(" | ".join(str(row[col]) for col in header))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
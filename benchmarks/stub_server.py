@@ -0,0 +1,411 @@
+"""
+Local OpenAI-compatible stand-in server for offline performance testing.
+
+Usage:
+    python -m benchmarks.stub_server [--port 8010] [--latency lognormal:0.4,0.5] [--rpm 60]
+    OPENAI_BASE_URL=http://127.0.0.1:8010/v1 OPENAI_API_KEY=stub streamlit run app.py
+
+It implements the chat completions (plain and streamed) and embeddings
+endpoints used by the app. Outputs are deterministic functions of the
+request: question prompts get blocks in the requested format, concept
+prompts get "name | definition | importance" lines, other prompts an answer
+quoted from the provided context, and embeddings are hashed bags of words
+(similar texts get similar vectors). Token usage is counted with the app's
+tokenizer and repeated prompt prefixes are reported as cached tokens.
+
+Latency specs are "fixed:S", "uniform:MIN,MAX", "normal:MEAN,SD" or
+"lognormal:MEDIAN,SIGMA" (seconds). --rpm/--tpm return 429 errors with a
+Retry-After header once exceeded, --error-rate injects random 429s.
+"""
+
+import re
+import json
+import math
+import time
+import zlib
+import base64
+import random
+import struct
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from processors.token_budget import get_encoding
+
+DEFAULT_OPTIONS = {
+    "latency": "fixed:0.05",  # time to the first byte of a chat completion
+    "embed_latency": "fixed:0.01",
+    "chunk_latency": 0.005,  # between streamed chunks
+    "slow_rate": 0.0,  # share of chat requests hit by a latency spike
+    "slow_latency": 2.0,
+    "rpm": 0,  # 0 disables the limit
+    "tpm": 0,
+    "error_rate": 0.0,  # share of requests answered with a 429
+    "embed_dim": 1536,
+    "seed": 0
+}
+
+CACHE_MIN_TOKENS = 1024  # OpenAI caches prompt prefixes from 1024 tokens, in 128-token steps
+CACHE_STEP = 128
+CACHE_MAX_PREFIXES = 50000
+
+
+def parse_latency(spec):
+    """Return a sampler ``rng -> seconds`` for a latency spec"""
+    name, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if name == "fixed":
+        return lambda rng: values[0]
+    if name == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if name == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if name == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _request_rng(body):
+    """Random generator seeded by the request, so equal requests get equal outputs"""
+    payload = json.dumps({k: body.get(k) for k in ("model", "messages", "input")}, sort_keys=True)
+    return random.Random(int(hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16], 16))
+
+
+def _sentences(text):
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", text) if len(s.strip()) > 20]
+
+
+def _terms(text, limit):
+    """Candidate concept names: the most frequent long words of the text"""
+    counts = {}
+    for word in re.findall(r"[^\W\d_]{7,}", text):
+        key = word.lower()
+        counts[key] = counts.get(key, 0) + 1
+    ranked = sorted(counts, key=lambda w: (-counts[w], w))
+    return [w.capitalize() for w in ranked[:limit]]
+
+
+def _question_text(system, user, rng):
+    """Question blocks following the format spelled out in the system prefix"""
+    match = re.search(r"(?:Générez|Generate)\s+(\d+)", user)
+    count = int(match.group(1)) if match else 1
+    template = system[system.index("\n", system.index("EXACT")) + 1:].strip()
+    # The request line and "base your questions on this content:" come before the content
+    sentences = _sentences(re.split(r":\s*\n", user, 1)[-1]) or [user.strip() or "..."]
+    truth = ("Vrai", "Faux") if "Vrai/Faux" in template else ("True", "False")
+    blocks = []
+    for n in range(1, count + 1):
+        def fill(match):
+            placeholder = match.group(1).lower()
+            if placeholder in ("n", "q"):
+                return str(n)
+            if "lettre" in placeholder or "letter" in placeholder:
+                return rng.choice("ABCD")
+            return rng.choice(sentences)[:200]
+        block = re.sub(r"\[([^\]]+)\]", fill, template)
+        blocks.append(re.sub(r"(Vrai/Faux|True/False)\s*$", rng.choice(truth), block, flags=re.M))
+    return "\n\n".join(blocks)
+
+
+def _concept_text(prompt, rng):
+    """'name | definition | importance' lines built from the excerpt"""
+    match = re.search(r"(?:au plus|at most|gardez les|keep the)\s+(\d+)", prompt)
+    limit = int(match.group(1)) if match else 8
+    body = re.split(r"\n(?:Extrait|Excerpt|Concepts)\s*:\n", prompt)[-1]
+    candidates = [line.strip() for line in body.splitlines() if line.count("|") >= 2]
+    if candidates:
+        # Reduce step: keep the first candidates, as a consolidation would
+        return "\n".join(candidates[:limit])
+    sentences = _sentences(body)
+    lines = []
+    for term in _terms(body, limit):
+        definition = next((s for s in sentences if term.lower() in s.lower()), term)
+        lines.append(f"{term} | {definition[:160]} | {rng.randint(1, 5)}")
+    return "\n".join(lines)
+
+
+def _answer_text(user, rng):
+    """A short answer quoting the context sentences that share most words with the question"""
+    question_words = set(re.findall(r"\w{4,}", user.lower()[-500:]))
+    sentences = _sentences(user)
+    if not sentences:
+        return "Ce sujet n'est pas couvert dans les documents fournis."
+    ranked = sorted(sentences, key=lambda s: (-len(question_words & set(re.findall(r"\w{4,}", s.lower()))),
+                                              rng.random()))
+    return "\n".join(f"- **{s.split()[0]}** {' '.join(s.split()[1:])}" for s in ranked[:3])
+
+
+def completion_text(messages, rng):
+    """Deterministic completion for a chat request"""
+    system = "\n".join(_content(m) for m in messages if m.get("role") == "system")
+    user = "\n".join(_content(m) for m in messages if m.get("role") != "system")
+    if "EXACT" in system and "[Q]" in system:
+        return _question_text(system, user, rng)
+    if "| Importance" in user or "| Importance" in system:
+        return _concept_text(user or system, rng)
+    return _answer_text(user or system, rng)
+
+
+def _content(message):
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def embed_text(text, dim):
+    """Hashed bag of words and word bigrams, L2-normalized"""
+    vector = [0.0] * dim
+    words = re.findall(r"\w+", text.lower())
+    for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, **options):
+        super().__init__(address, _Handler)
+        self.options = dict(DEFAULT_OPTIONS, **options)
+        self.latency = parse_latency(self.options["latency"])
+        self.embed_latency = parse_latency(self.options["embed_latency"])
+        self.lock = threading.Lock()
+        self.rng = random.Random(self.options["seed"])
+        self.window = deque()  # (time, tokens) of the requests of the last minute
+        self.prefixes = OrderedDict()
+        self.stats = {"chat": 0, "stream": 0, "embeddings": 0, "rate_limited": 0,
+                      "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def sample(self, sampler, slow=False):
+        with self.lock:
+            delay = sampler(self.rng)
+            if slow and self.rng.random() < self.options["slow_rate"]:
+                delay += self.options["slow_latency"]
+            return delay
+
+    def admit(self, tokens):
+        """Return None when the request fits the limits, else the seconds to wait"""
+        now = time.monotonic()
+        with self.lock:
+            while self.window and now - self.window[0][0] >= 60:
+                self.window.popleft()
+            limited = self.rng.random() < self.options["error_rate"]
+            if self.options["rpm"] and len(self.window) >= self.options["rpm"]:
+                limited = True
+            if self.options["tpm"] and sum(t for _, t in self.window) + tokens > self.options["tpm"]:
+                limited = True
+            if limited:
+                self.stats["rate_limited"] += 1
+                return max(1.0, 60 - (now - self.window[0][0])) if self.window else 1.0
+            self.window.append((now, tokens))
+            return None
+
+    def cached_tokens(self, tokens):
+        """Length of the longest previously seen prompt prefix (OpenAI prompt caching rules)"""
+        cached = 0
+        with self.lock:
+            for length in range(CACHE_MIN_TOKENS, len(tokens) + 1, CACHE_STEP):
+                key = hashlib.sha1(struct.pack(f"{length}I", *tokens[:length])).digest()
+                if key in self.prefixes:
+                    cached = length
+                    self.prefixes.move_to_end(key)
+                else:
+                    self.prefixes[key] = True
+            while len(self.prefixes) > CACHE_MAX_PREFIXES:
+                self.prefixes.popitem(last=False)
+        return cached
+
+    def count(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client connection pooling can be measured
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _rate_limited(self, retry_after):
+        self._send_json(429, {"error": {
+            "message": "Rate limit reached (local stub)",
+            "type": "requests",
+            "code": "rate_limit_exceeded"
+        }}, {"Retry-After": f"{retry_after:.0f}"})
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/models"):
+            self._send_json(200, {"object": "list", "data": []})
+        elif path.endswith("/stats"):
+            with self.server.lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            self._chat(body)
+        elif path.endswith("/embeddings"):
+            self._embeddings(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _chat(self, body):
+        server = self.server
+        model = body.get("model", "gpt-3.5-turbo")
+        encoding = get_encoding(model)
+        messages = body.get("messages", [])
+        prompt_ids = []
+        for message in messages:
+            prompt_ids.extend(encoding.encode(_content(message), disallowed_special=()))
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+
+        retry_after = server.admit(len(prompt_ids) + (max_tokens or 0))
+        if retry_after is not None:
+            return self._rate_limited(retry_after)
+        time.sleep(server.sample(server.latency, slow=True))
+
+        output_ids = encoding.encode(completion_text(messages, _request_rng(body)), disallowed_special=())
+        finish_reason = "stop"
+        if max_tokens and len(output_ids) > max_tokens:
+            output_ids, finish_reason = output_ids[:max_tokens], "length"
+        text = encoding.decode(output_ids)
+        cached = server.cached_tokens(prompt_ids)
+        usage = {
+            "prompt_tokens": len(prompt_ids),
+            "completion_tokens": len(output_ids),
+            "total_tokens": len(prompt_ids) + len(output_ids),
+            "prompt_tokens_details": {"cached_tokens": cached}
+        }
+        server.count(chat=1, prompt_tokens=len(prompt_ids), cached_tokens=cached, completion_tokens=len(output_ids))
+        completion_id = "chatcmpl-stub-" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        created = int(time.time())
+
+        if not body.get("stream"):
+            return self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": finish_reason}],
+                "usage": usage
+            })
+
+        server.count(stream=1)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(payload):
+            line = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+
+        def chunk(delta, finish=None, chunk_usage=None):
+            choices = [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish}]
+            return json.dumps({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                               "model": model, "choices": choices, "usage": chunk_usage})
+
+        send(chunk({"role": "assistant", "content": ""}))
+        pieces = re.findall(r"\S+\s*|\s+", text)
+        for start in range(0, len(pieces), 3):
+            time.sleep(server.options["chunk_latency"])
+            send(chunk({"content": "".join(pieces[start:start + 3])}))
+        send(chunk({}, finish=finish_reason))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send(chunk(None, chunk_usage=usage))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _embeddings(self, body):
+        server = self.server
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        encoding = get_encoding(None)
+        texts = [text if isinstance(text, str) else encoding.decode(text) for text in inputs]
+        tokens = sum(len(encoding.encode(text, disallowed_special=())) for text in texts)
+
+        retry_after = server.admit(tokens)
+        if retry_after is not None:
+            return self._rate_limited(retry_after)
+        time.sleep(server.sample(server.embed_latency))
+
+        dim = body.get("dimensions") or server.options["embed_dim"]
+        data = []
+        for i, text in enumerate(texts):
+            vector = embed_text(text, dim)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{dim}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        server.count(embeddings=1, prompt_tokens=tokens)
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-ada-002"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+
+def start_stub_server(host="127.0.0.1", port=0, **options):
+    """Start the stub in a background thread; point OPENAI_BASE_URL at ``server.base_url``"""
+    server = StubServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="openai-stub", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", default=DEFAULT_OPTIONS["latency"], help="chat time to first byte")
+    parser.add_argument("--embed-latency", default=DEFAULT_OPTIONS["embed_latency"])
+    parser.add_argument("--chunk-latency", type=float, default=DEFAULT_OPTIONS["chunk_latency"])
+    parser.add_argument("--slow-rate", type=float, default=DEFAULT_OPTIONS["slow_rate"])
+    parser.add_argument("--slow-latency", type=float, default=DEFAULT_OPTIONS["slow_latency"])
+    parser.add_argument("--rpm", type=int, default=DEFAULT_OPTIONS["rpm"])
+    parser.add_argument("--tpm", type=int, default=DEFAULT_OPTIONS["tpm"])
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_OPTIONS["error_rate"])
+    parser.add_argument("--embed-dim", type=int, default=DEFAULT_OPTIONS["embed_dim"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_OPTIONS["seed"])
+    args = vars(parser.parse_args())
+
+    host, port = args.pop("host"), args.pop("port")
+    server = StubServer((host, port), **args)
+    print(f"OpenAI stub listening: OPENAI_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
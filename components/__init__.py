@@ -1,10 +1,29 @@
 """
 Export all UI components
+
+The tabs import the whole LLM stack, so each component module is only
+imported when one of its functions is first used.
 """
 
-from .sidebar import render_sidebar, handle_google_drive_integration
-from .qa_tab import render_qa_tab
-from .question_tab import render_question_generation_tab
-from .concepts_tab import render_concepts_tab
-from .file_upload import render_file_upload
+import importlib
+
+_EXPORTS = {
+    "render_sidebar": "sidebar",
+    "handle_google_drive_integration": "sidebar",
+    "render_memory_report": "sidebar",
+    "render_qa_tab": "qa_tab",
+    "render_question_generation_tab": "question_tab",
+    "render_concepts_tab": "concepts_tab",
+    "render_bulk_qa_tab": "bulk_qa_tab",
+    "render_file_upload": "file_upload"
+}
+
+__all__ = list(_EXPORTS)
+
 
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,82 @@
+"""
+Bulk question answering tab component
+"""
+
+import streamlit as st
+from llama_index.core import Settings
+from config.settings import BULK_QA_EMBED_BATCH_SIZE, BULK_QA_MAX_QUESTIONS
+from processors.bulk_qa import load_questions, answer_questions, format_results
+from processors.document_processor import get_index_generation
+from processors.llm_client import get_llm, get_embed_model
+from utils.reruns import tab_fragment
+
+
+@tab_fragment("bulk")
+def render_bulk_qa_tab(t, subject, index, llm_model_name):
+    """Render the bulk question answering tab"""
+    language = st.session_state.get("language", "fr")
+    st.header("📋 Réponses en lot" if language == "fr" else "📋 Bulk Answers")
+    st.caption(
+        "Importez un fichier CSV (colonne « question »), JSONL ou texte (une question par ligne)."
+        if language == "fr" else
+        'Upload a CSV ("question" column), JSONL or text file (one question per line).'
+    )
+
+    uploaded = st.file_uploader(
+        "Questions",
+        type=["csv", "jsonl", "txt"],
+        key="bulk_qa_file"
+    )
+    if uploaded is None:
+        return
+
+    questions = load_questions(uploaded.getvalue(), uploaded.name)
+    if len(questions) > BULK_QA_MAX_QUESTIONS:
+        st.warning(
+            f"Seules les {BULK_QA_MAX_QUESTIONS} premières questions seront traitées."
+            if language == "fr" else
+            f"Only the first {BULK_QA_MAX_QUESTIONS} questions will be processed."
+        )
+        questions = questions[:BULK_QA_MAX_QUESTIONS]
+    st.write(f"{len(questions)} questions")
+
+    if st.button("Répondre à toutes les questions" if language == "fr" else "Answer all questions", key="bulk_qa_run"):
+        progress = st.progress(0.0)
+
+        def on_result(done, total, row):
+            progress.progress(done / total, text=f"{done}/{total}")
+
+        with st.spinner(t("processing")):
+            rows, summary = answer_questions(
+                index, questions, subject, language,
+                llm=get_llm(llm_model_name),
+                embed_model=get_embed_model(Settings.embed_model.model_name, embed_batch_size=BULK_QA_EMBED_BATCH_SIZE),
+                generation=get_index_generation(),
+                on_result=on_result
+            )
+        st.session_state.bulk_qa_results = (rows, summary)
+
+    if st.session_state.get("bulk_qa_results"):
+        rows, summary = st.session_state.bulk_qa_results
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Questions", summary["questions"])
+        col2.metric("Débit (q/s)" if language == "fr" else "Throughput (q/s)", summary["throughput_qps"])
+        col3.metric("Latence p95 (s)" if language == "fr" else "p95 latency (s)", summary["p95_latency_s"])
+        col4.metric("Échecs" if language == "fr" else "Failed", summary["failed"])
+        st.dataframe(rows, use_container_width=True)
+        with st.expander("Résumé" if language == "fr" else "Summary"):
+            st.json(summary)
+
+        col1, col2 = st.columns(2)
+        col1.download_button(
+            label=f"{t('download')} CSV",
+            data=format_results(rows, "csv"),
+            file_name="answers.csv",
+            mime="text/csv"
+        )
+        col2.download_button(
+            label=f"{t('download')} JSONL",
+            data=format_results(rows, "jsonl"),
+            file_name="answers.jsonl",
+            mime="application/json"
+        )
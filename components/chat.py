@@ -0,0 +1,67 @@
+"""
+Chat mode of the question answering tab
+"""
+
+import time
+import streamlit as st
+from llama_index.core import Settings
+from processors.chat import ChatMemory, start_chat_turn, finish_chat_turn
+from processors.document_processor import get_index_generation
+from utils.streaming import TimedStream, iter_response_text, format_timing_caption, format_chat_usage
+
+
+def render_chat(t, subject, query_engine, language, llm_model_name, key_prefix="qa_tab"):
+    """Render a multi-turn conversation; follow-ups are condensed into standalone questions"""
+    # A new index, subject, language or model starts a new conversation
+    scope = (get_index_generation(), subject, language, llm_model_name)
+    memory = st.session_state.get("chat_memory")
+    if memory is None or memory.scope != scope:
+        memory = st.session_state.chat_memory = ChatMemory(scope)
+
+    if memory.turns and st.button("🗑️ Nouvelle conversation" if language == "fr" else "🗑️ New conversation",
+                                  key=f"{key_prefix}_chat_reset"):
+        memory = st.session_state.chat_memory = ChatMemory(scope)
+
+    if memory.summary:
+        with st.expander("Résumé des échanges précédents" if language == "fr" else "Summary of earlier turns"):
+            st.write(memory.summary)
+    for turn in memory.turns:
+        with st.chat_message("user"):
+            st.write(turn["user"])
+        with st.chat_message("assistant"):
+            st.write(turn["assistant"])
+            if turn.get("caption"):
+                st.caption(turn["caption"])
+
+    question = st.chat_input(
+        "Posez votre question..." if language == "fr" else "Ask your question...",
+        key=f"{key_prefix}_chat_input"
+    )
+    if not question:
+        return
+
+    with st.chat_message("user"):
+        st.write(question)
+    with st.chat_message("assistant"):
+        try:
+            start_time = time.time()
+            with st.spinner(t("processing")):
+                response, usage = start_chat_turn(memory, question, query_engine, Settings.embed_model,
+                                                  llm_model_name, language)
+            stream = TimedStream(iter_response_text(response), start_time=start_time)
+            answer_text = st.write_stream(stream)
+            usage = finish_chat_turn(memory, question, answer_text, usage, llm_model_name, language)
+
+            source_nodes = getattr(response, "source_nodes", None) or []
+            files = list(dict.fromkeys(node.node.metadata.get("file_name", "?") for node in source_nodes))
+            if files:
+                st.caption(f"📄 {t('sources')}: " + ", ".join(files))
+            if usage["standalone_question"] != question:
+                st.caption(("Question reformulée : " if language == "fr" else "Standalone question: ")
+                           + usage["standalone_question"])
+            caption = format_timing_caption(language, time.time() - start_time, stream.time_to_first_token,
+                                            format_chat_usage(language, usage))
+            st.caption(caption)
+            memory.turns[-1]["caption"] = caption
+        except Exception as e:
+            st.error(f"{'Erreur:' if language == 'fr' else 'Error:'} {str(e)}")
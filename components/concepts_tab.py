@@ -2,11 +2,35 @@
 Key concepts tab component
 """
 
+import time
 import streamlit as st
+from config.subjects_en import SUBJECT_NAMES_EN
 from processors.concept_extractor import get_concept_extraction_prompt
+from processors.concept_map import (
+    load_concept_map,
+    get_concept_map_status,
+    find_concepts,
+    render_concepts
+)
+from processors.concept_mapreduce import ConceptMapReducer
+from processors.document_processor import get_index_generation
+from processors.llm_client import get_llm
+from processors.prompts import get_subject_system_prompt
+from processors.single_flight import get_single_flight, request_fingerprint
+from processors.synthesis import get_synthesis_stats
+from utils.streaming import (
+    TimedStream,
+    iter_response_text,
+    format_timing_caption,
+    format_synthesis_stats,
+    format_concept_map_stats,
+    format_memo_note
+)
+from utils.reruns import tab_fragment, memo_get, memo_put
 
 
-def render_concepts_tab(t, subject, query_engine):
+@tab_fragment("concepts")
+def render_concepts_tab(t, subject, query_engine, llm_model_name=None):
     """Render the key concepts tab"""
     st.header(t("key_concepts"))
     
@@ -15,18 +39,7 @@ def render_concepts_tab(t, subject, query_engine):
     
     # Map subject name if language is English
     if language == "en":
-        subject_map = {
-            "économie": "economics",
-            "marketing": "marketing",
-            "finance": "finance",
-            "comptabilité": "accounting",
-            "gestion": "management",
-            "entrepreneuriat": "entrepreneurship",
-            "droit": "law",
-            "informatique": "computer_science",
-            "management": "management"
-        }
-        current_subject = subject_map.get(subject.lower(), subject)
+        current_subject = SUBJECT_NAMES_EN.get(subject.lower(), subject)
     else:
         current_subject = subject
     
@@ -53,28 +66,97 @@ def render_concepts_tab(t, subject, query_engine):
         key="concept_topic"
     )
     
-    if st.button(t("extract_button"), key="extract_concepts"):
+    generation = get_index_generation()
+    concept_map = load_concept_map(generation, subject=subject)
+    build_status = get_concept_map_status(generation, subject)
+    if concept_map is None and build_status and build_status["state"] == "running":
+        st.info("La carte des concepts est en cours de construction ; l'extraction utilise le LLM en attendant." if language == "fr"
+                else "The concept map is being built; extraction uses the LLM in the meantime.")
+    
+    # Results stay on screen across reruns with unchanged inputs, without extracting again
+    memo_key = request_fingerprint(
+        kind="concepts",
+        topic=concept_topic.lower().strip(),
+        subject=current_subject,
+        language=language,
+        model=llm_model_name,
+        generation=generation,
+        concept_map=concept_map is not None
+    )
+    memoized = memo_get(memo_key)
+    clicked = st.button(t("extract_button"), key="extract_concepts")
+    
+    if memoized is not None:
+        st.markdown("### 📌 " + ("Concepts clés" if language == "fr" else "Key Concepts"))
+        st.markdown(memoized["markdown"])
+        st.caption(memoized["caption"] + format_memo_note(language))
+        _download_concepts(t, language, current_subject, memoized["markdown"])
+    elif clicked:
         with st.spinner("Identification des concepts clés..." if language == "fr" else "Identifying key concepts..."):
             try:
-                # Get extraction prompt based on topic and language
-                prompt = get_concept_extraction_prompt(concept_topic, current_subject, language)
+                start_time = time.time()
                 
-                # Query the engine
-                response = query_engine.query(prompt)
-                concepts = str(response)
-                
-                # Display results
                 st.markdown("### 📌 " + ("Concepts clés" if language == "fr" else "Key Concepts"))
-                st.markdown(concepts)
+                mapped = None
+                if concept_map is not None:
+                    if not concept_topic:
+                        mapped = concept_map["languages"][language]["markdown"]
+                    else:
+                        matches = find_concepts(concept_map, language, concept_topic)
+                        mapped = render_concepts(matches, current_subject, concept_topic, language) if matches else None
+                
+                if mapped:
+                    # Rendered from the concept map precomputed after ingestion, no LLM call
+                    stream = TimedStream(iter([mapped]), start_time=start_time)
+                    concepts = st.write_stream(stream)
+                    stats_note = " | carte des concepts précalculée" if language == "fr" else " | precomputed concept map"
+                elif concept_topic or not llm_model_name:
+                    # Get extraction prompt based on topic and language
+                    prompt = get_concept_extraction_prompt(concept_topic, current_subject, language)
+                    
+                    def start_query():
+                        response = query_engine.query(prompt)
+                        return response, iter_response_text(response)
+                    
+                    # Identical extractions running at the same time share one upstream call
+                    flight_key = request_fingerprint(
+                        kind="concepts",
+                        prompt=prompt,
+                        system_prompt=get_subject_system_prompt(current_subject, language),
+                        model=llm_model_name,
+                        generation=generation
+                    )
+                    flight, _ = get_single_flight().stream(flight_key, start_query)
+                    response = flight.result()
+                    stream = TimedStream(iter(flight), start_time=start_time)
+                    concepts = st.write_stream(stream)
+                    stats_note = format_synthesis_stats(language, get_synthesis_stats(response))
+                else:
+                    # The whole document does not fit in the top retrieved chunks: map-reduce over every section
+                    llm = get_llm(llm_model_name)
+                    extractor = ConceptMapReducer(llm, current_subject, language)
+                    stream = TimedStream(extractor.stream(), start_time=start_time)
+                    concepts = st.write_stream(stream)
+                    stats_note = format_concept_map_stats(language, extractor.stats)
                 
-                # Download button
-                file_name = f"{'concepts_cles' if language == 'fr' else 'key_concepts'}_{current_subject}.md"
-                st.download_button(
-                    label=t("download"),
-                    data=concepts,
-                    file_name=file_name,
-                    mime="text/markdown"
-                )
+                # Timing and cost of the extraction
+                caption = format_timing_caption(language, stream.total_time, stream.time_to_first_token, stats_note)
+                st.caption(caption)
+                
+                _download_concepts(t, language, current_subject, concepts)
+                memo_put(memo_key, {"markdown": concepts, "caption": caption})
             
             except Exception as e:
-                st.error(f"{'Erreur lors de l\'extraction des concepts:' if language == 'fr' else 'Error extracting concepts:'} {str(e)}")
+                error_label = "Erreur lors de l'extraction des concepts:" if language == "fr" else "Error extracting concepts:"
+                st.error(f"{error_label} {str(e)}")
+
+
+def _download_concepts(t, language, current_subject, concepts):
+    """Download button for the extracted concepts"""
+    file_name = f"{'concepts_cles' if language == 'fr' else 'key_concepts'}_{current_subject}.md"
+    st.download_button(
+        label=t("download"),
+        data=concepts,
+        file_name=file_name,
+        mime="text/markdown"
+    )
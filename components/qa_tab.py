@@ -4,36 +4,48 @@ Question answering tab component
 
 import time
 import streamlit as st
+from llama_index.core import Settings
 from config.subjects import SUBJECT_CONFIGS_FR
-from config.subjects_en import SUBJECT_CONFIGS_EN
+from config.subjects_en import SUBJECT_CONFIGS_EN, SUBJECT_NAMES_EN
+from processors.answer_cache import get_answer_cache, normalize_question
+from processors.document_processor import get_index_generation
+from processors.synthesis import get_synthesis_stats
+from processors.compression import QuestionQuery, get_compression_stats
+from processors.prompts import get_subject_system_prompt
+from processors.single_flight import get_single_flight, request_fingerprint
+from utils.streaming import (
+    TimedStream,
+    iter_response_text,
+    format_timing_caption,
+    format_synthesis_stats,
+    format_compression_stats,
+    format_memo_note
+)
+from utils.reruns import tab_fragment, memo_get, memo_put
+from components.chat import render_chat
 
 
-def render_qa_tab(t, subject, query_engine, key_prefix="qa_tab"):
+@tab_fragment("qa")
+def render_qa_tab(t, subject, query_engine, key_prefix="qa_tab", llm_model_name=None):
     """Render the question answering tab"""
     # Get current language from session state (with default to prevent errors)
     language = st.session_state.get("language", "fr")
     
     # Map subject name if language is English
     if language == "en":
-        subject_map = {
-            "économie": "economics",
-            "marketing": "marketing",
-            "finance": "finance",
-            "comptabilité": "accounting",
-            "gestion": "management",
-            "entrepreneuriat": "entrepreneurship",
-            "droit": "law",
-            "informatique": "computer_science",
-            "management": "management"
-        }
-        current_subject = subject_map.get(subject.lower(), subject)
+        current_subject = SUBJECT_NAMES_EN.get(subject.lower(), subject)
         subject_configs = SUBJECT_CONFIGS_EN
     else:
         current_subject = subject
         subject_configs = SUBJECT_CONFIGS_FR
     
     st.header(f"{'💬 Poser des questions en' if language == 'fr' else '💬 Ask Questions about'} {current_subject.capitalize()}")
-    
+
+    # Chat mode keeps the conversation, so follow-ups do not need to repeat their context
+    if st.toggle("Mode conversation" if language == "fr" else "Chat mode", key=f"{key_prefix}_chat_mode"):
+        render_chat(t, current_subject, query_engine, language, llm_model_name, key_prefix)
+        return
+
     # Create example placeholder based on subject configuration
     try:
         if current_subject in subject_configs:
@@ -53,38 +65,113 @@ def render_qa_tab(t, subject, query_engine, key_prefix="qa_tab"):
     )
     
     if user_question:
+        # A rerun with the same inputs (another widget changed) shows the memoized answer
+        memo_key = request_fingerprint(
+            kind="qa",
+            question=normalize_question(user_question),
+            generation=get_index_generation(),
+            subject=current_subject,
+            language=language,
+            model=llm_model_name
+        )
+        result = memo_get(memo_key)
+        if result is not None:
+            st.markdown(f"### {t('answer')}")
+            st.write(result["answer"])
+            _render_source(t, language, result["source"])
+            st.caption(result["caption"] + format_memo_note(language))
+            return
+
         with st.spinner(t("processing")):
             try:
                 start_time = time.time()
-                response = query_engine.query(user_question)
-                end_time = time.time()
+                
+                # Reuse an answer already given for the same (or a paraphrased) question
+                answer_cache = get_answer_cache()
+                cache_scope = answer_cache.make_scope(get_index_generation(), current_subject, language, llm_model_name)
+                cached, match_type, query_embedding = answer_cache.get(
+                    cache_scope,
+                    user_question,
+                    embed_fn=Settings.embed_model.get_query_embedding
+                )
                 
                 st.markdown(f"### {t('answer')}")
-                st.write(str(response))
+                if cached is not None:
+                    answer_text = cached["answer"]
+                    source_nodes = cached["source_nodes"]
+                    st.write(answer_text)
+                    stream = None
+                    synthesis_stats = None
+                    coalesced = False
+                else:
+                    # Pass the embedding along so retrieval does not embed the question twice
+                    query_bundle = QuestionQuery(query_str=user_question, embedding=list(query_embedding))
+                    
+                    def start_query():
+                        response = query_engine.query(query_bundle)
+                        return response, iter_response_text(response)
+                    
+                    # Students asking the same question at the same time share one upstream call
+                    flight_key = request_fingerprint(
+                        kind="qa",
+                        question=normalize_question(user_question),
+                        system_prompt=get_subject_system_prompt(current_subject, language),
+                        scope=cache_scope
+                    )
+                    flight, coalesced = get_single_flight().stream(flight_key, start_query)
+                    response = flight.result()
+                    source_nodes = getattr(response, 'source_nodes', None) or []
+                    
+                    # Render tokens as they arrive instead of waiting for the full answer
+                    stream = TimedStream(iter(flight), start_time=start_time)
+                    answer_text = st.write_stream(stream)
+                    answer_cache.put(cache_scope, user_question, answer_text, source_nodes, query_embedding)
+                    synthesis_stats = get_synthesis_stats(response)
+                end_time = time.time()
                 
-                if hasattr(response, 'source_nodes') and response.source_nodes:
-                    st.markdown("---")
-                    st.markdown(f"#### {t('sources')}")
-
+                source = None
+                if source_nodes:
                     # Display only the most relevant source
-                    most_relevant_node = response.source_nodes[0]
-                    source_text = most_relevant_node.node.text
-                    file_name = most_relevant_node.node.metadata.get('file_name', 'Unknown' if language == "en" else "Inconnu")
-                    page_num = most_relevant_node.node.metadata.get('page_label', '')
-
-                    pages_text = "Pages" if language == "en" else "Pages"
-                    extract_text = "Relevant excerpt" if language == "en" else "Extrait pertinent"
-                    pages = page_num if page_num else "N/A"
-
-                    st.write(f"**📄 {file_name}** ({pages_text}: {pages})")
-                    st.caption(f"*{extract_text}:* {source_text[:200]}...")
+                    most_relevant_node = source_nodes[0]
+                    source = {
+                        "file_name": most_relevant_node.node.metadata.get('file_name', 'Unknown' if language == "en" else "Inconnu"),
+                        "page": most_relevant_node.node.metadata.get('page_label', ''),
+                        "text": most_relevant_node.node.text[:200]
+                    }
+                _render_source(t, language, source)
                 
                 # Display response time
                 if language == "fr":
-                    st.caption(f"⏱️ Temps de réponse: {end_time - start_time:.2f} secondes")
+                    cache_note = {"exact": " (cache)", "semantic": " (cache, question similaire)"}.get(match_type, "")
+                    if cached is None and coalesced:
+                        cache_note += " (requête partagée)"
                 else:
-                    st.caption(f"⏱️ Response time: {end_time - start_time:.2f} seconds")
+                    cache_note = {"exact": " (cached)", "semantic": " (cached, similar question)"}.get(match_type, "")
+                    if cached is None and coalesced:
+                        cache_note += " (shared request)"
+                time_to_first_token = stream.time_to_first_token if stream else None
+                cache_note += format_synthesis_stats(language, synthesis_stats)
+                if synthesis_stats:
+                    cache_note += format_compression_stats(language, get_compression_stats(source_nodes))
+                caption = format_timing_caption(language, end_time - start_time, time_to_first_token, cache_note)
+                st.caption(caption)
+                memo_put(memo_key, {"answer": answer_text, "source": source, "caption": caption})
                     
             except Exception as e:
                 st.error(f"{'Erreur:' if language == 'fr' else 'Error:'} {str(e)}")
                 st.info("Essayez de reformuler votre question ou vérifiez le contenu des documents.")
+
+
+def _render_source(t, language, source):
+    """Show the most relevant source passage of an answer"""
+    if not source:
+        return
+    st.markdown("---")
+    st.markdown(f"#### {t('sources')}")
+
+    pages_text = "Pages" if language == "en" else "Pages"
+    extract_text = "Relevant excerpt" if language == "en" else "Extrait pertinent"
+    pages = source["page"] if source["page"] else "N/A"
+
+    st.write(f"**📄 {source['file_name']}** ({pages_text}: {pages})")
+    st.caption(f"*{extract_text}:* {source['text']}...")
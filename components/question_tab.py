@@ -2,12 +2,22 @@
 Question generation tab component
 """
 
+import time
 import streamlit as st
+from llama_index.core import Settings
 from config.subjects import SUBJECT_CONFIGS_FR
-from config.subjects_en import SUBJECT_CONFIGS_EN
-from processors.openai_integration import generate_questions
+from config.subjects_en import SUBJECT_CONFIGS_EN, SUBJECT_NAMES_EN
+from processors.document_processor import get_index_generation
+from processors.openai_integration import generate_questions, render_question_items
+from processors.question_bank import get_question_bank
+from processors.question_parser import normalize_stem
+from processors.retrieval import retrieve_context
+from processors.single_flight import get_single_flight, request_fingerprint
+from utils.streaming import TimedStream, format_timing_caption, format_memo_note
+from utils.reruns import tab_fragment, memo_get, memo_put
 
 
+@tab_fragment("questions")
 def render_question_generation_tab(t, subject, query_engine, llm_model_name):
     """Render the question generation tab"""
     st.header(t("generate_questions"))
@@ -18,18 +28,7 @@ def render_question_generation_tab(t, subject, query_engine, llm_model_name):
     
     # Map subject name if language is English
     if language == "en":
-        subject_map = {
-            "économie": "economics",
-            "marketing": "marketing",
-            "finance": "finance",
-            "comptabilité": "accounting",
-            "gestion": "management",
-            "entrepreneuriat": "entrepreneurship",
-            "droit": "law",
-            "informatique": "computer_science",
-            "management": "management"
-        }
-        eng_subject = subject_map.get(subject.lower(), subject)
+        eng_subject = SUBJECT_NAMES_EN.get(subject.lower(), subject)
     else:
         eng_subject = subject
     
@@ -77,45 +76,134 @@ def render_question_generation_tab(t, subject, query_engine, llm_model_name):
             1, 15, 5,
             key="q_count"
         )
+        only_new = st.checkbox(
+            "Uniquement de nouvelles questions" if language == "fr" else "Only new questions",
+            value=False,
+            key="q_only_new"
+        )
+    
+    # Results stay on screen across reruns with unchanged inputs, without generating again
+    memo_key = request_fingerprint(
+        kind="questions",
+        question_type=question_type,
+        count=num_questions,
+        topic=normalize_stem(topic),
+        subject=current_subject,
+        difficulty=difficulty,
+        language=language,
+        model=llm_model_name,
+        generation=get_index_generation()
+    )
+    memoized = memo_get(memo_key) if topic else None
+    clicked = st.button(t("generate_button"), key="generate_q")
     
-    if st.button(t("generate_button"), key="generate_q") and topic:
+    if memoized is not None and not (clicked and only_new):
+        _render_questions(t, language, memoized, format_memo_note(language))
+    elif clicked and topic:
         with st.spinner(f"Génération de {num_questions} questions..." if language == "fr" else f"Generating {num_questions} questions..."):
             try:
-                # Get relevant context
-                context_prompt = f"""
-{"Extrayez des informations complètes sur" if language == "fr" else "Extract comprehensive information about"} '{topic}' {"des supports de cours incluant" if language == "fr" else "from course materials including"}:
-- {"Définitions clés" if language == "fr" else "Key definitions"}
-- {"Exemples importants" if language == "fr" else "Important examples"}
-- {"Formules/théories pertinentes" if language == "fr" else "Relevant formulas/theories"}
-"""
-                
-                # Query the engine to get relevant content
-                context_response = query_engine.query(context_prompt)
+                start_time = time.time()
+                bank = get_question_bank()
+                generation = get_index_generation()
                 
-                # Generate questions based on the extracted content
-                questions = generate_questions(
-                    question_type=question_type,
-                    num_questions=num_questions,
-                    topic=topic,
-                    subject=current_subject,
-                    difficulty=difficulty,
-                    relevant_content=str(context_response),
-                    llm_model_name=llm_model_name,
-                    language=language
+                # Serve matching questions from the bank first and only generate the shortfall
+                cached = [] if only_new else bank.find(
+                    generation, current_subject, language, question_type, difficulty, topic, num_questions
                 )
+                shortfall = num_questions - len(cached)
+                
+                def accept_new(items):
+                    # Near-duplicates of questions already in the bank are dropped (and generated again);
+                    # the stems completed together (a shard, or a streamed block) are embedded in one call
+                    embeddings = Settings.embed_model.get_text_embedding_batch([item["stem"] for item in items])
+                    return [item for item, embedding in zip(items, embeddings) if bank.add(generation, item, embedding)]
+                
+                def start_generation():
+                    # Retrieve the relevant passages directly; no LLM call is needed to build the context
+                    context = retrieve_context(query_engine, topic)
+                    new_items = generate_questions(
+                        question_type=question_type,
+                        num_questions=shortfall,
+                        topic=topic,
+                        subject=current_subject,
+                        difficulty=difficulty,
+                        relevant_content=context["text"],
+                        llm_model_name=llm_model_name,
+                        language=language,
+                        stream=True,
+                        context_passages=context["passages"],
+                        accept=accept_new
+                    )
+                    return context, new_items
+                
+                context = {"passages": [], "node_ids": []}
+                flight, coalesced = None, False
+                if shortfall > 0:
+                    # A class asking for the same questions at the same time shares one generation
+                    flight_key = request_fingerprint(
+                        kind="questions",
+                        question_type=question_type,
+                        count=shortfall,
+                        topic=normalize_stem(topic),
+                        subject=current_subject,
+                        difficulty=difficulty,
+                        language=language,
+                        model=llm_model_name,
+                        generation=generation,
+                        exclude=[item["id"] for item in cached]
+                    )
+                    flight, coalesced = get_single_flight().stream(flight_key, start_generation)
+                    context = flight.result()
                 
-                # Display generated questions
+                def question_items():
+                    yield from cached
+                    if flight is not None:
+                        yield from flight
+                
+                items = []
+                
+                def question_markdown():
+                    for item in question_items():
+                        items.append(item)
+                        yield render_question_items([item], start=len(items))
+                
+                # Display the questions as they become available
                 st.subheader(f"{'Questions générées sur' if language == 'fr' else 'Generated Questions on'}: {topic}")
-                st.markdown(questions)
+                stream = TimedStream(question_markdown(), start_time=start_time)
+                questions = st.write_stream(stream)
+                note = (f" | {len(cached)} question(s) depuis la banque" if language == "fr"
+                        else f" | {len(cached)} question(s) from the bank") if cached else ""
+                if coalesced:
+                    note += " | requête partagée" if language == "fr" else " | shared request"
+                st.caption(format_timing_caption(language, stream.total_time, stream.time_to_first_token, note=note))
+                
+                # Keep the structured questions and the passages they were generated from
+                st.session_state.generated_questions = {
+                    "topic": topic,
+                    "items": items,
+                    "markdown": questions,
+                    "source_node_ids": sorted({node_id for item in items for node_id in item["source_nodes"]})
+                }
+                source_files = sorted({p["file_name"] for p in context["passages"] if p["file_name"]})
+                if source_files:
+                    st.caption(f"{'📚 Sources :' if language == 'fr' else '📚 Sources:'} {', '.join(source_files)}")
                 
                 # Add download button
                 filename = f"questions_{topic.replace(' ', '_').lower()}.md"
+                download = render_question_items(items)
                 st.download_button(
                     label=t("download"),
-                    data=questions,
+                    data=download,
                     file_name=filename,
                     mime="text/markdown"
                 )
+                memo_put(memo_key, {
+                    "topic": topic,
+                    "markdown": questions,
+                    "download": download,
+                    "caption": format_timing_caption(language, stream.total_time, stream.time_to_first_token, note=note),
+                    "source_files": source_files
+                })
                 
             except Exception as e:
                 st.error(f"Error: {str(e)}")
@@ -127,3 +215,18 @@ def render_question_generation_tab(t, subject, query_engine, llm_model_name):
     # Track if button was clicked but topic was empty
     if st.session_state.get('generate_q', False) and not topic:
         st.session_state.q_topic_submitted = True
+
+
+def _render_questions(t, language, result, note=""):
+    """Show previously generated questions again"""
+    st.subheader(f"{'Questions générées sur' if language == 'fr' else 'Generated Questions on'}: {result['topic']}")
+    st.markdown(result["markdown"])
+    st.caption(result["caption"] + note)
+    if result["source_files"]:
+        st.caption(f"{'📚 Sources :' if language == 'fr' else '📚 Sources:'} {', '.join(result['source_files'])}")
+    st.download_button(
+        label=t("download"),
+        data=result["download"],
+        file_name=f"questions_{result['topic'].replace(' ', '_').lower()}.md",
+        mime="text/markdown"
+    )
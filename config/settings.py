@@ -3,11 +3,9 @@ Global configuration settings for the application
 """
 
 import os
-from pathlib import Path
 
-# Storage constants
+# Storage constants (the directory is created when an index is first saved)
 PERSIST_DIR = "./storage"
-Path(PERSIST_DIR).mkdir(exist_ok=True)
 
 # Default models
 DEFAULT_EMBED_MODEL = "text-embedding-3-small"
@@ -18,3 +16,115 @@ DEFAULT_LANGUAGE = "fr"
 
 # File handling constants
 SUPPORTED_FILE_TYPES = ["pdf", "docx", "txt"]
+
+# Answer cache (shared across sessions, scoped by index generation)
+ANSWER_CACHE_MAX_ENTRIES = 512
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+
+# Retrieval and response synthesis
+SIMILARITY_TOP_K = 6
+SYNTHESIS_COMPACT_TOKEN_LIMIT = None  # None uses the full LLM context window
+SYNTHESIS_MAX_PARALLEL_SUMMARIES = 4
+
+# Reranking: over-retrieve, rerank on CPU, keep nodes scoring close to the best one
+RERANK_MODE = "mmr"  # "mmr", "cross_encoder" or None to disable
+RERANK_CANDIDATES = 30
+RERANK_CROSS_ENCODER_PATH = os.environ.get("RERANK_CROSS_ENCODER_PATH")
+RERANK_MMR_LAMBDA = 0.7
+RERANK_RELATIVE_CUTOFF = 0.85
+RERANK_MIN_NODES = 2
+RERANK_MAX_NODES = SIMILARITY_TOP_K
+
+# Extractive compression of retrieved chunks for QA questions
+COMPRESSION_ENABLED = True
+COMPRESSION_TOKEN_BUDGET = 1500
+COMPRESSION_SENTENCE_WINDOW = 1
+
+# Question generation
+QUESTION_CONTEXT_TOKEN_BUDGET = 6000
+QUESTION_SHARD_SIZE = 5  # larger requests are split into concurrent shards
+QUESTION_SHARD_CONCURRENCY = 4
+QUESTION_BANK_FILE = "question_bank.sqlite"
+QUESTION_DEDUP_THRESHOLD = 0.92  # cosine similarity above which a new question is a duplicate
+
+# Whole-corpus concept extraction (map-reduce)
+CONCEPT_PARTIALS_FILE = "concept_partials.json"
+CONCEPT_SECTION_TOKENS = 3000
+CONCEPT_MAP_CONCURRENCY = 4
+CONCEPT_CONCEPTS_PER_SECTION = 8
+CONCEPT_REDUCE_TOKEN_BUDGET = 2500
+
+# Concept map precomputed in the background after ingestion
+CONCEPT_MAP_ENABLED = os.environ.get("CONCEPT_MAP_ENABLED", "").lower() in ("1", "true", "yes")  # opt-in
+CONCEPT_MAP_FILE = "concept_map.json"
+CONCEPT_MAP_MAX_CHUNKS = 5  # chunk ids kept per concept
+CONCEPT_MAP_MIN_TOPIC_MATCHES = 3  # fewer mapped concepts on a topic falls back to the LLM
+
+# Shared OpenAI client (set OPENAI_BASE_URL to target a compatible server or a local stub)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")
+LLM_TIMEOUT_SECONDS = 60.0
+LLM_CONNECT_TIMEOUT_SECONDS = 5.0
+LLM_MAX_RETRIES = 3
+LLM_RETRY_BASE_DELAY = 0.5  # seconds, doubled per attempt with full jitter
+LLM_RETRY_MAX_DELAY = 8.0
+LLM_POOL_MAX_CONNECTIONS = 20
+LLM_POOL_MAX_KEEPALIVE = 10
+LLM_POOL_KEEPALIVE_EXPIRY = 30.0
+LLM_HEDGE_ENABLED = False  # send a duplicate request when a call exceeds the recent p95 latency
+LLM_HEDGE_PERCENTILE = 0.95
+LLM_HEDGE_MIN_SAMPLES = 20
+
+# Request scheduler: classes in priority order, with their concurrency limits
+SCHEDULER_PRIORITIES = ["qa", "embeddings", "concepts", "questions", "bulk", "ingestion"]
+SCHEDULER_CLASS_LIMITS = {"qa": 8, "embeddings": 4, "concepts": 4, "questions": 4, "bulk": 4, "ingestion": 2}
+SCHEDULER_MAX_CONCURRENCY = 16  # across all classes but the nested one; with it, at most LLM_POOL_MAX_CONNECTIONS
+SCHEDULER_NESTED_CLASS = "embeddings"  # embeddings made while reading a stream, outside SCHEDULER_MAX_CONCURRENCY
+SCHEDULER_REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", 500))  # 0 disables
+SCHEDULER_TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TOKENS_PER_MINUTE", 200000))  # 0 disables
+SCHEDULER_ACQUIRE_TIMEOUT_SECONDS = 120.0  # queued requests fail instead of waiting forever
+
+# Record/replay of OpenAI exchanges: "off", "record", "replay" or "auto" (replay, record misses)
+LLM_CASSETTE_MODE = os.environ.get("LLM_CASSETTE_MODE", "off")
+LLM_CASSETTE_PATH = os.environ.get("LLM_CASSETTE_PATH", "cassettes/openai.jsonl")
+LLM_CASSETTE_TIMING = os.environ.get("LLM_CASSETTE_TIMING", "original")  # or "none" to replay instantly
+
+# Token budgets
+DEFAULT_CONTEXT_WINDOW = 8192  # for models whose context window is unknown
+TOKEN_COUNT_CACHE_SIZE = 8192  # memoized (text, model) token counts
+SUBJECT_EXAMPLES_MAX_TOKENS = 400  # examples block of the subject system prompts
+QUESTION_OUTPUT_TOKENS = 2000  # per request, whatever the number of questions
+QUESTION_OUTPUT_TOKENS_PER_QUESTION = 400  # smaller shards get proportionally less
+QUESTION_TOPUP_ATTEMPTS = 2  # extra generations for questions dropped as duplicates
+
+# Chat mode of the QA tab
+CHAT_MEMORY_TOKEN_LIMIT = 1500  # summary and verbatim turns; older turns are summarized beyond this
+CHAT_MEMORY_KEEP_TURNS = 2  # most recent turns always kept verbatim
+CHAT_SUMMARY_MAX_TOKENS = 300
+CHAT_CONDENSE_MAX_TOKENS = 200
+CHAT_TOPIC_REUSE_THRESHOLD = 0.85  # query similarity above which the previous turn's retrieved nodes are reused
+
+# Bulk question answering
+BULK_QA_CONCURRENCY = 4  # questions synthesized at once
+BULK_QA_EMBED_BATCH_SIZE = 100  # questions per embedding request
+BULK_QA_MAX_QUESTIONS = 1000
+
+# Headless HTTP API (api/server.py): one index per namespace under this directory
+API_STORAGE_DIR = os.environ.get("API_STORAGE_DIR", "./storage_api")
+API_MAX_QUESTIONS = 30  # per questions request
+API_CHUNK_SIZE_RANGE = (256, 2048)  # same bounds as the sidebar slider
+
+# Offline index builds (python -m processors.build)
+BUILD_EXTRACT_WORKERS = os.cpu_count() or 4  # processes extracting text from files
+BUILD_EMBED_BATCH_SIZE = 100  # chunks per embedding request
+BUILD_EMBED_CONCURRENCY = 4  # embedding requests in flight
+# Prebuilt index artifact (path or http(s) URL) that serving nodes install and open at startup
+INDEX_ARTIFACT = os.environ.get("INDEX_ARTIFACT", "")
+
+# Results kept per session so reruns with unchanged inputs do not query again
+SESSION_MEMO_MAX_ENTRIES = 20
+
+# Per-session memory: approximate bytes of st.session_state above which cached results are evicted
+SESSION_MEMORY_BUDGET_BYTES = int(float(os.environ.get("SESSION_MEMORY_BUDGET_MB", 32)) * 1024 * 1024)
+SESSION_EVICTABLE_KEYS = ["result_memo", "bulk_qa_results", "generated_questions", "generated_mcqs"]
+SESSION_MEMORY_REPORT_TTL_SECONDS = 3600  # sessions not seen for this long leave the process report
@@ -94,3 +94,21 @@ SUBJECT_CONFIGS_EN = {
         }
     }
 }
+
+# English names of the subjects selected in the (French) sidebar
+SUBJECT_NAMES_EN = {
+    "économie": "economics",
+    "marketing": "marketing",
+    "finance": "finance",
+    "comptabilité": "accounting",
+    "gestion": "management",
+    "entrepreneuriat": "entrepreneurship",
+    "droit": "law",
+    "informatique": "computer_science",
+    "management": "management"
+}
+
+# French sidebar key of each English subject name (the first French name wins)
+SUBJECT_KEYS_FR = {}
+for _fr, _en in SUBJECT_NAMES_EN.items():
+    SUBJECT_KEYS_FR.setdefault(_en, _fr)
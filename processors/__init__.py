@@ -1,8 +1,55 @@
 """
 Export all processor functions
+
+Submodules are imported on first attribute access, so that importing one
+light helper (e.g. the scheduler) does not load llama_index and openai.
 """
 
-from .document_processor import process_documents, save_index
-from .indexing import create_french_subject_engine, create_english_subject_engine, load_or_create_index
-from .openai_integration import generate_questions
-from .concept_extractor import get_concept_extraction_prompt
+import importlib
+
+_EXPORTS = {
+    "process_documents": "document_processor",
+    "save_index": "document_processor",
+    "get_index_generation": "document_processor",
+    "compute_index_version": "document_processor",
+    "load_index_metadata": "document_processor",
+    "update_index_metadata": "document_processor",
+    "install_artifact": "build",
+    "ensure_artifact_installed": "build",
+    "share_index": "engine_cache",
+    "get_shared_index": "engine_cache",
+    "get_shared_engine": "engine_cache",
+    "create_french_subject_engine": "indexing",
+    "create_english_subject_engine": "indexing",
+    "load_or_create_index": "indexing",
+    "generate_questions": "openai_integration",
+    "render_question_items": "openai_integration",
+    "get_concept_extraction_prompt": "concept_extractor",
+    "get_answer_cache": "answer_cache",
+    "ChatMemory": "chat",
+    "start_chat_turn": "chat",
+    "finish_chat_turn": "chat",
+    "retrieve_context": "retrieval",
+    "get_question_bank": "question_bank",
+    "start_concept_map_build": "concept_map",
+    "load_concept_map": "concept_map",
+    "get_llm": "llm_client",
+    "get_embed_model": "llm_client",
+    "get_llm_metrics": "llm_client",
+    "count_upstream_calls": "llm_client",
+    "precompile_prompts": "prompts",
+    "get_single_flight": "single_flight",
+    "get_scheduler": "scheduler",
+    "request_context": "scheduler",
+    "set_request_session": "scheduler"
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,144 @@
+"""
+Semantic answer cache for the question answering tab
+"""
+
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config.settings import (
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_SIMILARITY_THRESHOLD
+)
+
+
+def normalize_question(question):
+    """Normalize a question so trivial variations share the same exact key"""
+    text = " ".join(question.lower().split())
+    return re.sub(r"[\s?!.]+$", "", text)
+
+
+class AnswerCache:
+    """Process-wide answer cache shared by every session.
+
+    Entries are scoped by (index generation, subject, language, model). A lookup
+    first tries the exact hash of the normalized question, then the closest
+    cached question embedding within the same scope above the threshold.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_scope(generation, subject, language, model):
+        """Build the scope tuple that partitions the cache"""
+        return (generation or "", subject.lower(), language, model or "")
+
+    @staticmethod
+    def _key(scope, question):
+        digest = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+        return scope + (digest,)
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds and now - entry["created"] > self.ttl_seconds
+
+    def _purge_expired(self, now):
+        for key in [k for k, e in self._entries.items() if self._expired(e, now)]:
+            del self._entries[key]
+            self.stats["evictions"] += 1
+
+    def get(self, scope, question, embed_fn=None):
+        """Return (entry, match_type, embedding) for a question.
+
+        ``embed_fn`` is only called when the exact lookup misses; the computed
+        embedding is returned so the caller can reuse it for retrieval.
+        """
+        now = time.time()
+        key = self._key(scope, question)
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry, "exact", entry["embedding"]
+
+        embedding = embed_fn(question) if embed_fn is not None else None
+
+        with self._lock:
+            if embedding is not None and self.similarity_threshold < 1:
+                best_key, best_score = None, self.similarity_threshold
+                query_vec = _unit(embedding)
+                for cached_key, cached in self._entries.items():
+                    if cached_key[:len(scope)] != scope or cached["embedding"] is None:
+                        continue
+                    score = float(np.dot(query_vec, cached["embedding"]))
+                    if score >= best_score:
+                        best_key, best_score = cached_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.stats["semantic_hits"] += 1
+                    return self._entries[best_key], "semantic", embedding
+
+            self.stats["misses"] += 1
+            return None, None, embedding
+
+    def put(self, scope, question, answer, source_nodes=None, embedding=None):
+        """Store an answer and its source nodes, evicting the least recently used entries"""
+        entry = {
+            "question": question,
+            "answer": answer,
+            "source_nodes": list(source_nodes or []),
+            "embedding": _unit(embedding) if embedding is not None else None,
+            "created": time.time()
+        }
+        with self._lock:
+            key = self._key(scope, question)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return entry
+
+    def invalidate(self, generation=None):
+        """Drop every entry that does not belong to the given index generation"""
+        with self._lock:
+            if generation is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] != generation]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _unit(vector):
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """Return the process-wide answer cache"""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache()
+        return _answer_cache
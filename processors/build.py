@@ -0,0 +1,320 @@
+"""
+Offline index builds and portable index artifacts.
+
+Usage:
+    python -m processors.build --input materials/ --output economie.tar.gz [--subject économie --language fr]
+    python -m processors.build --install economie.tar.gz [--persist-dir ./storage]
+
+A build extracts every PDF/DOCX/TXT file under the input directory in
+parallel processes, embeds the chunks in large concurrent batches and writes
+one gzip-compressed artifact: the docstore and index store, the vectors as a
+float32 array, metadata.json and a manifest (format version, checksums and
+build statistics). Installing an artifact (a path or an http(s) URL) verifies
+it and swaps it in as the persisted index; serving nodes set INDEX_ARTIFACT
+to install and open it at startup instead of ingesting documents.
+"""
+
+import os
+import json
+import time
+import tarfile
+import hashlib
+import argparse
+import tempfile
+import threading
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import requests
+from llama_index.core import VectorStoreIndex, StorageContext
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores.simple import SimpleVectorStore, SimpleVectorStoreData
+
+from config.settings import (
+    PERSIST_DIR,
+    DEFAULT_EMBED_MODEL,
+    DEFAULT_LLM_MODEL,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_SUBJECT,
+    DEFAULT_LANGUAGE,
+    BUILD_EXTRACT_WORKERS,
+    BUILD_EMBED_BATCH_SIZE,
+    BUILD_EMBED_CONCURRENCY
+)
+from processors.answer_cache import get_answer_cache
+from processors.question_bank import get_question_bank
+from processors.document_processor import (
+    extract_file,
+    clean_documents,
+    save_index,
+    get_index_generation,
+    compute_index_version
+)
+from processors.scheduler import request_context
+from processors.llm_client import get_llm, get_embed_model
+
+# Bump when the artifact layout changes; installers refuse other versions
+ARTIFACT_FORMAT_VERSION = 1
+
+SUPPORTED_SUFFIXES = (".pdf", ".docx", ".txt")
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+VECTOR_REFS_FILE = "vector_refs.json"
+VECTOR_STORE_FILE = "default__vector_store.json"
+
+_installed = {}
+_install_lock = threading.Lock()
+
+
+def collect_files(input_dir):
+    """All supported files under ``input_dir``, in a stable order"""
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith(SUPPORTED_SUFFIXES):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def extract_documents(paths, workers=BUILD_EXTRACT_WORKERS):
+    """Extract and clean the documents of all files, in parallel processes"""
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            extracted = list(pool.map(extract_file, paths))
+    else:
+        extracted = [extract_file(path) for path in paths]
+    return clean_documents([doc for docs in extracted for doc in docs])
+
+
+def embed_nodes(nodes, embed_model, batch_size=BUILD_EMBED_BATCH_SIZE, concurrency=BUILD_EMBED_CONCURRENCY):
+    """Set the embedding of every node, sending ``concurrency`` batch requests at a time"""
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    batches = [range(start, min(start + batch_size, len(texts))) for start in range(0, len(texts), batch_size)]
+
+    def embed(batch):
+        return batch, embed_model.get_text_embedding_batch([texts[i] for i in batch])
+
+    with request_context("ingestion"), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Workers inherit the ingestion priority class
+        futures = [pool.submit(contextvars.copy_context().run, embed, batch) for batch in batches]
+        for future in futures:
+            batch, embeddings = future.result()
+            for i, embedding in zip(batch, embeddings):
+                nodes[i].embedding = embedding
+    return len(batches)
+
+
+def build_index(paths, embed_model_name, chunk_size, workers=BUILD_EXTRACT_WORKERS,
+                embed_batch_size=BUILD_EMBED_BATCH_SIZE, embed_concurrency=BUILD_EMBED_CONCURRENCY):
+    """Build the vector index of ``paths``; returns (index, valid_docs, stats) or None without content"""
+    stats = {"files": len(paths)}
+    start_time = time.time()
+    valid_docs = extract_documents(paths, workers)
+    stats["extract_s"] = round(time.time() - start_time, 2)
+    if not valid_docs:
+        return None
+
+    # Same chunking as VectorStoreIndex.from_documents with Settings.chunk_size
+    nodes = SentenceSplitter(chunk_size=chunk_size).get_nodes_from_documents(valid_docs)
+    embed_model = get_embed_model(embed_model_name, embed_batch_size=embed_batch_size)
+    embed_start = time.time()
+    stats["embed_requests"] = embed_nodes(nodes, embed_model, embed_batch_size, embed_concurrency)
+    stats["embed_s"] = round(time.time() - embed_start, 2)
+
+    storage_context = StorageContext.from_defaults()
+    for doc in valid_docs:
+        storage_context.docstore.set_document_hash(doc.id_, doc.hash)
+    # Nodes already carry their embeddings, so the index does not embed them again
+    index = VectorStoreIndex(nodes, storage_context=storage_context, embed_model=embed_model)
+    stats.update(documents=len(valid_docs), nodes=len(nodes), build_s=round(time.time() - start_time, 2))
+    return index, valid_docs, stats
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _pack_vectors(directory):
+    """Replace the JSON vector store with a float32 array and its ids"""
+    with open(os.path.join(directory, VECTOR_STORE_FILE), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    ids = list(data["embedding_dict"])
+    vectors = np.asarray([data["embedding_dict"][node_id] for node_id in ids], dtype=np.float32)
+    np.save(os.path.join(directory, VECTORS_FILE), vectors)
+    refs = {"ids": ids, "text_id_to_ref_doc_id": data.get("text_id_to_ref_doc_id", {}),
+            "metadata_dict": data.get("metadata_dict", {})}
+    with open(os.path.join(directory, VECTOR_REFS_FILE), "w", encoding="utf-8") as f:
+        json.dump(refs, f, ensure_ascii=False)
+    os.remove(os.path.join(directory, VECTOR_STORE_FILE))
+    return vectors.shape
+
+
+def _unpack_vectors(directory):
+    """Rebuild the JSON vector store that load_index_from_storage reads"""
+    vectors = np.load(os.path.join(directory, VECTORS_FILE))
+    with open(os.path.join(directory, VECTOR_REFS_FILE), "r", encoding="utf-8") as f:
+        refs = json.load(f)
+    data = SimpleVectorStoreData(
+        embedding_dict={node_id: vector.tolist() for node_id, vector in zip(refs["ids"], vectors)},
+        text_id_to_ref_doc_id=refs["text_id_to_ref_doc_id"],
+        metadata_dict=refs["metadata_dict"]
+    )
+    SimpleVectorStore(data=data).persist(os.path.join(directory, VECTOR_STORE_FILE))
+    os.remove(os.path.join(directory, VECTORS_FILE))
+    os.remove(os.path.join(directory, VECTOR_REFS_FILE))
+
+
+def write_artifact(index, valid_docs, output_path, embed_model_name, llm_model_name, chunk_size, subject, language,
+                   stats=None, concept_map=False, index_version=None):
+    """Write the index as a compressed artifact; returns its manifest"""
+    with tempfile.TemporaryDirectory() as staging:
+        generation = save_index(index, embed_model_name, llm_model_name, chunk_size, subject, language, valid_docs,
+                                persist_dir=staging, index_version=index_version)
+        if concept_map:
+            from processors.concept_map import build_concept_map
+            with request_context("ingestion"):
+                build_concept_map(get_llm(llm_model_name), subject, generation, staging)
+        count, dimensions = _pack_vectors(staging)
+
+        names = sorted(os.listdir(staging))
+        manifest = {
+            "format": ARTIFACT_FORMAT_VERSION,
+            "generation": generation,
+            "nodes": count,
+            "dimensions": dimensions,
+            "files": {name: _sha256(os.path.join(staging, name)) for name in names},
+            "build": stats or {}
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        # The manifest goes first so installers can check the version before reading the rest
+        with tarfile.open(output_path + ".tmp", "w:gz") as tar:
+            for name in [MANIFEST_FILE] + names:
+                tar.add(os.path.join(staging, name), arcname=name)
+        os.replace(output_path + ".tmp", output_path)
+    return manifest
+
+
+def _download(url, directory):
+    path = os.path.join(directory, "artifact.tar.gz")
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for block in response.iter_content(1 << 20):
+                f.write(block)
+    return path
+
+
+def _extract(tar, directory, members):
+    """Extract regular files only, within ``directory``"""
+    if hasattr(tarfile, "data_filter"):
+        tar.extractall(directory, members=members, filter="data")
+        return
+    # Python without extraction filters (before 3.11.4 and the matching backports): check the members by hand
+    root = os.path.realpath(directory)
+    for member in members:
+        target = os.path.realpath(os.path.join(root, member.name))
+        if not member.isfile() or os.path.isabs(member.name) or os.path.commonpath([root, target]) != root:
+            raise ValueError(f"Unsafe member {member.name!r} in index artifact")
+    tar.extractall(directory, members=members)
+
+
+def install_artifact(source, persist_dir=PERSIST_DIR):
+    """Verify the artifact at ``source`` (a path or http(s) URL) and make it the persisted index.
+
+    Returns the index metadata. The previous index is replaced only once the
+    new one is fully unpacked; reinstalling the generation already in place
+    leaves it untouched.
+    """
+    parent = os.path.dirname(os.path.abspath(persist_dir))
+    os.makedirs(parent, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=parent, prefix=".artifact-") as workdir:
+        path = _download(source, workdir) if source.startswith(("http://", "https://")) else source
+        with tarfile.open(path, "r:gz") as tar:
+            manifest = json.load(tar.extractfile(MANIFEST_FILE))
+            if manifest.get("format") != ARTIFACT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported index artifact format {manifest.get('format')} in {source}")
+            if manifest["generation"] == get_index_generation(persist_dir):
+                with open(os.path.join(persist_dir, "metadata.json"), "r") as f:
+                    return json.load(f)
+
+            staging = os.path.join(workdir, "index")
+            members = [tar.getmember(name) for name in manifest["files"]]
+            _extract(tar, staging, members)
+
+        for name, checksum in manifest["files"].items():
+            if _sha256(os.path.join(staging, name)) != checksum:
+                raise ValueError(f"Checksum mismatch for {name} in {source}")
+        _unpack_vectors(staging)
+
+        previous = os.path.join(workdir, "previous")
+        if os.path.exists(persist_dir):
+            os.rename(persist_dir, previous)
+        os.rename(staging, persist_dir)
+
+    with open(os.path.join(persist_dir, "metadata.json"), "r") as f:
+        metadata = json.load(f)
+    # Same as a rebuild in the app: cached answers and questions belong to the old index
+    if persist_dir == PERSIST_DIR:
+        get_answer_cache().invalidate(metadata["generation"])
+        get_question_bank().purge_other_generations(metadata["generation"])
+    return metadata
+
+
+def ensure_artifact_installed(source, persist_dir=PERSIST_DIR):
+    """Install ``source`` once per process; later calls return the installed metadata"""
+    with _install_lock:
+        key = (source, persist_dir)
+        if key not in _installed:
+            _installed[key] = install_artifact(source, persist_dir)
+        return _installed[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a portable index artifact, or install one")
+    parser.add_argument("--input", help="directory of PDF/DOCX/TXT files to index")
+    parser.add_argument("--output", help="artifact file to write (.tar.gz)")
+    parser.add_argument("--install", metavar="ARTIFACT", help="artifact path or URL to install")
+    parser.add_argument("--persist-dir", default=PERSIST_DIR, help="where --install puts the index")
+    parser.add_argument("--embed-model", default=DEFAULT_EMBED_MODEL)
+    parser.add_argument("--llm-model", default=DEFAULT_LLM_MODEL)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--subject", default=DEFAULT_SUBJECT)
+    parser.add_argument("--language", choices=["fr", "en"], default=DEFAULT_LANGUAGE)
+    parser.add_argument("--workers", type=int, default=BUILD_EXTRACT_WORKERS, help="extraction processes")
+    parser.add_argument("--embed-batch-size", type=int, default=BUILD_EMBED_BATCH_SIZE)
+    parser.add_argument("--embed-concurrency", type=int, default=BUILD_EMBED_CONCURRENCY)
+    parser.add_argument("--concept-map", action="store_true", help="also build the concept map into the artifact")
+    args = parser.parse_args()
+
+    if args.install:
+        start_time = time.time()
+        metadata = install_artifact(args.install, args.persist_dir)
+        print(json.dumps(dict(metadata, install_s=round(time.time() - start_time, 2)), ensure_ascii=False))
+        return
+    if not args.input or not args.output:
+        parser.error("pass --input and --output to build, or --install ARTIFACT")
+
+    paths = collect_files(args.input)
+    result = build_index(paths, args.embed_model, args.chunk_size, args.workers,
+                         args.embed_batch_size, args.embed_concurrency)
+    if result is None:
+        parser.exit(1, f"No readable content found in {args.input}\n")
+    index, valid_docs, stats = result
+    manifest = write_artifact(index, valid_docs, args.output, args.embed_model, args.llm_model, args.chunk_size,
+                              args.subject, args.language, stats, args.concept_map,
+                              compute_index_version(paths, args.embed_model, args.chunk_size))
+    manifest["size_bytes"] = os.path.getsize(args.output)
+    del manifest["files"]
+    print(json.dumps(manifest, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Bulk question answering over a CSV/JSONL list of questions.
+
+Usage:
+    python -m processors.bulk_qa --input faq.csv --output answers.csv [--subject économie --language fr]
+
+Question embeddings are computed in large batches, retrieval scores all
+questions with one matrix product, and synthesis runs with bounded
+concurrency (in the scheduler's "bulk" class, behind interactive QA).
+Answers already in the answer cache are reused.
+"""
+
+import io
+import csv
+import json
+import time
+import argparse
+import statistics
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from llama_index.core import Settings, StorageContext, load_index_from_storage
+
+from config.settings import (
+    PERSIST_DIR,
+    SIMILARITY_TOP_K,
+    RERANK_MODE,
+    RERANK_CANDIDATES,
+    BULK_QA_CONCURRENCY,
+    BULK_QA_EMBED_BATCH_SIZE
+)
+from config.subjects_en import SUBJECT_NAMES_EN
+from processors.answer_cache import get_answer_cache
+from processors.compression import QuestionQuery
+from processors.indexing import create_french_subject_engine, create_english_subject_engine
+from processors.retrieval import batch_retrieve, PrecomputedRetriever
+from processors.scheduler import request_context
+from processors.llm_client import get_llm, get_embed_model
+
+RESULT_FIELDS = ["question", "answer", "sources", "latency_s", "cached", "error"]
+
+
+def load_questions(data, file_name):
+    """Read questions from CSV (a "question" column, else the first one), JSONL or plain text lines"""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+    questions = []
+    if file_name.lower().endswith(".csv"):
+        reader = csv.reader(io.StringIO(data))
+        header = next(reader, [])
+        column = next((i for i, name in enumerate(header) if name.strip().lower() == "question"), None)
+        if column is None:
+            # No header row: the first line is already a question
+            column = 0
+            questions.append(header[0] if header else "")
+        questions.extend(row[column] for row in reader if len(row) > column)
+    else:
+        for line in data.splitlines():
+            line = line.strip()
+            if line.startswith("{"):
+                questions.append(json.loads(line).get("question", ""))
+            else:
+                questions.append(line)
+    return [q.strip() for q in questions if q and q.strip()]
+
+
+def format_sources(source_nodes):
+    """Distinct "file (p. N)" references of the nodes an answer was built from"""
+    sources = []
+    for node_with_score in source_nodes:
+        metadata = node_with_score.node.metadata
+        source = metadata.get("file_name", "?")
+        if metadata.get("page_label"):
+            source += f" (p. {metadata['page_label']})"
+        if source not in sources:
+            sources.append(source)
+    return "; ".join(sources)
+
+
+def answer_questions(index, questions, subject, language, llm, embed_model, generation=None,
+                     concurrency=BULK_QA_CONCURRENCY, on_result=None):
+    """Answer every question; returns (rows in input order, summary).
+
+    ``on_result(done, total, row)`` is called from the calling thread as
+    answers complete, e.g. to update a progress bar.
+    """
+    start_time = time.time()
+    subject_key = SUBJECT_NAMES_EN.get(subject.lower(), subject) if language == "en" else subject
+    answer_cache = get_answer_cache()
+    cache_scope = answer_cache.make_scope(generation, subject_key, language, llm.model)
+
+    embeddings = embed_model.get_text_embedding_batch(questions)
+    embed_time = time.time() - start_time
+
+    # Cached answers skip retrieval and synthesis entirely
+    rows = [None] * len(questions)
+    pending = []
+    for i, (question, embedding) in enumerate(zip(questions, embeddings)):
+        cached, _, _ = answer_cache.get(cache_scope, question, embed_fn=lambda _: embedding)
+        if cached is not None:
+            rows[i] = {"question": question, "answer": cached["answer"],
+                       "sources": format_sources(cached["source_nodes"]),
+                       "latency_s": 0.0, "cached": True, "error": ""}
+        else:
+            pending.append(i)
+
+    retrieval_start = time.time()
+    top_k = RERANK_CANDIDATES if RERANK_MODE else SIMILARITY_TOP_K
+    retrieved = batch_retrieve(index, [embeddings[i] for i in pending], top_k) if pending else []
+    results = {questions[i]: nodes for i, nodes in zip(pending, retrieved)}
+    retrieval_time = time.time() - retrieval_start
+
+    create_engine = create_french_subject_engine if language == "fr" else create_english_subject_engine
+    engine = create_engine(index, subject, llm, streaming=False, retriever=PrecomputedRetriever(results))
+
+    def answer(i):
+        question_start = time.time()
+        row = {"question": questions[i], "cached": False, "error": ""}
+        try:
+            response = engine.query(QuestionQuery(query_str=questions[i], embedding=list(embeddings[i])))
+            row["answer"] = str(response)
+            row["sources"] = format_sources(response.source_nodes)
+            answer_cache.put(cache_scope, questions[i], row["answer"], response.source_nodes, embeddings[i])
+        except Exception as e:
+            row["answer"], row["sources"], row["error"] = "", "", str(e)
+        row["latency_s"] = round(time.time() - question_start, 3)
+        return i, row
+
+    done = len(questions) - len(pending)
+    with request_context("bulk"), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Workers inherit the bulk priority class and the caller's session
+        futures = [pool.submit(contextvars.copy_context().run, answer, i) for i in pending]
+        for future in as_completed(futures):
+            i, row = future.result()
+            rows[i] = row
+            done += 1
+            if on_result is not None:
+                on_result(done, len(questions), row)
+
+    wall_time = time.time() - start_time
+    latencies = sorted(row["latency_s"] for row in rows if not row["cached"] and not row["error"])
+    summary = {
+        "questions": len(questions),
+        "answered": sum(1 for row in rows if not row["error"]),
+        "cached": sum(1 for row in rows if row["cached"]),
+        "failed": sum(1 for row in rows if row["error"]),
+        "wall_time_s": round(wall_time, 2),
+        "throughput_qps": round(len(questions) / wall_time, 3) if wall_time else None,
+        "embedding_s": round(embed_time, 3),
+        "retrieval_s": round(retrieval_time, 3),
+        "mean_latency_s": round(statistics.mean(latencies), 3) if latencies else None,
+        "p50_latency_s": latencies[len(latencies) // 2] if latencies else None,
+        "p95_latency_s": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None,
+        "concurrency": concurrency
+    }
+    return rows, summary
+
+
+def format_results(rows, file_format="csv"):
+    """Serialize result rows as CSV or JSON lines"""
+    if file_format == "jsonl":
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=RESULT_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a CSV/JSONL list of questions against the saved index")
+    parser.add_argument("--input", required=True, help="CSV, JSONL or text file of questions")
+    parser.add_argument("--output", required=True, help="answers file (.csv or .jsonl)")
+    parser.add_argument("--persist-dir", default=PERSIST_DIR)
+    parser.add_argument("--subject", help="defaults to the subject the index was built for")
+    parser.add_argument("--language", choices=["fr", "en"], help="defaults to the index language")
+    parser.add_argument("--concurrency", type=int, default=BULK_QA_CONCURRENCY)
+    args = parser.parse_args()
+
+    with open(f"{args.persist_dir}/metadata.json", "r") as f:
+        metadata = json.load(f)
+    embed_model = get_embed_model(metadata["embed_model"], embed_batch_size=BULK_QA_EMBED_BATCH_SIZE)
+    llm = get_llm(metadata["llm_model"])
+    Settings.embed_model = embed_model
+    Settings.llm = llm
+    index = load_index_from_storage(StorageContext.from_defaults(persist_dir=args.persist_dir))
+
+    with open(args.input, "rb") as f:
+        questions = load_questions(f.read(), args.input)
+
+    def progress(done, total, row):
+        print(f"[{done}/{total}] {row['latency_s']:.2f}s {row['question'][:70]}")
+
+    rows, summary = answer_questions(
+        index, questions,
+        subject=args.subject or metadata.get("subject", "économie"),
+        language=args.language or metadata.get("language", "fr"),
+        llm=llm,
+        embed_model=embed_model,
+        generation=metadata.get("generation"),
+        concurrency=args.concurrency,
+        on_result=progress
+    )
+    with open(args.output, "w", encoding="utf-8", newline="") as f:
+        f.write(format_results(rows, "jsonl" if args.output.endswith(".jsonl") else "csv"))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Record/replay of OpenAI HTTP exchanges for repeatable performance runs
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+
+import httpx
+
+from config.settings import LLM_CASSETTE_MODE, LLM_CASSETTE_PATH, LLM_CASSETTE_TIMING
+
+CASSETTE_MODES = ("off", "record", "replay", "auto")
+
+# Hop-by-hop and per-response headers that must not be replayed as recorded
+_SKIPPED_HEADERS = {"transfer-encoding", "connection", "keep-alive", "date", "set-cookie"}
+
+
+def request_fingerprint(request):
+    """Hash of what determines an API response: method, path and canonical JSON body.
+
+    The host is left out so a cassette recorded against the real API replays
+    against any base URL, and headers (API key, client version) are ignored.
+    """
+    body = request.content
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    except ValueError:
+        pass
+    digest = hashlib.sha256(request.method.encode("ascii") + b" " + request.url.path.encode("utf-8") + b"\n")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _summary(request):
+    try:
+        model = json.loads(request.content).get("model")
+    except (ValueError, AttributeError):
+        model = None
+    return {"method": request.method, "path": request.url.path, "model": model}
+
+
+def _encode(chunk):
+    # Chunks may split multi-byte characters (or be gzip bytes): surrogateescape keeps them lossless,
+    # and the cassette is written with ensure_ascii so the lone surrogates are escaped as \udcXX
+    return chunk.decode("utf-8", errors="surrogateescape")
+
+
+def _decode(text):
+    return text.encode("utf-8", errors="surrogateescape")
+
+
+class _Recording:
+    """Collects one response's chunks and arrival times, then writes the cassette entry"""
+
+    def __init__(self, cassette, fingerprint, request, response, started):
+        self.cassette = cassette
+        self.entry = {
+            "fingerprint": fingerprint,
+            "request": _summary(request),
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.multi_items() if k.lower() not in _SKIPPED_HEADERS],
+            "latency": time.monotonic() - started,
+            "chunks": []
+        }
+        self.started = started
+        self.saved = False
+
+    def add(self, chunk):
+        self.entry["chunks"].append([round(time.monotonic() - self.started, 4), _encode(chunk)])
+
+    def save(self):
+        if not self.saved:
+            self.saved = True
+            self.entry["duration"] = time.monotonic() - self.started
+            self.cassette.write(self.entry)
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, stream, recording):
+        self._stream = stream
+        self._recording = recording
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._recording.add(chunk)
+            yield chunk
+
+    def close(self):
+        # Clients may close a stream once its end marker arrived, without draining it
+        self._stream.close()
+        self._recording.save()
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, recording):
+        self._stream = stream
+        self._recording = recording
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._recording.add(chunk)
+            yield chunk
+
+    async def aclose(self):
+        await self._stream.aclose()
+        self._recording.save()
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, entry, timed):
+        self._entry = entry
+        self._timed = timed
+
+    def __iter__(self):
+        elapsed = self._entry["latency"]
+        for offset, chunk in self._entry["chunks"]:
+            if self._timed and offset > elapsed:
+                time.sleep(offset - elapsed)
+                elapsed = offset
+            yield _decode(chunk)
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, entry, timed):
+        self._entry = entry
+        self._timed = timed
+
+    async def __aiter__(self):
+        elapsed = self._entry["latency"]
+        for offset, chunk in self._entry["chunks"]:
+            if self._timed and offset > elapsed:
+                await asyncio.sleep(offset - elapsed)
+                elapsed = offset
+            yield _decode(chunk)
+
+
+class Cassette:
+    """A JSON lines file of recorded exchanges, keyed by request fingerprint.
+
+    ``record`` starts a fresh file and forwards every request, ``replay``
+    answers only from the file, ``auto`` replays what it has and records the
+    rest. Replays reproduce the recorded status, headers, body chunks and,
+    with ``timing="original"``, the original latency and chunk spacing.
+    Repeated identical requests replay their recordings in order, cycling.
+    """
+
+    def __init__(self, path=LLM_CASSETTE_PATH, mode=LLM_CASSETTE_MODE, timing=LLM_CASSETTE_TIMING):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.timed = timing == "original"
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._positions = {}
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        if mode == "record" and os.path.exists(path):
+            os.remove(path)
+        elif mode in ("replay", "auto"):
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["fingerprint"], []).append(entry)
+
+    def write(self, entry):
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._entries.setdefault(entry["fingerprint"], []).append(entry)
+            self.stats["recorded"] += 1
+
+    def _lookup(self, fingerprint):
+        with self._lock:
+            entries = self._entries.get(fingerprint)
+            if not entries or self.mode == "record":
+                if self.mode == "replay":
+                    self.stats["misses"] += 1
+                return None
+            position = self._positions.get(fingerprint, 0)
+            self._positions[fingerprint] = position + 1
+            self.stats["replayed"] += 1
+            return entries[position % len(entries)]
+
+    def _miss(self, request, fingerprint):
+        # A 400 is not retried and surfaces as a clear BadRequestError
+        message = f"No cassette recording for {request.method} {request.url.path} ({fingerprint[:12]}) in {self.path}"
+        return httpx.Response(400, json={"error": {"message": message, "type": "cassette_miss"}}, request=request)
+
+    def _response(self, entry, stream):
+        return httpx.Response(entry["status"], headers=entry["headers"], stream=stream)
+
+    def handle(self, request, send):
+        """Answer ``request`` from the cassette, or through ``send`` (recording it)"""
+        fingerprint = request_fingerprint(request)
+        entry = self._lookup(fingerprint)
+        if entry is not None:
+            if self.timed:
+                time.sleep(entry["latency"])
+            return self._response(entry, _ReplayStream(entry, self.timed))
+        if self.mode == "replay":
+            return self._miss(request, fingerprint)
+        started = time.monotonic()
+        response = send(request)
+        response.stream = _RecordingStream(response.stream, _Recording(self, fingerprint, request, response, started))
+        return response
+
+    async def ahandle(self, request, send):
+        fingerprint = request_fingerprint(request)
+        entry = self._lookup(fingerprint)
+        if entry is not None:
+            if self.timed:
+                await asyncio.sleep(entry["latency"])
+            return self._response(entry, _AsyncReplayStream(entry, self.timed))
+        if self.mode == "replay":
+            return self._miss(request, fingerprint)
+        started = time.monotonic()
+        response = await send(request)
+        response.stream = _AsyncRecordingStream(response.stream,
+                                                _Recording(self, fingerprint, request, response, started))
+        return response
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """Return the process-wide cassette, or None when LLM_CASSETTE_MODE is "off" """
+    global _cassette
+    if LLM_CASSETTE_MODE == "off":
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette()
+        return _cassette
@@ -0,0 +1,151 @@
+"""
+Multi-turn chat over the subject engines
+"""
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from config.settings import (
+    CHAT_MEMORY_TOKEN_LIMIT,
+    CHAT_MEMORY_KEEP_TURNS,
+    CHAT_SUMMARY_MAX_TOKENS,
+    CHAT_CONDENSE_MAX_TOKENS,
+    CHAT_TOPIC_REUSE_THRESHOLD
+)
+from processors.compression import QuestionQuery
+from processors.llm_client import chat_completion
+from processors.prompts import build_condense_messages, build_memory_summary_messages
+from processors.retrieval import PrecomputedRetriever
+from processors.synthesis import count_tokens, get_synthesis_stats
+
+
+class ChatMemory:
+    """Conversation memory bounded in tokens.
+
+    Turns are kept verbatim until the memory exceeds ``token_limit``; the
+    oldest ones are then folded into a rolling summary by the LLM. The nodes
+    retrieved for the last new topic are kept so that follow-ups on the same
+    topic skip retrieval.
+    """
+
+    def __init__(self, scope=None, token_limit=CHAT_MEMORY_TOKEN_LIMIT, keep_turns=CHAT_MEMORY_KEEP_TURNS):
+        self.scope = scope
+        self.token_limit = token_limit
+        self.keep_turns = keep_turns
+        self.summary = ""
+        self.turns = []
+        self.query_embedding = None
+        self.retrieved_nodes = []
+
+    def tokens(self):
+        """Tokens of the summary and of the verbatim turns"""
+        return count_tokens(self.summary) + sum(turn["tokens"] for turn in self.turns)
+
+    def add_turn(self, question, standalone, answer):
+        self.turns.append({
+            "user": question,
+            "standalone": standalone,
+            "assistant": answer,
+            "tokens": count_tokens(question) + count_tokens(answer)
+        })
+
+    def compact(self, llm_model_name, language="fr"):
+        """Fold the oldest turns into the summary until the memory fits; returns the tokens spent"""
+        spent = 0
+        while self.tokens() > self.token_limit and len(self.turns) > 1:
+            # Keep the most recent turns verbatim when possible, and never the latest one
+            foldable = max(1, len(self.turns) - self.keep_turns)
+            excess = self.tokens() - self.token_limit
+            count, freed = 0, 0
+            while count < foldable and freed < excess:
+                freed += self.turns[count]["tokens"]
+                count += 1
+            response = chat_completion(
+                build_memory_summary_messages(self.summary, self.turns[:count], language),
+                model=llm_model_name,
+                temperature=0,
+                max_tokens=CHAT_SUMMARY_MAX_TOKENS
+            )
+            self.summary = (response.choices[0].message.content or "").strip()
+            del self.turns[:count]
+            spent += _usage_tokens(response)
+        return spent
+
+
+class _RecordingRetriever(BaseRetriever):
+    """Retrieve with another retriever and keep its results for later turns"""
+
+    def __init__(self, retriever):
+        super().__init__()
+        self._retriever = retriever
+        self.nodes = []
+
+    def _retrieve(self, query_bundle):
+        self.nodes = self._retriever.retrieve(query_bundle)
+        return list(self.nodes)
+
+
+def _usage_tokens(response):
+    usage = getattr(response, "usage", None)
+    return (usage.prompt_tokens + usage.completion_tokens) if usage else 0
+
+
+def _cosine(a, b):
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    return float(a @ b / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-12))
+
+
+def condense_question(memory, question, llm_model_name, language="fr"):
+    """Rewrite a follow-up as a standalone question; returns (question, tokens spent)"""
+    if not memory.turns and not memory.summary:
+        return question, 0
+    response = chat_completion(
+        build_condense_messages(memory.summary, memory.turns, question, language),
+        model=llm_model_name,
+        temperature=0,
+        max_tokens=CHAT_CONDENSE_MAX_TOKENS
+    )
+    standalone = (response.choices[0].message.content or "").strip()
+    return standalone or question, _usage_tokens(response)
+
+
+def start_chat_turn(memory, question, query_engine, embed_model, llm_model_name, language="fr"):
+    """Condense the question, retrieve (or reuse the topic's nodes) and start the answer.
+
+    Returns the engine response (streamed if the engine streams) and the
+    turn's usage; call ``finish_chat_turn`` once the answer has been read.
+    """
+    standalone, condense_tokens = condense_question(memory, question, llm_model_name, language)
+    embedding = embed_model.get_query_embedding(standalone)
+
+    # Same topic as the last retrieval: rerank and compress the same candidates for the new question
+    reuse = (memory.query_embedding is not None and bool(memory.retrieved_nodes)
+             and _cosine(embedding, memory.query_embedding) >= CHAT_TOPIC_REUSE_THRESHOLD)
+    if reuse:
+        retriever = PrecomputedRetriever({standalone: memory.retrieved_nodes})
+    else:
+        retriever = _RecordingRetriever(query_engine.retriever)
+
+    response = query_engine.with_retriever(retriever).query(QuestionQuery(query_str=standalone, embedding=list(embedding)))
+    if not reuse:
+        memory.retrieved_nodes = retriever.nodes
+        memory.query_embedding = embedding
+
+    usage = {
+        "standalone_question": standalone,
+        "retrieval": "reused" if reuse else "new",
+        "condense_tokens": condense_tokens,
+        "embedding_tokens": count_tokens(standalone),
+        # Filled in as the streamed answer is consumed
+        "synthesis": get_synthesis_stats(response),
+        "summary_tokens": 0
+    }
+    return response, usage
+
+
+def finish_chat_turn(memory, question, answer, usage, llm_model_name, language="fr"):
+    """Add the answered turn to memory and compact it; returns the completed usage"""
+    memory.add_turn(question, usage["standalone_question"], answer)
+    usage["summary_tokens"] = memory.compact(llm_model_name, language)
+    usage["memory_tokens"] = memory.tokens()
+    usage["memory_limit"] = memory.token_limit
+    return usage
@@ -0,0 +1,149 @@
+"""
+Query-aware extractive compression of retrieved context
+"""
+
+import re
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from config.settings import COMPRESSION_TOKEN_BUDGET, COMPRESSION_SENTENCE_WINDOW
+from processors.synthesis import count_tokens
+
+# Metadata keys written on compressed nodes; hidden from the LLM and the embedder
+COMPRESSION_METADATA_KEYS = ["original_tokens", "compressed_tokens", "compression_seconds"]
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class QuestionQuery(QueryBundle):
+    """A focused student question.
+
+    Only these queries are compressed: concept extraction and question
+    generation prompts ask for broad coverage and keep whole chunks.
+    """
+
+
+def _tokenize(text):
+    return [w for w in _WORD.findall(text.lower()) if len(w) > 1]
+
+
+def bm25_scores(query, sentences, k1=1.5, b=0.75):
+    """Score each sentence against the query with BM25 (IDF over the given sentences)"""
+    docs = [_tokenize(s) for s in sentences]
+    if not docs:
+        return []
+    avg_len = sum(len(d) for d in docs) / len(docs) or 1
+    doc_freq = Counter(term for d in docs for term in set(d))
+    query_terms = set(_tokenize(query))
+
+    scores = []
+    for doc in docs:
+        tf = Counter(doc)
+        score = 0.0
+        for term in query_terms:
+            if term not in tf:
+                continue
+            idf = math.log(1 + (len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf[term] * (k1 + 1) / (tf[term] + k1 * (1 - b + b * len(doc) / avg_len))
+        scores.append(score)
+    return scores
+
+
+class ExtractiveCompressor(BaseNodePostprocessor):
+    """Keep only the sentences of each node that best answer the question.
+
+    Sentences from all retrieved nodes are scored together with BM25, then the
+    best ones (with ``window`` neighbouring sentences on each side) are kept
+    until the token budget is spent. Every node keeps at least its best span so
+    the file and page citations shown in the QA tab are preserved.
+    """
+
+    token_budget: int = Field(default=COMPRESSION_TOKEN_BUDGET)
+    window: int = Field(default=COMPRESSION_SENTENCE_WINDOW)
+
+    @classmethod
+    def class_name(cls):
+        return "ExtractiveCompressor"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None):
+        if not nodes or not isinstance(query_bundle, QuestionQuery):
+            return nodes
+
+        start_time = time.time()
+        sentences = []  # (node index, sentence index, text)
+        for node_idx, node in enumerate(nodes):
+            node_sentences = [s for s in _SENTENCE_SPLIT.split(node.node.get_content()) if s.strip()]
+            for sent_idx, sentence in enumerate(node_sentences):
+                sentences.append((node_idx, sent_idx, sentence))
+        scores = bm25_scores(query_bundle.query_str, [s[2] for s in sentences])
+
+        by_node = {}
+        for (node_idx, sent_idx, text), score in zip(sentences, scores):
+            by_node.setdefault(node_idx, []).append((sent_idx, text, score))
+
+        # Best span of every node first (citations), then the rest by score
+        ranked = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
+        best_per_node = {}
+        for i in ranked:
+            best_per_node.setdefault(sentences[i][0], i)
+        forced = set(best_per_node.values())
+        order = list(best_per_node.values()) + [i for i in ranked if scores[i] > 0 and i not in forced]
+
+        kept = {node_idx: set() for node_idx in by_node}
+        used_tokens = 0
+        for i in order:
+            node_idx, sent_idx, _ = sentences[i]
+            span = [j for j in range(sent_idx - self.window, sent_idx + self.window + 1)
+                    if 0 <= j < len(by_node[node_idx]) and j not in kept[node_idx]]
+            span_tokens = sum(count_tokens(by_node[node_idx][j][1]) for j in span)
+            if used_tokens + span_tokens > self.token_budget and i not in forced:
+                continue
+            kept[node_idx].update(span)
+            used_tokens += span_tokens
+
+        compressed = []
+        for node_idx, node in enumerate(nodes):
+            if node_idx not in by_node:
+                continue
+            parts, previous = [], None
+            for sent_idx in sorted(kept[node_idx]):
+                if previous is not None and sent_idx != previous + 1:
+                    parts.append("…")
+                parts.append(by_node[node_idx][sent_idx][1])
+                previous = sent_idx
+            text = " ".join(parts)
+
+            new_node = node.node.model_copy(deep=True)
+            new_node.set_content(text)
+            new_node.metadata["original_tokens"] = count_tokens(node.node.get_content())
+            new_node.metadata["compressed_tokens"] = count_tokens(text)
+            for keys in (new_node.excluded_llm_metadata_keys, new_node.excluded_embed_metadata_keys):
+                keys.extend(k for k in COMPRESSION_METADATA_KEYS if k not in keys)
+            compressed.append(NodeWithScore(node=new_node, score=node.score))
+
+        if compressed:
+            # Recorded once per query, on the first node
+            compressed[0].node.metadata["compression_seconds"] = round(time.time() - start_time, 4)
+        return compressed
+
+
+def get_compression_stats(source_nodes):
+    """Summarize how much the retrieved context was compressed, or None if it was not"""
+    original = sum(n.node.metadata.get("original_tokens", 0) for n in source_nodes)
+    compressed = sum(n.node.metadata.get("compressed_tokens", 0) for n in source_nodes)
+    if not original:
+        return None
+    return {
+        "original_tokens": original,
+        "compressed_tokens": compressed,
+        "ratio": compressed / original,
+        "seconds": sum(n.node.metadata.get("compression_seconds", 0) for n in source_nodes)
+    }
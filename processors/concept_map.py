@@ -0,0 +1,159 @@
+"""
+Precomputed concept map built in the background after ingestion
+"""
+
+import os
+import json
+import time
+import threading
+
+from config.settings import PERSIST_DIR, CONCEPT_MAP_FILE, CONCEPT_MAP_MAX_CHUNKS, CONCEPT_MAP_MIN_TOPIC_MATCHES
+from config.subjects_en import SUBJECT_NAMES_EN, SUBJECT_KEYS_FR
+from processors.concept_mapreduce import ConceptMapReducer, load_corpus_nodes
+from processors.question_parser import normalize_stem
+from processors.scheduler import current_request_context, request_context
+
+# Build state per (index generation, canonical subject): {"state": "running" | "done" | "error", "error": str}
+_builds = {}
+_builds_lock = threading.Lock()
+
+
+def canonical_subject(subject):
+    """French sidebar key of a subject given in either language, so maps compare across languages"""
+    english = SUBJECT_NAMES_EN.get(subject.lower(), subject.lower())
+    return SUBJECT_KEYS_FR.get(english, subject.lower())
+
+
+def locate_concept(concept, nodes, max_chunks=CONCEPT_MAP_MAX_CHUNKS):
+    """Find the chunks, files and pages whose text mentions a concept"""
+    name = f" {normalize_stem(concept['name'])} "
+    chunks, files, pages = [], [], []
+    for node in nodes:
+        if name not in f" {normalize_stem(node.get_content())} ":
+            continue
+        if len(chunks) < max_chunks:
+            chunks.append(node.node_id)
+        file_name = node.metadata.get("file_name")
+        if file_name and file_name not in files:
+            files.append(file_name)
+        # Only loaders that split per page provide a page label
+        page = node.metadata.get("page_label")
+        if page and page not in pages:
+            pages.append(page)
+    return {"chunks": chunks, "files": files or list(concept["documents"]), "pages": pages}
+
+
+def build_concept_map(llm, subject, generation, persist_dir=PERSIST_DIR):
+    """Build the French and English concept maps of the persisted index and save them"""
+    subject = canonical_subject(subject)
+    documents = load_corpus_nodes(persist_dir)
+    all_nodes = [node for nodes in documents.values() for node in nodes]
+
+    languages = {}
+    for language, language_subject in (("fr", subject), ("en", SUBJECT_NAMES_EN[subject] if subject in SUBJECT_NAMES_EN else subject)):
+        extractor = ConceptMapReducer(llm, language_subject, language, persist_dir=persist_dir)
+        candidates = extractor.extract(documents)
+        markdown = "".join(extractor.stream_final(candidates))
+        concepts = []
+        for candidate in candidates:
+            concept = {"name": candidate["name"], "definition": candidate["definition"], "score": candidate["score"]}
+            concept.update(locate_concept(candidate, all_nodes))
+            concepts.append(concept)
+        languages[language] = {"subject": language_subject, "markdown": markdown, "concepts": concepts,
+                               "stats": extractor.stats}
+
+    concept_map = {"generation": generation, "subject": subject, "built": time.time(), "languages": languages}
+    path = os.path.join(persist_dir, CONCEPT_MAP_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(concept_map, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return concept_map
+
+
+def start_concept_map_build(llm, subject, generation, persist_dir=PERSIST_DIR):
+    """Build the concept map in a background thread; returns False if one is already running"""
+    # A subject change keeps the index generation but needs its own map
+    key = (generation, canonical_subject(subject))
+    with _builds_lock:
+        if _builds.get(key, {}).get("state") == "running":
+            return False
+        _builds[key] = {"state": "running", "error": None}
+
+    _, session_id = current_request_context()
+
+    def run():
+        try:
+            # Background work: queued behind every interactive request
+            with request_context("ingestion", session_id):
+                build_concept_map(llm, subject, generation, persist_dir)
+            status = {"state": "done", "error": None}
+        except Exception as e:
+            status = {"state": "error", "error": str(e)}
+        with _builds_lock:
+            _builds[key] = status
+
+    threading.Thread(target=run, name=f"concept-map-{generation}", daemon=True).start()
+    return True
+
+
+def get_concept_map_status(generation, subject):
+    """Return the background build state for a generation and subject, or None if none was started"""
+    key = (generation, canonical_subject(subject))
+    with _builds_lock:
+        return dict(_builds[key]) if key in _builds else None
+
+
+def load_concept_map(generation, persist_dir=PERSIST_DIR, subject=None):
+    """Load the concept map of the given index generation, or None if it is missing or stale.
+
+    With ``subject``, a map built for another subject counts as stale too.
+    """
+    try:
+        with open(os.path.join(persist_dir, CONCEPT_MAP_FILE), "r", encoding="utf-8") as f:
+            concept_map = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not generation or concept_map.get("generation") != generation:
+        return None
+    if subject is not None and canonical_subject(concept_map.get("subject", "")) != canonical_subject(subject):
+        return None
+    return concept_map
+
+
+def find_concepts(concept_map, language, topic, min_matches=CONCEPT_MAP_MIN_TOPIC_MATCHES, max_concepts=10):
+    """Return the mapped concepts related to a topic, or [] when the map does not cover it"""
+    topic_terms = {term for term in normalize_stem(topic).split() if len(term) > 2}
+    if not topic_terms or language not in concept_map.get("languages", {}):
+        return []
+
+    matches = []
+    for concept in concept_map["languages"][language]["concepts"]:
+        name_terms = set(normalize_stem(concept["name"]).split())
+        definition_terms = set(normalize_stem(concept["definition"]).split())
+        # Name matches weigh more than definition matches
+        score = 2 * len(topic_terms & name_terms) + len(topic_terms & definition_terms)
+        if score:
+            matches.append((score, concept["score"], concept))
+    if len(matches) < min_matches:
+        return []
+    matches.sort(key=lambda m: (m[0], m[1]), reverse=True)
+    return [concept for _, _, concept in matches[:max_concepts]]
+
+
+def render_concepts(concepts, subject, topic, language="fr"):
+    """Render mapped concepts in the markdown layout of the topic concept prompt"""
+    if language == "fr":
+        lines = [f"### Concepts clés en {subject.capitalize()} : {topic}", ""]
+        separator = " :"
+    else:
+        lines = [f"### Key Concepts in {subject.capitalize()}: {topic}", ""]
+        separator = ":"
+    for i, concept in enumerate(concepts, start=1):
+        lines.append(f"{i}. **{concept['name']}**{separator} {concept['definition']}")
+        if concept["files"]:
+            sources = ", ".join(concept["files"])
+            if concept["pages"]:
+                sources += f" (p. {', '.join(str(p) for p in concept['pages'])})"
+            lines.append(f"   - **Sources**{separator} {sources}")
+        lines.append("")
+    return "\n".join(lines)
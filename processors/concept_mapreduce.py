@@ -0,0 +1,293 @@
+"""
+Map-reduce concept extraction over the whole corpus
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+from llama_index.core.async_utils import asyncio_run, run_jobs
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from config.settings import (
+    PERSIST_DIR,
+    CONCEPT_PARTIALS_FILE,
+    CONCEPT_SECTION_TOKENS,
+    CONCEPT_MAP_CONCURRENCY,
+    CONCEPT_CONCEPTS_PER_SECTION,
+    CONCEPT_REDUCE_TOKEN_BUDGET
+)
+from processors.concept_extractor import get_concept_extraction_prompt
+from processors.question_parser import normalize_stem
+from processors.synthesis import count_tokens
+
+# Bump when the map prompt or the partial format changes so old partials are ignored
+MAP_PROMPT_VERSION = 1
+
+_partials_lock = threading.Lock()
+
+
+def load_corpus_nodes(persist_dir=PERSIST_DIR):
+    """Return the persisted nodes grouped per source document, in document order"""
+    docstore = SimpleDocumentStore.from_persist_dir(persist_dir)
+    documents = {}
+    for node in docstore.docs.values():
+        documents.setdefault(node.ref_doc_id or node.node_id, []).append(node)
+    for nodes in documents.values():
+        nodes.sort(key=lambda n: n.start_char_idx or 0)
+    return documents
+
+
+def split_sections(nodes, max_tokens=CONCEPT_SECTION_TOKENS):
+    """Pack consecutive nodes of one document into sections under a token budget"""
+    sections, current, current_tokens = [], [], 0
+    for node in nodes:
+        text = node.get_content().strip()
+        tokens = count_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            sections.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+
+def get_map_prompt(section, subject, language="fr", max_concepts=CONCEPT_CONCEPTS_PER_SECTION):
+    """Prompt listing the main concepts of one document section, one per line"""
+    if language == "fr":
+        return f"""
+Listez au plus {max_concepts} concepts {subject} importants présents dans cet extrait de cours.
+Une ligne par concept, EXACTEMENT au format :
+Nom du concept | Définition en une phrase | Importance de 1 à 5
+
+Extrait :
+{section}
+"""
+    return f"""
+List at most {max_concepts} important {subject} concepts found in this course excerpt.
+One line per concept, EXACTLY in the format:
+Concept name | One-sentence definition | Importance from 1 to 5
+
+Excerpt:
+{section}
+"""
+
+
+def get_reduce_prompt(candidates, subject, language="fr", max_concepts=CONCEPT_CONCEPTS_PER_SECTION):
+    """Prompt consolidating a group of candidate concepts (synonyms merged) in the map format"""
+    if language == "fr":
+        return f"""
+Voici des concepts {subject} extraits de différentes parties d'un cours.
+Fusionnez les doublons et synonymes, puis gardez les {max_concepts} plus importants.
+Une ligne par concept, EXACTEMENT au format :
+Nom du concept | Définition en une phrase | Importance de 1 à 5
+
+Concepts :
+{format_candidates(candidates)}
+"""
+    return f"""
+Here are {subject} concepts extracted from different parts of a course.
+Merge duplicates and synonyms, then keep the {max_concepts} most important ones.
+One line per concept, EXACTLY in the format:
+Concept name | One-sentence definition | Importance from 1 to 5
+
+Concepts:
+{format_candidates(candidates)}
+"""
+
+
+def parse_concept_lines(text, document=None):
+    """Parse "name | definition | importance" lines into concept dicts"""
+    concepts = []
+    for line in text.splitlines():
+        parts = [p.strip(" -*\t") for p in line.split("|")]
+        if len(parts) < 2 or not parts[0]:
+            continue
+        try:
+            importance = float(parts[2]) if len(parts) > 2 else 1.0
+        except ValueError:
+            importance = 1.0
+        concepts.append({
+            "name": parts[0],
+            "definition": parts[1],
+            "score": min(max(importance, 0.0), 5.0),
+            "documents": [document] if document else []
+        })
+    return concepts
+
+
+def merge_concepts(concept_lists):
+    """Merge concepts by normalized name; scores add up and documents are unioned.
+
+    The result is ranked by the number of documents mentioning a concept, then
+    by its accumulated importance.
+    """
+    merged = {}
+    for concepts in concept_lists:
+        for concept in concepts:
+            key = normalize_stem(concept["name"])
+            if not key:
+                continue
+            if key not in merged:
+                merged[key] = {"name": concept["name"], "definition": concept["definition"],
+                               "score": 0.0, "documents": []}
+            entry = merged[key]
+            entry["score"] += concept["score"]
+            if len(concept["definition"]) > len(entry["definition"]):
+                entry["definition"] = concept["definition"]
+            entry["documents"].extend(d for d in concept["documents"] if d not in entry["documents"])
+    return sorted(merged.values(), key=lambda c: (len(c["documents"]), c["score"]), reverse=True)
+
+
+def format_candidates(concepts):
+    """Render concepts back to the "name | definition | importance" line format"""
+    return "\n".join(f"{c['name']} | {c['definition']} | {c['score']:g}" for c in concepts)
+
+
+class ConceptMapReducer:
+    """Extract the key concepts of a whole corpus with a map-reduce over its sections.
+
+    Map: every document section is asked for its concepts, with at most
+    ``concurrency`` LLM calls in flight. The merged concepts of a document are
+    cached on disk under a hash of its content, so re-indexing after adding a
+    file only maps the new file. Reduce: candidates are merged by name and, while
+    the list is too long for one prompt, consolidated group by group by the LLM.
+    The final call formats the ranked candidates with the usual concept prompt.
+    """
+
+    def __init__(self, llm, subject, language="fr", persist_dir=PERSIST_DIR,
+                 concurrency=CONCEPT_MAP_CONCURRENCY, reduce_token_budget=CONCEPT_REDUCE_TOKEN_BUDGET):
+        self.llm = llm
+        self.subject = subject
+        self.language = language
+        self.persist_dir = persist_dir
+        self.concurrency = concurrency
+        self.reduce_token_budget = reduce_token_budget
+        self.stats = {"documents": 0, "cached_documents": 0, "sections": 0, "llm_calls": 0, "reduce_levels": 0}
+
+    @property
+    def _partials_path(self):
+        return os.path.join(self.persist_dir, CONCEPT_PARTIALS_FILE)
+
+    def _variant(self):
+        model = getattr(self.llm, "model", type(self.llm).__name__)
+        return f"v{MAP_PROMPT_VERSION}|{self.subject}|{self.language}|{model}"
+
+    def _load_partials(self):
+        try:
+            with open(self._partials_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_partials(self, partials):
+        tmp_path = self._partials_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(partials, f, ensure_ascii=False)
+        os.replace(tmp_path, self._partials_path)
+
+    async def _run(self, prompts):
+        jobs = [self.llm.acomplete(prompt) for prompt in prompts]
+        responses = await run_jobs(jobs, workers=self.concurrency)
+        self.stats["llm_calls"] += len(prompts)
+        return [response.text for response in responses]
+
+    def map_documents(self, documents):
+        """Return the merged concepts of every document, mapping only uncached ones"""
+        variant = self._variant()
+        with _partials_lock:
+            partials = self._load_partials()
+
+        doc_hashes, pending = {}, []  # pending: (doc hash, file name, section)
+        for doc_id, nodes in documents.items():
+            file_name = nodes[0].metadata.get("file_name", doc_id)
+            content = "\n\n".join(node.get_content() for node in nodes)
+            doc_hash = hashlib.sha1(content.encode("utf-8")).hexdigest()
+            doc_hashes[doc_hash] = file_name
+            if variant in partials.get(doc_hash, {}):
+                self.stats["cached_documents"] += 1
+                continue
+            for section in split_sections(nodes):
+                pending.append((doc_hash, file_name, section))
+        self.stats["documents"] = len(doc_hashes)
+        self.stats["sections"] = len(pending)
+
+        if pending:
+            outputs = asyncio_run(self._run(
+                [get_map_prompt(section, self.subject, self.language) for _, _, section in pending]
+            ))
+            by_doc = {}
+            for (doc_hash, file_name, _), output in zip(pending, outputs):
+                by_doc.setdefault(doc_hash, []).append(parse_concept_lines(output, file_name))
+            with _partials_lock:
+                # Re-read so partials written by another session are kept
+                partials = self._load_partials()
+                for doc_hash, concept_lists in by_doc.items():
+                    partials.setdefault(doc_hash, {})[variant] = merge_concepts(concept_lists)
+                # Documents that are no longer indexed are dropped
+                partials = {h: v for h, v in partials.items() if h in doc_hashes}
+                self._save_partials(partials)
+
+        return [partials[doc_hash][variant] for doc_hash in doc_hashes if variant in partials.get(doc_hash, {})]
+
+    def reduce(self, concept_lists):
+        """Merge per-document concepts, consolidating with the LLM until they fit one prompt"""
+        candidates = merge_concepts(concept_lists)
+        while count_tokens(format_candidates(candidates)) > self.reduce_token_budget:
+            groups, group, group_tokens = [], [], 0
+            for concept in candidates:
+                tokens = count_tokens(format_candidates([concept]))
+                if group and group_tokens + tokens > self.reduce_token_budget:
+                    groups.append(group)
+                    group, group_tokens = [], 0
+                group.append(concept)
+                group_tokens += tokens
+            groups.append(group)
+            if len(groups) == 1:
+                break
+            outputs = asyncio_run(self._run(
+                [get_reduce_prompt(group, self.subject, self.language) for group in groups]
+            ))
+            # Document attribution survives the LLM consolidation through the name lookup
+            documents_by_name = {normalize_stem(c["name"]): c["documents"] for c in candidates}
+            reduced = []
+            for output in outputs:
+                concepts = parse_concept_lines(output)
+                for concept in concepts:
+                    concept["documents"] = documents_by_name.get(normalize_stem(concept["name"]), [])
+                reduced.append(concepts)
+            next_candidates = merge_concepts(reduced)
+            self.stats["reduce_levels"] += 1
+            if len(next_candidates) >= len(candidates):
+                break
+            candidates = next_candidates
+        return candidates
+
+    def get_final_prompt(self, candidates):
+        """The whole-document concept prompt, grounded on the ranked candidates"""
+        prompt = get_concept_extraction_prompt("", self.subject, self.language)
+        if self.language == "fr":
+            header = "Concepts candidats extraits de tous les documents (les plus importants d'abord) :"
+        else:
+            header = "Candidate concepts extracted from all documents (most important first):"
+        return f"{prompt}\n{header}\n{format_candidates(candidates)}\n"
+
+    def extract(self, documents=None):
+        """Run the map and reduce stages and return the ranked candidate concepts"""
+        if documents is None:
+            documents = load_corpus_nodes(self.persist_dir)
+        candidates = self.reduce(self.map_documents(documents))
+        self.stats["candidates"] = len(candidates)
+        return candidates
+
+    def stream_final(self, candidates):
+        """Stream the final formatted concepts for ranked candidates"""
+        self.stats["llm_calls"] += 1
+        for chunk in self.llm.stream_complete(self.get_final_prompt(candidates)):
+            yield chunk.delta or ""
+
+    def stream(self, documents=None):
+        """Run the map and reduce stages, then stream the final formatted concepts"""
+        yield from self.stream_final(self.extract(documents))
@@ -5,13 +5,21 @@ Document processing utilities
 import os
 import json
 import time
+import uuid
+import hashlib
 import streamlit as st
 from pathlib import Path
 from llama_index.core import (
     VectorStoreIndex,
     Document
 )
+from llama_index.core.constants import DEFAULT_CHUNK_OVERLAP
 from config.settings import PERSIST_DIR
+from processors.answer_cache import get_answer_cache
+from processors.question_bank import get_question_bank
+
+# Bump when extraction or cleaning changes the text that gets embedded
+EXTRACTOR_VERSION = 1
 
 
 def load_pdf_with_fallback(file_path):
@@ -49,35 +57,70 @@ def load_pdf_with_fallback(file_path):
     return []
 
 
-def process_documents(paths, embed_model):
-    """Process documents from file paths"""
-    try:
+def extract_file(file_path):
+    """Extract the documents of one PDF, DOCX or TXT file (an empty list for other types)"""
+    suffix = Path(file_path).suffix.lower()
+    file_path = str(file_path)
+    if suffix == ".pdf":
+        return load_pdf_with_fallback(file_path)
+    if suffix == ".docx":
         from docx import Document as DocxDocument
-        
-        # Configure file extractors
-        file_extractor = {
-            ".pdf": load_pdf_with_fallback,
-            ".docx": lambda f: [Document(text="\n".join([p.text for p in DocxDocument(f).paragraphs]), 
-                               metadata={"file_name": os.path.basename(f)})],
-            ".txt": lambda f: [Document(text=open(f, 'r', encoding='utf-8').read(), 
-                              metadata={"file_name": os.path.basename(f)})]
-        }
-        
+        return [Document(text="\n".join([p.text for p in DocxDocument(file_path).paragraphs]),
+                         metadata={"file_name": os.path.basename(file_path)})]
+    if suffix == ".txt":
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return [Document(text=f.read(), metadata={"file_name": os.path.basename(file_path)})]
+    return []
+
+
+def clean_documents(documents):
+    """Normalize whitespace and drop documents with almost no text"""
+    valid_docs = []
+    for doc in documents:
+        clean_text = ' '.join(doc.text.strip().split())
+        if len(clean_text) > 50:
+            new_doc = Document(text=clean_text, metadata=doc.metadata)
+            valid_docs.append(new_doc)
+    return valid_docs
+
+
+def compute_index_version(paths, embed_model_name, chunk_size, chunk_overlap=DEFAULT_CHUNK_OVERLAP):
+    """Identity of the vectors built from ``paths``.
+
+    Only what changes the embedded chunks is part of it: file names and
+    contents, the extractor version, chunking parameters and the embedding
+    model. Subject and language only change the prompts of the engines built
+    on the index, so switching them reuses the same vectors.
+    """
+    digest = hashlib.sha256()
+    for file_path in sorted(set(paths), key=os.path.basename):
+        if not os.path.exists(file_path):
+            continue
+        digest.update(os.path.basename(file_path).encode("utf-8") + b"\0")
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(b"\0")
+    digest.update(json.dumps({
+        "extractor": EXTRACTOR_VERSION,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embed_model": embed_model_name
+    }, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def process_documents(paths, embed_model, transformations=None):
+    """Process documents from file paths; ``transformations`` default to the global Settings (chunk size)"""
+    try:
         documents = []
         for file_path in paths:
-            suffix = Path(file_path).suffix.lower()
-            if suffix in file_extractor:
-                docs = file_extractor[suffix](str(file_path))
-                if docs:
-                    documents.extend(docs)
+            docs = extract_file(file_path)
+            if docs:
+                documents.extend(docs)
         
         # Validate documents
-        valid_docs = []
-        for doc in documents:
-            clean_text = ' '.join(doc.text.strip().split())
-            if len(clean_text) > 50:
-                new_doc = Document(text=clean_text, metadata=doc.metadata)
-                valid_docs.append(new_doc)
+        valid_docs = clean_documents(documents)
         
         if not valid_docs:
             return None
@@ -86,7 +129,8 @@ def process_documents(paths, embed_model):
         index = VectorStoreIndex.from_documents(
             valid_docs,
             show_progress=True,
-            embed_model=embed_model
+            embed_model=embed_model,
+            transformations=transformations
         )
         
         return index, valid_docs
@@ -97,13 +141,19 @@ def process_documents(paths, embed_model):
         return None, []
 
 
-def save_index(index, embed_model_name, llm_model_name, chunk_size, subject, language, valid_docs):
-    """Save index and metadata"""
+def save_index(index, embed_model_name, llm_model_name, chunk_size, subject, language, valid_docs, persist_dir=PERSIST_DIR,
+               index_version=None):
+    """Save index and metadata; returns the new index generation"""
     # Save index
-    index.storage_context.persist(persist_dir=PERSIST_DIR)
+    index.storage_context.persist(persist_dir=persist_dir)
     
+    # Every rebuild gets a new generation so cached answers from the previous index are dropped
+    generation = uuid.uuid4().hex[:12]
+
     # Store metadata
     metadata = {
+        "generation": generation,
+        "index_version": index_version,
         "embed_model": embed_model_name,
         "llm_model": llm_model_name,
         "chunk_size": chunk_size,
@@ -113,7 +163,42 @@ def save_index(index, embed_model_name, llm_model_name, chunk_size, subject, lan
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
     }
     
-    with open(os.path.join(PERSIST_DIR, "metadata.json"), "w") as f:
+    with open(os.path.join(persist_dir, "metadata.json"), "w") as f:
         json.dump(metadata, f)
     
-    return True
+    # The process-wide answer cache and question bank belong to the app's own index
+    if persist_dir == PERSIST_DIR:
+        get_answer_cache().invalidate(generation)
+        get_question_bank().purge_other_generations(generation)
+    
+    return generation
+
+
+def load_index_metadata(persist_dir=PERSIST_DIR):
+    """Return the metadata of the persisted index, or None if there is none"""
+    metadata_path = os.path.join(persist_dir, "metadata.json")
+    if not os.path.exists(metadata_path):
+        return None
+    try:
+        with open(metadata_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def update_index_metadata(persist_dir=PERSIST_DIR, **fields):
+    """Update prompt settings (subject, language, LLM) stored next to an index without rebuilding it"""
+    metadata = load_index_metadata(persist_dir)
+    if metadata is None:
+        return
+    metadata.update(fields)
+    metadata_path = os.path.join(persist_dir, "metadata.json")
+    with open(metadata_path + ".tmp", "w") as f:
+        json.dump(metadata, f)
+    os.replace(metadata_path + ".tmp", metadata_path)
+
+
+def get_index_generation(persist_dir=PERSIST_DIR):
+    """Return the generation id of the persisted index, or None if there is none"""
+    metadata = load_index_metadata(persist_dir)
+    return metadata.get("generation") if metadata else None
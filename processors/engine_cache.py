@@ -0,0 +1,95 @@
+"""
+Process-wide cache of the opened index and its query engines
+
+Sessions keep references to these shared objects instead of building their own
+copy of the index and engine. Each object is built once per process (concurrent
+sessions asking for the same one wait for a single build) and only the current
+index generation of a storage directory is kept.
+"""
+
+import os
+import threading
+
+from config.settings import PERSIST_DIR
+from processors.single_flight import get_single_flight
+
+_indexes = {}  # (persist_dir, generation) -> index
+_engines = {}  # (persist_dir, generation, subject, language, llm_model) -> query engine
+_lock = threading.Lock()
+
+
+def _drop_other_generations(persist_dir, generation):
+    for cache in (_indexes, _engines):
+        for key in [key for key in cache if key[0] == persist_dir and key[1] != generation]:
+            del cache[key]
+
+
+def _shared(cache, key, build):
+    with _lock:
+        if key in cache:
+            return cache[key]
+    value = get_single_flight().do(("engine_cache",) + key, build)
+    with _lock:
+        _drop_other_generations(key[0], key[1])
+        return cache.setdefault(key, value)
+
+
+def share_index(index, generation, persist_dir=PERSIST_DIR):
+    """Make a freshly built index the shared one for its generation"""
+    persist_dir = os.path.abspath(persist_dir)
+    with _lock:
+        _drop_other_generations(persist_dir, generation)
+        _indexes[(persist_dir, generation)] = index
+    return index
+
+
+def get_shared_index(generation, embed_model=None, persist_dir=PERSIST_DIR):
+    """Return the index persisted for ``generation``, loading it once per process"""
+    persist_dir = os.path.abspath(persist_dir)
+
+    def load():
+        from llama_index.core import StorageContext, load_index_from_storage
+        storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+        return load_index_from_storage(storage_context, embed_model=embed_model)
+
+    return _shared(_indexes, (persist_dir, generation), load)
+
+
+def get_shared_engine(index, generation, subject, language, llm_model_name, persist_dir=PERSIST_DIR):
+    """Return the subject query engine over ``index``, built once per process"""
+    persist_dir = os.path.abspath(persist_dir)
+
+    def build():
+        from processors.llm_client import get_llm
+        from processors.indexing import create_french_subject_engine, create_english_subject_engine
+        llm = get_llm(llm_model_name)
+        if language == "fr":
+            query_engine = create_french_subject_engine(index, subject, llm)
+        else:
+            query_engine = create_english_subject_engine(index, subject, llm)
+        # Include the document source in responses
+        query_engine.include_source_metadata = True
+        return query_engine
+
+    return _shared(_engines, (persist_dir, generation, subject, language, llm_model_name), build)
+
+
+def clear_shared_engines(persist_dir=PERSIST_DIR):
+    """Forget the index and engines of a storage directory, e.g. when it is deleted"""
+    persist_dir = os.path.abspath(persist_dir)
+    with _lock:
+        for cache in (_indexes, _engines):
+            for key in [key for key in cache if key[0] == persist_dir]:
+                del cache[key]
+
+
+def shared_object_ids():
+    """Ids of the cached objects, counted once per process rather than per session"""
+    with _lock:
+        return {id(value) for cache in (_indexes, _engines) for value in cache.values()}
+
+
+def get_engine_cache_stats():
+    """Number of shared indexes and engines currently held"""
+    with _lock:
+        return {"indexes": len(_indexes), "engines": len(_engines)}
@@ -14,89 +14,58 @@ from llama_index.core import (
     Document
 )
 from llama_index.core import Settings
-from config.settings import PERSIST_DIR
-from config.subjects import SUBJECT_CONFIGS_FR
-from config.subjects_en import SUBJECT_CONFIGS_EN
-
-
-def create_french_subject_engine(index, subject, llm):
-    """Create a query engine specialized for a specific subject in French"""
-    config = SUBJECT_CONFIGS_FR.get(subject.lower(), SUBJECT_CONFIGS_FR['économie'])
-    
-    system_prompt = f"""
-Vous êtes un assistant pédagogique expert en {subject} aidant avec des supports de cours universitaires.
-Votre objectif est de fournir des réponses précises, concises et bien structurées STRICTEMENT basées sur les documents fournis.
-
-SPÉCIALISATION : {subject.upper()}
-{config['guidance']}
+from llama_index.core.query_engine import RetrieverQueryEngine
+from config.settings import (
+    PERSIST_DIR,
+    SIMILARITY_TOP_K,
+    RERANK_MODE,
+    RERANK_CANDIDATES,
+    COMPRESSION_ENABLED
+)
+from processors.synthesis import AdaptiveSynthesizer
+from processors.postprocessors import build_rerank_postprocessors
+from processors.compression import ExtractiveCompressor
+from processors.prompts import get_subject_system_prompt
 
-RÈGLES DE RÉPONSE :
-1. Pour les concepts : Fournissez des définitions, exemples et caractéristiques clés
-2. Pour les procédures : Listez les étapes sous forme numérotée
-3. Pour les comparaisons : Utilisez des tableaux ou des listes à puces
-4. Pour les calculs : Montrez les formules et le détail étape par étape
-5. N'INVENTEZ JAMAIS d'information non présente dans les documents
-6. Si incertain : Dites clairement "Ce sujet n'est pas couvert dans les documents fournis."
 
-FORMATAGE :
-- Utilisez Markdown pour un formatage clair
-- Mettez en gras les termes importants
-- Utilisez des listes à puces
-- Utilisez des tableaux pour les comparaisons
-- Incluez des exemples spécifiques à {subject}
+def build_subject_engine(index, llm, system_prompt, streaming=True, rerank_mode=RERANK_MODE, compress=COMPRESSION_ENABLED,
+                         retriever=None):
+    """Assemble the retriever, rerankers, compressor and the adaptive synthesizer into a query engine.
 
-EXEMPLES :
-{config['examples']}
-"""
+    ``retriever`` replaces the index retriever, e.g. with precomputed batch results.
+    """
+    node_postprocessors = build_rerank_postprocessors(index, rerank_mode)
+    
+    # Over-retrieve when a reranker will trim the candidates back down
+    top_k = RERANK_CANDIDATES if node_postprocessors else SIMILARITY_TOP_K
     
-    return index.as_query_engine(
-        similarity_top_k=6,
-        response_mode="tree_summarize",
-        streaming=False,
-        verbose=True,
+    # Compression runs last so it only reads the chunks that survived reranking
+    if compress:
+        node_postprocessors.append(ExtractiveCompressor())
+    if retriever is None:
+        retriever = index.as_retriever(similarity_top_k=top_k)
+    synthesizer = AdaptiveSynthesizer(
         llm=llm,
-        system_prompt=system_prompt
+        system_prompt=system_prompt,
+        streaming=streaming
+    )
+    return RetrieverQueryEngine(
+        retriever=retriever,
+        response_synthesizer=synthesizer,
+        node_postprocessors=node_postprocessors
     )
 
 
-def create_english_subject_engine(index, subject, llm):
-    """Create a query engine specialized for a specific subject in English"""
-    config = SUBJECT_CONFIGS_EN.get(subject.lower(), SUBJECT_CONFIGS_EN['economics'])
-    
-    system_prompt = f"""
-You are an expert teaching assistant in {subject} helping with university course materials.
-Your goal is to provide accurate, concise, and well-structured answers STRICTLY based on the provided documents.
-
-SPECIALIZATION: {subject.upper()}
-{config['guidance']}
-
-RESPONSE RULES:
-1. For concepts: Provide definitions, examples, and key characteristics
-2. For procedures: List the steps in numbered form
-3. For comparisons: Use tables or bullet points
-4. For calculations: Show the formulas and step-by-step details
-5. NEVER make up information not present in the documents
-6. If uncertain: Clearly state "This topic is not covered in the provided documents."
+def create_french_subject_engine(index, subject, llm, streaming=True, **engine_options):
+    """Create a query engine specialized for a specific subject in French"""
+    system_prompt = get_subject_system_prompt(subject, "fr")
+    return build_subject_engine(index, llm, system_prompt, streaming, **engine_options)
 
-FORMATTING:
-- Use Markdown for clear formatting
-- Bold important terms
-- Use bullet points
-- Use tables for comparisons
-- Include examples specific to {subject}
 
-EXAMPLES:
-{config['examples']}
-"""
-    
-    return index.as_query_engine(
-        similarity_top_k=6,
-        response_mode="tree_summarize",
-        streaming=False,
-        verbose=True,
-        llm=llm,
-        system_prompt=system_prompt
-    )
+def create_english_subject_engine(index, subject, llm, streaming=True, **engine_options):
+    """Create a query engine specialized for a specific subject in English"""
+    system_prompt = get_subject_system_prompt(subject, "en")
+    return build_subject_engine(index, llm, system_prompt, streaming, **engine_options)
 
 
 def load_or_create_index(embed_model, subject, language, model_changed):
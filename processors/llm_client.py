@@ -0,0 +1,540 @@
+"""
+Shared OpenAI client layer: pooled connections, retries, hedging and metrics
+"""
+
+import json
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import httpx
+import openai
+from llama_index.core.callbacks import CallbackManager, CBEventType, EventPayload
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.llms.openai import OpenAI
+from llama_index.embeddings.openai import OpenAIEmbedding
+from config.settings import (
+    OPENAI_BASE_URL,
+    LLM_TIMEOUT_SECONDS,
+    LLM_CONNECT_TIMEOUT_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    LLM_POOL_MAX_CONNECTIONS,
+    LLM_POOL_MAX_KEEPALIVE,
+    LLM_POOL_KEEPALIVE_EXPIRY,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_SAMPLES,
+    SCHEDULER_NESTED_CLASS
+)
+from processors.scheduler import get_scheduler
+from processors.cassette import get_cassette
+
+# Errors worth another attempt; anything else (bad request, auth, ...) is raised at once
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError
+)
+
+
+class LLMMetrics:
+    """Thread-safe counters for requests, connection reuse, retries and hedges"""
+
+    def __init__(self, latency_window=200):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self.counters = {
+            "http_requests": 0,
+            "new_connections": 0,
+            "calls": 0,
+            "retries": 0,
+            "errors": 0,
+            "hedges_sent": 0,
+            "hedges_won": 0,
+            "prompt_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "completion_tokens": 0
+        }
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe_usage(self, usage):
+        """Record the token usage reported by the API, including cached prompt tokens"""
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+            details = usage.get("prompt_tokens_details") or {}
+            cached = details.get("cached_tokens") if isinstance(details, dict) else None
+        else:
+            prompt, completion = getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+            cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+        with self._lock:
+            self.counters["prompt_tokens"] += prompt or 0
+            self.counters["cached_prompt_tokens"] += cached or 0
+            self.counters["completion_tokens"] += completion or 0
+
+    def observe_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def latency_percentile(self, percentile):
+        """Latency at the given percentile of recent calls, or None with too few samples"""
+        with self._lock:
+            if len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def snapshot(self):
+        """Counters plus derived connection reuse ratio and latency percentiles"""
+        with self._lock:
+            stats = dict(self.counters)
+            ordered = sorted(self._latencies)
+        requests = stats["http_requests"]
+        stats["reused_connections"] = max(requests - stats["new_connections"], 0)
+        stats["connection_reuse_ratio"] = stats["reused_connections"] / requests if requests else None
+        prompt_tokens = stats["prompt_tokens"]
+        stats["cached_prompt_ratio"] = stats["cached_prompt_tokens"] / prompt_tokens if prompt_tokens else None
+        if ordered:
+            stats["p50_latency_s"] = ordered[len(ordered) // 2]
+            stats["p95_latency_s"] = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        return stats
+
+
+_metrics = LLMMetrics()
+
+
+def get_llm_metrics():
+    """Return a snapshot of the process-wide client metrics"""
+    return _metrics.snapshot()
+
+
+# Counters opened by count_upstream_calls() in the current context (threads copied from it included)
+_call_counters = contextvars.ContextVar("llm_call_counters", default=())
+_call_counters_lock = threading.Lock()
+
+
+@contextmanager
+def count_upstream_calls():
+    """Count the HTTP requests sent upstream from this block; yields {"calls": n}"""
+    counter = {"calls": 0}
+    token = _call_counters.set(_call_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _call_counters.reset(token)
+
+
+def _count_upstream_call():
+    counters = _call_counters.get()
+    if counters:
+        with _call_counters_lock:
+            for counter in counters:
+                counter["calls"] += 1
+
+
+def _trace(event_name, info):
+    # httpcore reports a TCP connect only when no pooled connection could be reused
+    if event_name == "connection.connect_tcp.complete":
+        _metrics.incr("new_connections")
+
+
+async def _atrace(event_name, info):
+    _trace(event_name, info)
+
+
+def _estimate_tokens(request):
+    """Rough token cost of a request for the shared rate budget: body size plus reserved output"""
+    try:
+        body = request.content
+    except httpx.RequestNotRead:
+        return 0
+    try:
+        max_tokens = json.loads(body).get("max_tokens") if body else None
+    except (ValueError, AttributeError):
+        max_tokens = None
+    return len(body) // 4 + (max_tokens or 0)
+
+
+# Response streams still open in the calling context (shared with the contexts copied from it)
+_open_streams = contextvars.ContextVar("open_streams", default=None)
+
+
+def _request_class(request):
+    """Embeddings requested while this context reads a stream get their own class.
+
+    The stream keeps its slot until it is closed; if its consumer's embeddings
+    waited in the same class, streams filling the class would wait on themselves.
+    """
+    if request.url.path.endswith("/embeddings") and _open_streams.get():
+        return SCHEDULER_NESTED_CLASS
+    return None
+
+
+def _track_stream(stream):
+    streams = _open_streams.get()
+    if streams is None:
+        streams = set()
+        _open_streams.set(streams)
+    streams.add(stream)
+    return streams
+
+
+class _ScheduledStream(httpx.SyncByteStream):
+    """Response body that hands its scheduler slot back once closed"""
+
+    def __init__(self, stream, waiter):
+        self._stream = stream
+        self._waiter = waiter
+        self._streams = _track_stream(self)
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._streams.discard(self)
+            if self._waiter is not None:
+                waiter, self._waiter = self._waiter, None
+                get_scheduler().release(waiter)
+
+
+class _AsyncScheduledStream(httpx.AsyncByteStream):
+    def __init__(self, stream, waiter):
+        self._stream = stream
+        self._waiter = waiter
+        self._streams = _track_stream(self)
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._streams.discard(self)
+            if self._waiter is not None:
+                waiter, self._waiter = self._waiter, None
+                get_scheduler().release(waiter)
+
+
+class _MeteredTransport(httpx.HTTPTransport):
+    def handle_request(self, request):
+        # A slot is held from before the request is sent until its body is closed
+        scheduler = get_scheduler()
+        waiter = scheduler.acquire(_request_class(request), tokens=_estimate_tokens(request))
+        try:
+            _metrics.incr("http_requests")
+            _count_upstream_call()
+            request.extensions["trace"] = _trace
+            cassette = get_cassette()
+            if cassette is None:
+                response = super().handle_request(request)
+            else:
+                response = cassette.handle(request, super().handle_request)
+        except BaseException:
+            scheduler.release(waiter)
+            raise
+        response.stream = _ScheduledStream(response.stream, waiter)
+        return response
+
+
+class _AsyncMeteredTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request):
+        scheduler = get_scheduler()
+        waiter = await scheduler.aacquire(_request_class(request), tokens=_estimate_tokens(request))
+        try:
+            _metrics.incr("http_requests")
+            _count_upstream_call()
+            request.extensions["trace"] = _atrace
+            cassette = get_cassette()
+            if cassette is None:
+                response = await super().handle_async_request(request)
+            else:
+                response = await cassette.ahandle(request, super().handle_async_request)
+        except BaseException:
+            scheduler.release(waiter)
+            raise
+        response.stream = _AsyncScheduledStream(response.stream, waiter)
+        return response
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY
+    )
+
+
+def _timeout():
+    return httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+
+_lock = threading.Lock()
+_http_client = None
+_client = None
+_async_loop = None
+_async_client = None
+_loopless_async_client = None
+_hedge_pool = None
+
+
+def get_http_client():
+    """Return the process-wide pooled httpx client (also handed to llama_index)"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(transport=_MeteredTransport(limits=_limits()), timeout=_timeout())
+        return _http_client
+
+
+def _get_loopless_async_client():
+    """Async httpx client for llama_index's async calls.
+
+    llama_index runs them on short-lived event loops, so connections are not
+    kept alive past their request; they are still scheduled and metered.
+    """
+    global _loopless_async_client
+    with _lock:
+        if _loopless_async_client is None:
+            limits = httpx.Limits(max_connections=LLM_POOL_MAX_CONNECTIONS, max_keepalive_connections=0)
+            _loopless_async_client = httpx.AsyncClient(transport=_AsyncMeteredTransport(limits=limits),
+                                                       timeout=_timeout())
+        return _loopless_async_client
+
+
+def get_openai_client():
+    """Return the process-wide OpenAI client; retries are handled by this module"""
+    global _client
+    http_client = get_http_client()
+    with _lock:
+        if _client is None:
+            _client = openai.OpenAI(base_url=OPENAI_BASE_URL, http_client=http_client,
+                                    max_retries=0, timeout=_timeout())
+        return _client
+
+
+def _get_async_loop():
+    """Start (once) the event loop thread that owns the async client and its pool"""
+    global _async_loop, _async_client
+    with _lock:
+        if _async_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True).start()
+            http_client = httpx.AsyncClient(transport=_AsyncMeteredTransport(limits=_limits()), timeout=_timeout())
+            _async_client = openai.AsyncOpenAI(base_url=OPENAI_BASE_URL, http_client=http_client,
+                                               max_retries=0, timeout=_timeout())
+            _async_loop = loop
+        return _async_loop
+
+
+def get_async_openai_client():
+    """Return the process-wide async client; only use it on the ``submit_async`` loop"""
+    _get_async_loop()
+    return _async_client
+
+
+def submit_async(coro):
+    """Run a coroutine on the shared client loop and return a concurrent future.
+
+    Async connections can only be reused from the loop that opened them, so
+    every async call goes through this single long-lived loop. The coroutine
+    runs in a copy of the caller's context (scheduling class, call counters).
+    """
+    context = contextvars.copy_context()
+
+    async def run_in_caller_context():
+        return await asyncio.get_running_loop().create_task(coro, context=context)
+
+    return asyncio.run_coroutine_threadsafe(run_in_caller_context(), _get_async_loop())
+
+
+def _backoff(attempt, error=None):
+    """Full-jitter exponential backoff, honouring Retry-After when the server sends it"""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _with_retries(call):
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            return call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                _metrics.incr("errors")
+                raise
+            _metrics.incr("retries")
+            time.sleep(_backoff(attempt, e))
+
+
+async def _awith_retries(call):
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            return await call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                _metrics.incr("errors")
+                raise
+            _metrics.incr("retries")
+            await asyncio.sleep(_backoff(attempt, e))
+
+
+def _hedge_delay(hedge):
+    if not (LLM_HEDGE_ENABLED if hedge is None else hedge):
+        return None
+    return _metrics.latency_percentile(LLM_HEDGE_PERCENTILE)
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    with _lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=LLM_POOL_MAX_CONNECTIONS, thread_name_prefix="llm-hedge")
+        return _hedge_pool
+
+
+def chat_completion(messages, model, stream=False, hedge=None, **kwargs):
+    """Create a chat completion through the shared client with retries.
+
+    Non-streaming calls slower than the recent p95 latency get one duplicate
+    (hedged) request when hedging is enabled; the first answer wins. Streams
+    are retried only until the response starts.
+    """
+    client = get_openai_client()
+    start_time = time.time()
+
+    if stream:
+        # The last chunk then carries the usage, including cached prompt tokens
+        kwargs.setdefault("stream_options", {"include_usage": True})
+
+    def call():
+        return client.chat.completions.create(model=model, messages=messages, stream=stream, **kwargs)
+
+    _metrics.incr("calls")
+    delay = None if stream else _hedge_delay(hedge)
+    if delay is None:
+        response = _with_retries(call)
+    else:
+        pool = _get_hedge_pool()
+        primary = pool.submit(_with_retries, call)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            response = primary.result()
+        else:
+            _metrics.incr("hedges_sent")
+            hedged = pool.submit(_with_retries, call)
+            done, _ = wait([primary, hedged], return_when=FIRST_COMPLETED)
+            winner = done.pop()
+            if winner is hedged:
+                _metrics.incr("hedges_won")
+            # The slower request still completes in the background; its result is dropped
+            response = winner.result()
+
+    if stream:
+        return _metered_stream(response)
+    _metrics.observe_latency(time.time() - start_time)
+    _metrics.observe_usage(response.usage)
+    return response
+
+
+def _metered_stream(response):
+    """Pass stream chunks through, recording the usage chunk sent at the end"""
+    for chunk in response:
+        if getattr(chunk, "usage", None):
+            _metrics.observe_usage(chunk.usage)
+        yield chunk
+
+
+async def achat_completion(messages, model, hedge=None, **kwargs):
+    """Async chat completion with retries and hedging; run it with ``submit_async``"""
+    client = get_async_openai_client()
+    start_time = time.time()
+
+    def call():
+        return client.chat.completions.create(model=model, messages=messages, **kwargs)
+
+    _metrics.incr("calls")
+    delay = _hedge_delay(hedge)
+    primary = asyncio.ensure_future(_awith_retries(call))
+    if delay is not None:
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if not done:
+            _metrics.incr("hedges_sent")
+            hedged = asyncio.ensure_future(_awith_retries(call))
+            done, pending = await asyncio.wait([primary, hedged], return_when=asyncio.FIRST_COMPLETED)
+            winner = done.pop()
+            if winner is hedged:
+                _metrics.incr("hedges_won")
+            for task in pending:
+                task.cancel()
+            response = winner.result()
+            _metrics.observe_latency(time.time() - start_time)
+            _metrics.observe_usage(response.usage)
+            return response
+    response = await primary
+    _metrics.observe_latency(time.time() - start_time)
+    _metrics.observe_usage(response.usage)
+    return response
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Record the token usage of llama_index LLM calls in the client metrics"""
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+
+    def on_event_start(self, event_type, payload=None, event_id="", parent_id="", **kwargs):
+        return event_id
+
+    def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+        if event_type != CBEventType.LLM or not payload:
+            return
+        response = payload.get(EventPayload.RESPONSE) or payload.get(EventPayload.COMPLETION)
+        raw = getattr(response, "raw", None)
+        if raw is not None:
+            _metrics.observe_usage(raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None))
+
+    def start_trace(self, trace_id=None):
+        pass
+
+    def end_trace(self, trace_id=None, trace_map=None):
+        pass
+
+
+_usage_handler = UsageCallbackHandler()
+
+
+def get_llm(model, temperature=0.1, max_tokens=2000, **kwargs):
+    """llama_index OpenAI LLM sharing the pooled connections and timeouts"""
+    return OpenAI(model=model, temperature=temperature, max_tokens=max_tokens, api_base=OPENAI_BASE_URL,
+                  timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES, http_client=get_http_client(),
+                  async_http_client=_get_loopless_async_client(), callback_manager=CallbackManager([_usage_handler]), **kwargs)
+
+
+def get_embed_model(model, embed_batch_size=10, **kwargs):
+    """llama_index OpenAI embedding model sharing the pooled connections and timeouts"""
+    return OpenAIEmbedding(model=model, embed_batch_size=embed_batch_size, api_base=OPENAI_BASE_URL,
+                           timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES,
+                           http_client=get_http_client(), async_http_client=_get_loopless_async_client(),
+                           **kwargs)
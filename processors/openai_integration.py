@@ -3,204 +3,222 @@ OpenAI integration utilities
 """
 
 import os
+import asyncio
+from concurrent.futures import as_completed
 import streamlit as st
-import openai
-
-
-def generate_questions(question_type, num_questions, topic, subject, difficulty, relevant_content, llm_model_name, language="fr"):
-    """Generate questions based on configuration and content"""
-    if language == "fr":
-        return generate_french_questions(question_type, num_questions, topic, subject, difficulty, relevant_content, llm_model_name)
-    else:
-        return generate_english_questions(question_type, num_questions, topic, subject, difficulty, relevant_content, llm_model_name)
-
-
-def generate_french_questions(question_type, num_questions, topic, subject, difficulty, relevant_content, llm_model_name):
-    """Generate questions in French"""
-    if question_type == "QCM":
-        prompt = f"""
-Générez {num_questions} QCM de niveau {difficulty.lower()} sur '{topic}' en {subject}.
-Basez-vous strictement sur ce contenu : {relevant_content}
-
-Formattez chaque question EXACTEMENT comme ceci :
-
-### Question [N]
-
-**[Q].** [Énoncé de la question]
-
-- **A)** [Option A]
-- **B)** [Option B]
-- **C)** [Option C]
-- **D)** [Option D]
-
-**Réponse :** [Lettre correcte]
-**Explication :** [Explication de 1-2 phrases avec référence aux concepts de {subject}]
-
----
-"""
-    elif question_type == "Vrai/Faux":
-        prompt = f"""
-Générez {num_questions} questions Vrai/Faux sur '{topic}' en {subject}.
-Incluez des explications et référez-vous au contenu.
-
-Formattez EXACTEMENT comme ceci :
-
-### Question [N]
-
-**[Q].** [Énoncé]
-
-**Réponse :** Vrai/Faux
-**Explication :** [Explication avec référence aux supports de {subject}]
-
----
-"""
-    elif question_type in ["Calcul", "Analyse de cas"]:
-        prompt = f"""
-Générez {num_questions} problèmes de type {question_type.lower()} sur '{topic}' en {subject}.
-Incluez des solutions détaillées.
-
-Formattez EXACTEMENT comme ceci :
-
-### Problème [N]
-
-**[Q].** [Énoncé du problème]
-
-**Solution :** 
-[Solution étape par étape avec raisonnement spécifique à {subject}]
-
-**Point clé :**
-[Principale notion à retenir]
-
----
-"""
-    else:
-        prompt = f"""
-Générez {num_questions} questions de type {question_type.lower()} sur '{topic}' en {subject}.
-Incluez des réponses détaillées.
+from config.settings import (
+    QUESTION_SHARD_SIZE,
+    QUESTION_SHARD_CONCURRENCY,
+    QUESTION_CONTEXT_TOKEN_BUDGET,
+    QUESTION_OUTPUT_TOKENS,
+    QUESTION_OUTPUT_TOKENS_PER_QUESTION,
+    QUESTION_TOPUP_ATTEMPTS
+)
+from processors.llm_client import chat_completion, achat_completion, submit_async
+from processors.scheduler import current_request_context, request_context
+from processors.token_budget import TokenBudget
+from processors.prompts import build_question_messages
+from processors.question_parser import (
+    split_question_blocks,
+    iter_streamed_block_batches,
+    parse_question_block,
+    normalize_stem,
+    renumber_block,
+    join_question_blocks
+)
+
+
+def generate_questions(question_type, num_questions, topic, subject, difficulty, relevant_content, llm_model_name, language="fr", stream=False, context_passages=None, accept=None):
+    """Generate structured questions based on configuration and content.
+
+    Returns a list of question items (see ``_make_item``); with ``stream=True``
+    a generator yielding each item as soon as its block is complete.
+    Requests larger than QUESTION_SHARD_SIZE are split into concurrent shards,
+    each seeded with a different subset of ``context_passages`` (dicts with
+    ``node_id`` and ``text``, as returned by ``retrieve_context``).
+    ``accept`` receives the new items of each completed shard, or of each
+    streamed block, and returns those to keep; rejected ones are generated again.
+    """
+    passages = context_passages or [
+        {"node_id": None, "text": p} for p in relevant_content.split("\n\n") if p.strip()
+    ]
+    
+    def generate_blocks(count):
+        shard_counts = _shard_counts(count)
+        if len(shard_counts) == 1:
+            # Passages arrive in relevance order, so the budget drops the least relevant ones first
+            budget = _question_budget(
+                build_question_messages(question_type, count, topic, subject, difficulty, "", language), count, llm_model_name
+            )
+            shard_passages = budget.fit_passages(passages)
+            budget.log("questions")
+            content = "\n\n".join(p["text"] for p in shard_passages)
+            if language == "fr":
+                deltas = generate_french_questions(question_type, count, topic, subject, difficulty, content, llm_model_name, stream=True)
+            else:
+                deltas = generate_english_questions(question_type, count, topic, subject, difficulty, content, llm_model_name, stream=True)
+            source_ids = [p["node_id"] for p in shard_passages if p["node_id"]]
+            # Each block is handed over as soon as it ends, with any other block finished by the same delta
+            for blocks in iter_streamed_block_batches(deltas):
+                yield blocks, source_ids
+            return
+        
+        shards = []
+        for i, shard_count in enumerate(shard_counts):
+            # Round-robin over the ranked passages so every shard sees strong but different context
+            shard_passages = passages[i::len(shard_counts)] or passages
+            budget = _question_budget(
+                build_question_messages(question_type, shard_count, topic, subject, difficulty, "", language), shard_count, llm_model_name
+            )
+            shard_passages = budget.fit_passages(shard_passages)
+            budget.log(f"questions shard {i + 1}/{len(shard_counts)}")
+            shard_content = "\n\n".join(p["text"] for p in shard_passages)
+            messages = build_question_messages(question_type, shard_count, topic, subject, difficulty, shard_content, language)
+            shards.append((messages, shard_count, [p["node_id"] for p in shard_passages if p["node_id"]]))
+        yield from _generate_sharded(shards, llm_model_name)
+    
+    metadata = {
+        "type": question_type,
+        "difficulty": difficulty,
+        "language": language,
+        "topic": topic,
+        "subject": subject
+    }
+    items = _collect_items(generate_blocks, num_questions, metadata, accept)
+    return items if stream else list(items)
+
+
+def _collect_items(generate_blocks, num_questions, metadata, accept=None):
+    """Parse, deduplicate and renumber question blocks into structured items.
+
+    ``generate_blocks(count)`` yields the (blocks, source node ids) groups of
+    a new generation; questions dropped as duplicates or by ``accept`` are
+    generated again, at most QUESTION_TOPUP_ATTEMPTS more times.
+    """
+    seen_stems = set()
+    kept = 0
+    for _ in range(1 + QUESTION_TOPUP_ATTEMPTS):
+        if kept >= num_questions:
+            break
+        groups = generate_blocks(num_questions - kept)
+        try:
+            for blocks, source_ids in groups:
+                items = []
+                for block in blocks:
+                    item = _make_item(block, source_ids, metadata)
+                    stem = normalize_stem(item["stem"])
+                    if not stem or stem in seen_stems:
+                        continue
+                    seen_stems.add(stem)
+                    items.append(item)
+                items = items[:num_questions - kept]
+                if accept is not None and items:
+                    items = accept(items)
+                for item in items:
+                    kept += 1
+                    item["markdown"] = renumber_block(item["markdown"], kept)
+                    yield item
+                if kept >= num_questions:
+                    break
+        finally:
+            groups.close()
+
+
+def _make_item(block, source_ids, metadata):
+    """Build a question item: stem, options, answer, explanation, metadata and source nodes"""
+    item = parse_question_block(block)
+    item.update(metadata)
+    item["source_nodes"] = list(source_ids)
+    item["markdown"] = block
+    return item
+
+
+def render_question_items(items, start=1):
+    """Render question items back to markdown, numbered from ``start``"""
+    return join_question_blocks(renumber_block(item["markdown"], start + i) for i, item in enumerate(items))
+
+
+def _question_output_tokens(num_questions):
+    """Completion tokens reserved for ``num_questions`` questions"""
+    return min(QUESTION_OUTPUT_TOKENS, QUESTION_OUTPUT_TOKENS_PER_QUESTION * num_questions)
+
+
+def _question_budget(empty_messages, num_questions, llm_model_name):
+    """Token budget of a question prompt: the messages without content, the output and the context"""
+    return TokenBudget(
+        model=llm_model_name,
+        output_tokens=_question_output_tokens(num_questions),
+        prompt="\n".join(message["content"] for message in empty_messages),
+        max_context_tokens=QUESTION_CONTEXT_TOKEN_BUDGET
+    )
 
-Formattez EXACTEMENT comme ceci :
 
-### Question [N]
+def _shard_counts(num_questions):
+    """Split a question count into shards of at most QUESTION_SHARD_SIZE"""
+    num_shards = max(1, -(-num_questions // QUESTION_SHARD_SIZE))
+    base, extra = divmod(num_questions, num_shards)
+    return [base + (1 if i < extra else 0) for i in range(num_shards)]
 
-**[Q].** [Question]
 
-**Réponse :** 
-[Réponse détaillée avec référence aux supports de {subject}]
+def _generate_sharded(shards, llm_model_name):
+    """Run the (messages, count, source node ids) shards concurrently and yield (blocks, source node ids) groups.
 
----
-"""
+    Shards are merged in completion order, so the first questions appear as
+    soon as the fastest shard finishes and the total time is that of the slowest.
+    """
+    semaphore = asyncio.Semaphore(QUESTION_SHARD_CONCURRENCY)
+    # Shards run on the client loop thread, so carry the caller's scheduling context over
+    request_class, session_id = current_request_context()
+    
+    async def run_shard(messages, count):
+        with request_context(request_class, session_id):
+            async with semaphore:
+                response = await achat_completion(
+                    messages=messages,
+                    model=llm_model_name,
+                    temperature=0.3,
+                    max_tokens=_question_output_tokens(count)
+                )
+                return response.choices[0].message.content
     
-    # Generate questions
-    response = openai.chat.completions.create(
+    futures = {submit_async(run_shard(messages, count)): source_ids for messages, count, source_ids in shards}
+    try:
+        for future in as_completed(futures):
+            yield split_question_blocks(future.result()), futures[future]
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _complete(messages, llm_model_name, stream=False, max_tokens=QUESTION_OUTPUT_TOKENS):
+    """Send question generation messages to the chat completions API"""
+    response = chat_completion(
+        messages=messages,
         model=llm_model_name,
-        messages=[{"role": "user", "content": prompt}],
         temperature=0.3,
-        max_tokens=2000
+        max_tokens=max_tokens,
+        stream=stream
     )
     
+    if stream:
+        return _iter_deltas(response)
     return response.choices[0].message.content
 
 
-def generate_english_questions(question_type, num_questions, topic, subject, difficulty, relevant_content, llm_model_name):
-    """Generate questions in English"""
-    # Map French question types to English types
-    question_type_map = {
-        "QCM": "Multiple Choice",
-        "Vrai/Faux": "True/False",
-        "Calcul": "Calculation",
-        "Analyse de cas": "Case Analysis"
-    }
-    
-    # Use mapped question type or original if not in map
-    eng_question_type = question_type_map.get(question_type, question_type)
-    
-    # Map difficulty levels
-    difficulty_map = {
-        "Facile": "Easy",
-        "Moyen": "Medium",
-        "Difficile": "Hard"
-    }
-    eng_difficulty = difficulty_map.get(difficulty, "Medium")
-    
-    if eng_question_type == "Multiple Choice":
-        prompt = f"""
-Generate {num_questions} multiple-choice questions at {eng_difficulty.lower()} level on '{topic}' in {subject}.
-Base your questions strictly on this content: {relevant_content}
-
-Format each question EXACTLY as follows:
-
-### Question [N]
-
-**[Q].** [Question statement]
-
-- **A)** [Option A]
-- **B)** [Option B]
-- **C)** [Option C]
-- **D)** [Option D]
-
-**Answer:** [Correct letter]
-**Explanation:** [1-2 sentence explanation with reference to {subject} concepts]
-
----
-"""
-    elif eng_question_type == "True/False":
-        prompt = f"""
-Generate {num_questions} True/False questions on '{topic}' in {subject}.
-Include explanations and refer to the content.
-
-Format EXACTLY as follows:
-
-### Question [N]
-
-**[Q].** [Statement]
-
-**Answer:** True/False
-**Explanation:** [Explanation with reference to {subject} material]
-
----
-"""
-    elif eng_question_type in ["Calculation", "Case Analysis"]:
-        prompt = f"""
-Generate {num_questions} {eng_question_type.lower()} problems on '{topic}' in {subject}.
-Include detailed solutions.
-
-Format EXACTLY as follows:
-
-### Problem [N]
-
-**[Q].** [Problem statement]
+def _iter_deltas(response):
+    """Yield the text deltas of a streamed chat completion"""
+    for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
 
-**Solution:** 
-[Step-by-step solution with reasoning specific to {subject}]
 
-**Key Point:**
-[Main concept to remember]
-
----
-"""
-    else:
-        prompt = f"""
-Generate {num_questions} {eng_question_type.lower()} questions on '{topic}' in {subject}.
-Include detailed answers.
-
-Format EXACTLY as follows:
-
-### Question [N]
-
-**[Q].** [Question]
+def generate_french_questions(question_type, num_questions, topic, subject, difficulty, relevant_content, llm_model_name, stream=False):
+    """Generate questions in French"""
+    messages = build_question_messages(question_type, num_questions, topic, subject, difficulty, relevant_content, "fr")
+    return _complete(messages, llm_model_name, stream, _question_output_tokens(num_questions))
 
-**Answer:** 
-[Detailed answer with reference to {subject} material]
 
----
-"""
-    
-    # Generate questions
-    response = openai.chat.completions.create(
-        model=llm_model_name,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-        max_tokens=2000
-    )
-    
-    return response.choices[0].message.content
+def generate_english_questions(question_type, num_questions, topic, subject, difficulty, relevant_content, llm_model_name, stream=False):
+    """Generate questions in English"""
+    messages = build_question_messages(question_type, num_questions, topic, subject, difficulty, relevant_content, "en")
+    return _complete(messages, llm_model_name, stream, _question_output_tokens(num_questions))
@@ -0,0 +1,149 @@
+"""
+Node postprocessing (reranking) for the subject engines
+"""
+
+import math
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from config.settings import (
+    RERANK_MODE,
+    RERANK_CROSS_ENCODER_PATH,
+    RERANK_MMR_LAMBDA,
+    RERANK_RELATIVE_CUTOFF,
+    RERANK_MIN_NODES,
+    RERANK_MAX_NODES
+)
+
+
+class MMRReranker(BaseNodePostprocessor):
+    """Maximal marginal relevance over the embeddings already stored in the index.
+
+    No extra model or API call is needed: the candidate embeddings are read back
+    from the vector store and the query embedding comes from retrieval.
+    """
+
+    mmr_lambda: float = Field(default=RERANK_MMR_LAMBDA, description="Relevance vs. diversity trade-off.")
+    _vector_store: Any = PrivateAttr()
+    _embed_model: Any = PrivateAttr()
+
+    def __init__(self, vector_store, embed_model=None, **kwargs):
+        super().__init__(**kwargs)
+        self._vector_store = vector_store
+        self._embed_model = embed_model
+
+    @classmethod
+    def class_name(cls):
+        return "MMRReranker"
+
+    def _node_embedding(self, node):
+        if node.embedding is not None:
+            return node.embedding
+        try:
+            return self._vector_store.get(node.node_id)
+        except (KeyError, NotImplementedError, AttributeError):
+            return None
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None):
+        if len(nodes) <= 1 or query_bundle is None:
+            return nodes
+
+        query_embedding = query_bundle.embedding
+        if query_embedding is None and self._embed_model is not None:
+            query_embedding = self._embed_model.get_query_embedding(query_bundle.query_str)
+
+        embeddings = [self._node_embedding(n.node) for n in nodes]
+        if query_embedding is None or any(e is None for e in embeddings):
+            return nodes
+
+        doc_matrix = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        query_vec = _normalize_rows(np.asarray([query_embedding], dtype=np.float32))[0]
+        relevance = doc_matrix @ query_vec
+        pairwise = doc_matrix @ doc_matrix.T
+
+        selected = []
+        remaining = list(range(len(nodes)))
+        while remaining:
+            if selected:
+                redundancy = pairwise[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), dtype=np.float32)
+            mmr = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best = remaining[int(np.argmax(mmr))]
+            selected.append(best)
+            remaining.remove(best)
+
+        return [NodeWithScore(node=nodes[i].node, score=float(relevance[i])) for i in selected]
+
+
+class CrossEncoderReranker(BaseNodePostprocessor):
+    """Rerank candidates on CPU with a cross-encoder loaded from a local path"""
+
+    model_path: str = Field(description="Local path of the cross-encoder model.")
+    batch_size: int = Field(default=16)
+    _model: Any = PrivateAttr()
+
+    def __init__(self, model_path, **kwargs):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            raise ImportError("Cross-encoder reranking requires: pip install sentence-transformers")
+        super().__init__(model_path=model_path, **kwargs)
+        self._model = CrossEncoder(model_path, device="cpu")
+
+    @classmethod
+    def class_name(cls):
+        return "CrossEncoderReranker"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None):
+        if not nodes or query_bundle is None:
+            return nodes
+
+        pairs = [(query_bundle.query_str, n.node.get_content(metadata_mode=MetadataMode.EMBED)) for n in nodes]
+        logits = self._model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        # Squash logits to (0, 1) so the relative cutoff behaves like it does for cosine scores
+        scored = [NodeWithScore(node=n.node, score=1 / (1 + math.exp(-float(s)))) for n, s in zip(nodes, logits)]
+        return sorted(scored, key=lambda n: n.score, reverse=True)
+
+
+class DynamicCutoff(BaseNodePostprocessor):
+    """Keep a variable number of nodes: those scoring close enough to the best one"""
+
+    relative_cutoff: float = Field(default=RERANK_RELATIVE_CUTOFF)
+    min_nodes: int = Field(default=RERANK_MIN_NODES)
+    max_nodes: int = Field(default=RERANK_MAX_NODES)
+
+    @classmethod
+    def class_name(cls):
+        return "DynamicCutoff"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None):
+        if not nodes:
+            return nodes
+
+        top_score = max(n.score or 0.0 for n in nodes)
+        kept = []
+        for node in nodes[:self.max_nodes]:
+            if len(kept) < self.min_nodes or (node.score or 0.0) >= top_score * self.relative_cutoff:
+                kept.append(node)
+        return kept
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def build_rerank_postprocessors(index, mode=RERANK_MODE):
+    """Return the postprocessors for the configured rerank mode ("mmr", "cross_encoder" or None)"""
+    if not mode:
+        return []
+    if mode == "cross_encoder" and RERANK_CROSS_ENCODER_PATH:
+        reranker = CrossEncoderReranker(model_path=RERANK_CROSS_ENCODER_PATH)
+    else:
+        reranker = MMRReranker(vector_store=index.vector_store)
+    return [reranker, DynamicCutoff()]
@@ -0,0 +1,325 @@
+"""
+Prompt templates laid out as a static prefix followed by the variable request
+"""
+
+from functools import lru_cache
+
+from config.settings import SUBJECT_EXAMPLES_MAX_TOKENS
+from config.subjects import SUBJECT_CONFIGS_FR
+from config.subjects_en import SUBJECT_CONFIGS_EN
+from processors.token_budget import TokenBudget
+
+# Providers cache identical prompt prefixes, so everything that only depends on
+# (subject, language[, question type]) comes first and is built once. The
+# topic, count, difficulty and retrieved content always come last.
+
+QUESTION_TYPES_EN = {
+    "QCM": "Multiple Choice",
+    "Vrai/Faux": "True/False",
+    "Calcul": "Calculation",
+    "Analyse de cas": "Case Analysis"
+}
+
+DIFFICULTIES_EN = {
+    "Facile": "Easy",
+    "Moyen": "Medium",
+    "Difficile": "Hard"
+}
+
+
+def fit_subject_examples(examples):
+    """Cap the examples block of a subject system prompt at SUBJECT_EXAMPLES_MAX_TOKENS"""
+    budget = TokenBudget(model=None, output_tokens=0, examples=examples,
+                         max_example_tokens=SUBJECT_EXAMPLES_MAX_TOKENS)
+    budget.log("subject examples")
+    return budget.fit_examples(examples)
+
+
+@lru_cache(maxsize=None)
+def get_subject_system_prompt(subject, language="fr"):
+    """System prompt of the subject query engines (static per subject and language)"""
+    if language == "fr":
+        config = SUBJECT_CONFIGS_FR.get(subject.lower(), SUBJECT_CONFIGS_FR['économie'])
+        return f"""
+Vous êtes un assistant pédagogique expert en {subject} aidant avec des supports de cours universitaires.
+Votre objectif est de fournir des réponses précises, concises et bien structurées STRICTEMENT basées sur les documents fournis.
+
+SPÉCIALISATION : {subject.upper()}
+{config['guidance']}
+
+RÈGLES DE RÉPONSE :
+1. Pour les concepts : Fournissez des définitions, exemples et caractéristiques clés
+2. Pour les procédures : Listez les étapes sous forme numérotée
+3. Pour les comparaisons : Utilisez des tableaux ou des listes à puces
+4. Pour les calculs : Montrez les formules et le détail étape par étape
+5. N'INVENTEZ JAMAIS d'information non présente dans les documents
+6. Si incertain : Dites clairement "Ce sujet n'est pas couvert dans les documents fournis."
+
+FORMATAGE :
+- Utilisez Markdown pour un formatage clair
+- Mettez en gras les termes importants
+- Utilisez des listes à puces
+- Utilisez des tableaux pour les comparaisons
+- Incluez des exemples spécifiques à {subject}
+
+EXEMPLES :
+{fit_subject_examples(config['examples'])}
+"""
+
+    config = SUBJECT_CONFIGS_EN.get(subject.lower(), SUBJECT_CONFIGS_EN['economics'])
+    return f"""
+You are an expert teaching assistant in {subject} helping with university course materials.
+Your goal is to provide accurate, concise, and well-structured answers STRICTLY based on the provided documents.
+
+SPECIALIZATION: {subject.upper()}
+{config['guidance']}
+
+RESPONSE RULES:
+1. For concepts: Provide definitions, examples, and key characteristics
+2. For procedures: List the steps in numbered form
+3. For comparisons: Use tables or bullet points
+4. For calculations: Show the formulas and step-by-step details
+5. NEVER make up information not present in the documents
+6. If uncertain: Clearly state "This topic is not covered in the provided documents."
+
+FORMATTING:
+- Use Markdown for clear formatting
+- Bold important terms
+- Use bullet points
+- Use tables for comparisons
+- Include examples specific to {subject}
+
+EXAMPLES:
+{fit_subject_examples(config['examples'])}
+"""
+
+
+def _french_question_template(question_type, subject):
+    """(static prefix, request template) of a French question prompt"""
+    if question_type == "QCM":
+        prefix = f"""
+Vous rédigez des QCM d'entraînement en {subject}, basés strictement sur le contenu fourni.
+
+Formattez chaque question EXACTEMENT comme ceci :
+
+### Question [N]
+
+**[Q].** [Énoncé de la question]
+
+- **A)** [Option A]
+- **B)** [Option B]
+- **C)** [Option C]
+- **D)** [Option D]
+
+**Réponse :** [Lettre correcte]
+**Explication :** [Explication de 1-2 phrases avec référence aux concepts de {subject}]
+
+---
+"""
+        request = "Générez {num_questions} QCM de niveau {difficulty} sur '{topic}'."
+    elif question_type == "Vrai/Faux":
+        prefix = f"""
+Vous rédigez des questions Vrai/Faux d'entraînement en {subject}, basées strictement sur le contenu fourni.
+Incluez des explications et référez-vous au contenu.
+
+Formattez EXACTEMENT comme ceci :
+
+### Question [N]
+
+**[Q].** [Énoncé]
+
+**Réponse :** Vrai/Faux
+**Explication :** [Explication avec référence aux supports de {subject}]
+
+---
+"""
+        request = "Générez {num_questions} questions Vrai/Faux sur '{topic}'."
+    elif question_type in ["Calcul", "Analyse de cas"]:
+        prefix = f"""
+Vous rédigez des problèmes de type {question_type.lower()} en {subject}, basés strictement sur le contenu fourni.
+Incluez des solutions détaillées.
+
+Formattez EXACTEMENT comme ceci :
+
+### Problème [N]
+
+**[Q].** [Énoncé du problème]
+
+**Solution :**
+[Solution étape par étape avec raisonnement spécifique à {subject}]
+
+**Point clé :**
+[Principale notion à retenir]
+
+---
+"""
+        request = f"Générez {{num_questions}} problèmes de type {question_type.lower()} sur '{{topic}}'."
+    else:
+        prefix = f"""
+Vous rédigez des questions de type {question_type.lower()} en {subject}, basées strictement sur le contenu fourni.
+Incluez des réponses détaillées.
+
+Formattez EXACTEMENT comme ceci :
+
+### Question [N]
+
+**[Q].** [Question]
+
+**Réponse :**
+[Réponse détaillée avec référence aux supports de {subject}]
+
+---
+"""
+        request = f"Générez {{num_questions}} questions de type {question_type.lower()} sur '{{topic}}'."
+    return prefix, request + "\nBasez-vous strictement sur ce contenu :\n{relevant_content}"
+
+
+def _english_question_template(question_type, subject):
+    """(static prefix, request template) of an English question prompt"""
+    eng_question_type = QUESTION_TYPES_EN.get(question_type, question_type)
+    if eng_question_type == "Multiple Choice":
+        prefix = f"""
+You write practice multiple-choice questions in {subject}, based strictly on the provided content.
+
+Format each question EXACTLY as follows:
+
+### Question [N]
+
+**[Q].** [Question statement]
+
+- **A)** [Option A]
+- **B)** [Option B]
+- **C)** [Option C]
+- **D)** [Option D]
+
+**Answer:** [Correct letter]
+**Explanation:** [1-2 sentence explanation with reference to {subject} concepts]
+
+---
+"""
+        request = "Generate {num_questions} multiple-choice questions at {difficulty} level on '{topic}'."
+    elif eng_question_type == "True/False":
+        prefix = f"""
+You write practice True/False questions in {subject}, based strictly on the provided content.
+Include explanations and refer to the content.
+
+Format EXACTLY as follows:
+
+### Question [N]
+
+**[Q].** [Statement]
+
+**Answer:** True/False
+**Explanation:** [Explanation with reference to {subject} material]
+
+---
+"""
+        request = "Generate {num_questions} True/False questions on '{topic}'."
+    elif eng_question_type in ["Calculation", "Case Analysis"]:
+        prefix = f"""
+You write {eng_question_type.lower()} problems in {subject}, based strictly on the provided content.
+Include detailed solutions.
+
+Format EXACTLY as follows:
+
+### Problem [N]
+
+**[Q].** [Problem statement]
+
+**Solution:**
+[Step-by-step solution with reasoning specific to {subject}]
+
+**Key Point:**
+[Main concept to remember]
+
+---
+"""
+        request = f"Generate {{num_questions}} {eng_question_type.lower()} problems on '{{topic}}'."
+    else:
+        prefix = f"""
+You write {eng_question_type.lower()} questions in {subject}, based strictly on the provided content.
+Include detailed answers.
+
+Format EXACTLY as follows:
+
+### Question [N]
+
+**[Q].** [Question]
+
+**Answer:**
+[Detailed answer with reference to {subject} material]
+
+---
+"""
+        request = f"Generate {{num_questions}} {eng_question_type.lower()} questions on '{{topic}}'."
+    return prefix, request + "\nBase your questions strictly on this content:\n{relevant_content}"
+
+
+@lru_cache(maxsize=None)
+def get_question_template(question_type, subject, language="fr"):
+    """Return the (static prefix, request template) pair of a question prompt"""
+    if language == "fr":
+        return _french_question_template(question_type, subject)
+    return _english_question_template(question_type, subject)
+
+
+def build_question_messages(question_type, num_questions, topic, subject, difficulty, relevant_content, language="fr"):
+    """Chat messages of a question prompt: the cached static prefix, then the request"""
+    prefix, request = get_question_template(question_type, subject, language)
+    if language != "fr":
+        difficulty = DIFFICULTIES_EN.get(difficulty, difficulty)
+    return [
+        {"role": "system", "content": prefix},
+        {"role": "user", "content": request.format(
+            num_questions=num_questions,
+            topic=topic,
+            difficulty=difficulty.lower(),
+            relevant_content=relevant_content
+        )}
+    ]
+
+
+def _format_conversation(summary, turns, language):
+    user, assistant = ("Étudiant", "Assistant") if language == "fr" else ("Student", "Assistant")
+    lines = []
+    if summary:
+        lines.append(("Résumé de la conversation : " if language == "fr" else "Conversation summary: ") + summary)
+    for turn in turns:
+        lines.append(f"{user}: {turn['user']}")
+        lines.append(f"{assistant}: {turn['assistant']}")
+    return "\n".join(lines)
+
+
+def build_condense_messages(summary, turns, question, language="fr"):
+    """Chat messages rewriting a follow-up question as a standalone question"""
+    conversation = _format_conversation(summary, turns, language)
+    if language == "fr":
+        system = ("Réécris la dernière question de l'étudiant en une question autonome, compréhensible sans "
+                  "la conversation (remplace les pronoms et références implicites). Réponds uniquement par la question.")
+        user = f"Conversation :\n{conversation}\n\nQuestion de suivi : {question}\nQuestion autonome :"
+    else:
+        system = ("Rewrite the student's last question as a standalone question that can be understood without "
+                  "the conversation (resolve pronouns and implicit references). Reply with the question only.")
+        user = f"Conversation:\n{conversation}\n\nFollow-up question: {question}\nStandalone question:"
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+def build_memory_summary_messages(summary, turns, language="fr"):
+    """Chat messages folding older conversation turns into the running summary"""
+    conversation = _format_conversation(summary, turns, language)
+    if language == "fr":
+        system = ("Résume cette conversation entre un étudiant et un assistant pédagogique en quelques phrases : "
+                  "sujets abordés, notions expliquées et questions restées ouvertes.")
+    else:
+        system = ("Summarize this conversation between a student and a teaching assistant in a few sentences: "
+                  "topics covered, concepts explained and open questions.")
+    return [{"role": "system", "content": system}, {"role": "user", "content": conversation}]
+
+
+def precompile_prompts():
+    """Build every static prefix once, at startup"""
+    for language, configs in (("fr", SUBJECT_CONFIGS_FR), ("en", SUBJECT_CONFIGS_EN)):
+        for subject, config in configs.items():
+            get_subject_system_prompt(subject, language)
+            for question_type in config["question_types"]:
+                get_question_template(question_type, subject, language)
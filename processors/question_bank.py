@@ -0,0 +1,167 @@
+"""
+Persistent question bank (SQLite) keyed by index generation
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import numpy as np
+
+from config.settings import PERSIST_DIR, QUESTION_BANK_FILE, QUESTION_DEDUP_THRESHOLD
+from processors.question_parser import normalize_stem
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    generation TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    language TEXT NOT NULL,
+    question_type TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    topic_norm TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    stem_norm TEXT NOT NULL,
+    options TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    explanation TEXT NOT NULL,
+    source_nodes TEXT NOT NULL,
+    markdown TEXT NOT NULL,
+    embedding BLOB,
+    created REAL NOT NULL,
+    UNIQUE (generation, subject, language, stem_norm)
+);
+CREATE INDEX IF NOT EXISTS idx_questions_lookup
+    ON questions (generation, subject, language, question_type, difficulty, topic_norm);
+"""
+
+
+class QuestionBank:
+    """Store generated questions and serve them again before generating new ones"""
+
+    def __init__(self, path, dedup_threshold=QUESTION_DEDUP_THRESHOLD):
+        self.path = path
+        self.dedup_threshold = dedup_threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def find(self, generation, subject, language, question_type, difficulty, topic, limit):
+        """Return up to ``limit`` stored questions matching the request, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT * FROM questions
+                WHERE generation = ? AND subject = ? AND language = ? AND question_type = ?
+                  AND difficulty = ? AND topic_norm = ?
+                ORDER BY id LIMIT ?
+                """,
+                (generation or "", subject, language, question_type, difficulty, normalize_stem(topic), limit)
+            ).fetchall()
+        return [_row_to_item(row) for row in rows]
+
+    def _embeddings(self, generation, subject, language):
+        rows = self._conn.execute(
+            "SELECT embedding FROM questions WHERE generation = ? AND subject = ? AND language = ? AND embedding IS NOT NULL",
+            (generation or "", subject, language)
+        ).fetchall()
+        if not rows:
+            return None
+        return np.vstack([np.frombuffer(row["embedding"], dtype=np.float32) for row in rows])
+
+    def add(self, generation, item, embedding=None):
+        """Store an item unless a near-duplicate exists; returns True when it was added.
+
+        Duplicates are detected on the normalized stem and, when an embedding is
+        given, by cosine similarity above the dedup threshold.
+        """
+        vector = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm else vector
+
+        with self._lock:
+            if vector is not None:
+                existing = self._embeddings(generation, item["subject"], item["language"])
+                if existing is not None and existing.shape[1] == vector.shape[0]:
+                    if float(np.max(existing @ vector)) >= self.dedup_threshold:
+                        return False
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        """
+                        INSERT INTO questions (generation, subject, language, question_type, difficulty, topic,
+                            topic_norm, stem, stem_norm, options, answer, explanation, source_nodes, markdown,
+                            embedding, created)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            generation or "", item["subject"], item["language"], item["type"], item["difficulty"],
+                            item["topic"], normalize_stem(item["topic"]), item["stem"], normalize_stem(item["stem"]),
+                            json.dumps(item["options"], ensure_ascii=False), item["answer"], item["explanation"],
+                            json.dumps(item["source_nodes"]), item["markdown"],
+                            vector.tobytes() if vector is not None else None, time.time()
+                        )
+                    )
+            except sqlite3.IntegrityError:
+                return False
+        return True
+
+    def purge_other_generations(self, generation):
+        """Delete questions generated from a previous index"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM questions WHERE generation != ?", (generation or "",))
+
+    def count(self, generation=None):
+        with self._lock:
+            if generation is None:
+                return self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM questions WHERE generation = ?", (generation,)
+            ).fetchone()[0]
+
+
+def _row_to_item(row):
+    return {
+        "id": row["id"],
+        "stem": row["stem"],
+        "options": json.loads(row["options"]),
+        "answer": row["answer"],
+        "explanation": row["explanation"],
+        "type": row["question_type"],
+        "difficulty": row["difficulty"],
+        "language": row["language"],
+        "topic": row["topic"],
+        "subject": row["subject"],
+        "source_nodes": json.loads(row["source_nodes"]),
+        "markdown": row["markdown"]
+    }
+
+
+_question_bank = None
+_question_bank_lock = threading.Lock()
+
+
+def get_question_bank():
+    """Return the process-wide question bank stored next to the index"""
+    global _question_bank
+    with _question_bank_lock:
+        if _question_bank is None:
+            os.makedirs(PERSIST_DIR, exist_ok=True)
+            _question_bank = QuestionBank(os.path.join(PERSIST_DIR, QUESTION_BANK_FILE))
+        return _question_bank
+
+
+def close_question_bank():
+    """Close the question bank, e.g. before its storage directory is deleted"""
+    global _question_bank
+    with _question_bank_lock:
+        if _question_bank is not None:
+            _question_bank._conn.close()
+            _question_bank = None
@@ -0,0 +1,105 @@
+"""
+Parsing utilities for generated question markdown
+"""
+
+import re
+
+# "### Question 3", "### Question [3]", "### Problème 2", "### Problem 2"
+QUESTION_HEADER = re.compile(r"^###\s+(Question|Problème|Problem)\s*\[?(\d+)\]?\s*$", re.MULTILINE)
+
+
+def split_question_blocks(markdown):
+    """Split generated markdown into one block per question (header included)"""
+    headers = list(QUESTION_HEADER.finditer(markdown))
+    blocks = []
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(markdown)
+        block = markdown[header.start():end].strip()
+        # Drop the trailing separator; it is added back when the blocks are joined
+        block = re.sub(r"\n-{3,}\s*$", "", block).strip()
+        blocks.append(block)
+    return blocks
+
+
+def question_stem(block):
+    """Return the question statement of a block (first line after the header)"""
+    for line in block.splitlines()[1:]:
+        line = line.strip()
+        if line:
+            # "**Q.** statement"; a fully bold line is the statement itself
+            return re.sub(r"^\*\*[^*]*\*\*\s*", "", line) or line.strip("*").strip()
+    return ""
+
+
+def normalize_stem(stem):
+    """Normalize a stem so near-identical questions compare equal"""
+    return " ".join(re.findall(r"\w+", stem.lower()))
+
+
+def renumber_block(block, number):
+    """Rewrite the header of a question block with a new number"""
+    return QUESTION_HEADER.sub(lambda m: f"### {m.group(1)} {number}", block, count=1)
+
+
+def join_question_blocks(blocks):
+    """Join question blocks back into markdown, keeping the --- separators"""
+    return "".join(f"{block}\n\n---\n\n" for block in blocks)
+
+
+# "**Réponse :**", "**Answer:**", "**Point clé :**", ...
+SECTION_LABEL = re.compile(r"^\*\*(?P<label>[^*:]+?)\s*:\s*\*\*\s*(?P<rest>.*)$")
+OPTION_LINE = re.compile(r"^\s*-\s*\*\*(?P<letter>[A-D])\)\*\*\s*(?P<text>.+)$")
+
+SECTION_FIELDS = {
+    "réponse": "answer",
+    "answer": "answer",
+    "solution": "answer",
+    "explication": "explanation",
+    "explanation": "explanation",
+    "point clé": "explanation",
+    "key point": "explanation"
+}
+
+
+def parse_question_block(block):
+    """Parse one question block in the EXACT formats requested by the prompts.
+
+    Returns a dict with ``stem``, ``options`` (letter -> text), ``answer`` and
+    ``explanation``; missing parts are left empty.
+    """
+    item = {"stem": question_stem(block), "options": {}, "answer": "", "explanation": ""}
+    current = None
+    for line in block.splitlines()[1:]:
+        option = OPTION_LINE.match(line)
+        if option:
+            item["options"][option.group("letter")] = option.group("text").strip()
+            continue
+        section = SECTION_LABEL.match(line.strip())
+        if section and section.group("label").strip().lower() in SECTION_FIELDS:
+            current = SECTION_FIELDS[section.group("label").strip().lower()]
+            item[current] = section.group("rest").strip()
+            continue
+        if current and line.strip():
+            item[current] = (item[current] + "\n" + line.strip()).strip()
+    return item
+
+
+def iter_streamed_blocks(deltas):
+    """Turn a stream of text deltas into complete question blocks as soon as each one ends"""
+    for blocks in iter_streamed_block_batches(deltas):
+        yield from blocks
+
+
+def iter_streamed_block_batches(deltas):
+    """Like ``iter_streamed_blocks``, but yield together the blocks completed by the same delta"""
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        headers = list(QUESTION_HEADER.finditer(buffer))
+        if len(headers) > 1:
+            # Everything before the last header is made of finished blocks
+            yield split_question_blocks(buffer[:headers[-1].start()])
+            buffer = buffer[headers[-1].start():]
+    blocks = split_question_blocks(buffer)
+    if blocks:
+        yield blocks
@@ -0,0 +1,85 @@
+"""
+Retrieval-only context building (no LLM synthesis)
+"""
+
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+from config.settings import QUESTION_CONTEXT_TOKEN_BUDGET
+from processors.synthesis import count_tokens
+
+
+def retrieve_context(query_engine, query, token_budget=QUESTION_CONTEXT_TOKEN_BUDGET):
+    """Retrieve ranked node texts for a query and pack them under a token budget.
+
+    Uses the engine's retriever and rerankers but never calls the LLM. Returns a
+    dict with the packed ``text``, the ``passages`` it is made of and their
+    ``node_ids`` in rank order.
+    """
+    nodes = query_engine.retrieve(QueryBundle(query_str=query))
+
+    passages = []
+    used_tokens = 0
+    for node_with_score in nodes:
+        text = node_with_score.node.get_content().strip()
+        tokens = count_tokens(text)
+        if used_tokens + tokens > token_budget:
+            # Lower-ranked nodes may still fit in what is left
+            continue
+        passages.append({
+            "node_id": node_with_score.node.node_id,
+            "file_name": node_with_score.node.metadata.get("file_name"),
+            "score": node_with_score.score,
+            "tokens": tokens,
+            "text": text
+        })
+        used_tokens += tokens
+
+    return {
+        "text": "\n\n".join(p["text"] for p in passages),
+        "passages": passages,
+        "node_ids": [p["node_id"] for p in passages],
+        "tokens": used_tokens
+    }
+
+
+def batch_retrieve(index, query_embeddings, top_k):
+    """Top-k nodes for many query embeddings at once.
+
+    With the in-memory vector store every query is scored by one matrix
+    product against all chunk embeddings (cosine similarity, as the store
+    itself uses). Other stores fall back to one retriever call per query.
+    """
+    embedding_dict = getattr(getattr(index.vector_store, "data", None), "embedding_dict", None)
+    if not embedding_dict:
+        retriever = index.as_retriever(similarity_top_k=top_k)
+        return [retriever.retrieve(QueryBundle(query_str="", embedding=list(embedding)))
+                for embedding in query_embeddings]
+
+    node_ids = list(embedding_dict)
+    matrix = np.asarray([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True).clip(min=1e-12)
+    scores = queries @ matrix.T
+
+    k = min(top_k, len(node_ids))
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    results = []
+    for row, candidates in enumerate(top):
+        ranked = candidates[np.argsort(-scores[row, candidates])]
+        nodes = index.docstore.get_nodes([node_ids[i] for i in ranked])
+        results.append([NodeWithScore(node=node, score=float(scores[row, i])) for node, i in zip(nodes, ranked)])
+    return results
+
+
+class PrecomputedRetriever(BaseRetriever):
+    """Serve retrieval results computed ahead of time, keyed by query string"""
+
+    def __init__(self, results):
+        super().__init__()
+        self._results = results
+
+    def _retrieve(self, query_bundle):
+        return list(self._results.get(query_bundle.query_str, []))
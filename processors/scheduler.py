@@ -0,0 +1,282 @@
+"""
+Priority scheduling of LLM and embedding requests across sessions
+"""
+
+import time
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from config.settings import (
+    SCHEDULER_PRIORITIES,
+    SCHEDULER_CLASS_LIMITS,
+    SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_NESTED_CLASS,
+    SCHEDULER_REQUESTS_PER_MINUTE,
+    SCHEDULER_TOKENS_PER_MINUTE,
+    SCHEDULER_ACQUIRE_TIMEOUT_SECONDS
+)
+
+_request_class = contextvars.ContextVar("request_class", default="qa")
+_session_id = contextvars.ContextVar("session_id", default=None)
+
+
+@contextmanager
+def request_context(request_class=None, session_id=None):
+    """Tag the requests made in this block with a priority class and/or a session"""
+    tokens = []
+    if request_class is not None:
+        tokens.append((_request_class, _request_class.set(request_class)))
+    if session_id is not None:
+        tokens.append((_session_id, _session_id.set(session_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def set_request_session(session_id):
+    """Attribute the current thread's requests to a session (for fairness across sessions)"""
+    _session_id.set(session_id)
+
+
+def current_request_context():
+    """Return the (request class, session id) of the calling context"""
+    return _request_class.get(), _session_id.get()
+
+
+class _RateBudget:
+    """Shared requests-per-minute and tokens-per-minute token buckets"""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.requests = float(requests_per_minute or 0)
+        self.tokens = float(tokens_per_minute or 0)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        if self.rpm:
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def wait_time(self, tokens):
+        """Seconds until a request of ``tokens`` fits the budget (0 when it fits now)"""
+        self._refill()
+        waits = [0.0]
+        if self.rpm and self.requests < 1:
+            waits.append((1 - self.requests) * 60 / self.rpm)
+        if self.tpm:
+            # A request larger than the whole budget only waits for a full bucket
+            needed = min(tokens, self.tpm)
+            if self.tokens < needed:
+                waits.append((needed - self.tokens) * 60 / self.tpm)
+        return max(waits)
+
+    def consume(self, tokens):
+        if self.rpm:
+            self.requests -= 1
+        if self.tpm:
+            self.tokens -= min(tokens, self.tpm)
+
+
+class _Waiter:
+    def __init__(self, seq, request_class, session_id, tokens):
+        self.seq = seq
+        self.request_class = request_class
+        self.session_id = session_id
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.event = threading.Event()
+        self.on_grant = None
+
+    def grant(self):
+        self.granted = True
+        self.event.set()
+        if self.on_grant is not None:
+            self.on_grant()
+
+
+class LLMScheduler:
+    """Grant request slots by priority class, within per-class and global limits.
+
+    Classes are served in SCHEDULER_PRIORITIES order (interactive QA first).
+    Within a class the session with the fewest running requests goes first, so
+    one session's large batch cannot crowd out the others. Every grant also
+    draws from a shared requests/tokens-per-minute budget. The nested class
+    (embeddings needed to keep reading an open stream) only counts against its
+    own limit, so streams filling the global limit cannot block their own consumers.
+    """
+
+    def __init__(self, priorities=SCHEDULER_PRIORITIES, class_limits=SCHEDULER_CLASS_LIMITS,
+                 max_concurrency=SCHEDULER_MAX_CONCURRENCY, requests_per_minute=SCHEDULER_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=SCHEDULER_TOKENS_PER_MINUTE):
+        self.priorities = list(priorities)
+        self.class_limits = dict(class_limits)
+        self.max_concurrency = max_concurrency
+        self._budget = _RateBudget(requests_per_minute, tokens_per_minute)
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._waiters = []
+        self._running = {name: 0 for name in self.priorities}
+        self._running_by_session = {}
+        self._timer = None
+        self._stats = {name: {"granted": 0, "wait_seconds": 0.0, "max_queue_depth": 0} for name in self.priorities}
+        self._stats_total = {"rate_limited": 0}
+
+    def _class_of(self, request_class):
+        return request_class if request_class in self._running else self.priorities[-1]
+
+    def _pick(self):
+        """The next waiter to run, or None when every class with waiters is at its limit"""
+        saturated = sum(n for name, n in self._running.items() if name != SCHEDULER_NESTED_CLASS) >= self.max_concurrency
+        for name in self.priorities:
+            if saturated and name != SCHEDULER_NESTED_CLASS:
+                continue
+            if self._running[name] >= self.class_limits.get(name, self.max_concurrency):
+                continue
+            candidates = [w for w in self._waiters if w.request_class == name]
+            if candidates:
+                return min(candidates, key=lambda w: (self._running_by_session.get(w.session_id, 0), w.seq))
+        return None
+
+    def _dispatch(self):
+        """Grant as many waiters as limits and the rate budget allow (lock held)"""
+        while self._waiters:
+            waiter = self._pick()
+            if waiter is None:
+                return
+            wait = self._budget.wait_time(waiter.tokens)
+            if wait > 0:
+                self._stats_total["rate_limited"] += 1
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._budget.consume(waiter.tokens)
+            self._waiters.remove(waiter)
+            self._running[waiter.request_class] += 1
+            self._running_by_session[waiter.session_id] = self._running_by_session.get(waiter.session_id, 0) + 1
+            stats = self._stats[waiter.request_class]
+            stats["granted"] += 1
+            stats["wait_seconds"] += time.monotonic() - waiter.enqueued
+            waiter.grant()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _enqueue(self, request_class, session_id, tokens, on_grant=None):
+        default_class, default_session = current_request_context()
+        request_class = self._class_of(request_class or default_class)
+        session_id = session_id if session_id is not None else default_session
+        with self._lock:
+            waiter = _Waiter(next(self._seq), request_class, session_id, tokens)
+            waiter.on_grant = on_grant
+            self._waiters.append(waiter)
+            depth = sum(1 for w in self._waiters if w.request_class == request_class)
+            stats = self._stats[request_class]
+            stats["max_queue_depth"] = max(stats["max_queue_depth"], depth)
+            self._dispatch()
+        return waiter
+
+    def acquire(self, request_class=None, session_id=None, tokens=0, timeout=SCHEDULER_ACQUIRE_TIMEOUT_SECONDS):
+        """Block until a slot is granted; returns the handle to pass to ``release``.
+
+        The class and session default to the caller's ``request_context``.
+        Raises ``TimeoutError`` if no slot is granted within ``timeout`` seconds.
+        """
+        waiter = self._enqueue(request_class, session_id, tokens)
+        if not waiter.event.wait(timeout):
+            self.cancel(waiter)
+            raise TimeoutError(f"No '{waiter.request_class}' request slot was granted within {timeout} s")
+        return waiter
+
+    async def aacquire(self, request_class=None, session_id=None, tokens=0, timeout=SCHEDULER_ACQUIRE_TIMEOUT_SECONDS):
+        """Async ``acquire``: waits without holding a thread"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def on_grant():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enqueue(request_class, session_id, tokens, on_grant)
+        try:
+            await asyncio.wait_for(granted, timeout)
+        except asyncio.CancelledError:
+            # Cancelled while queued (e.g. a losing hedge): give the slot back
+            self.cancel(waiter)
+            raise
+        except asyncio.TimeoutError:
+            self.cancel(waiter)
+            raise TimeoutError(f"No '{waiter.request_class}' request slot was granted within {timeout} s")
+        return waiter
+
+    def cancel(self, waiter):
+        """Withdraw a queued waiter, or release it if it was granted meanwhile"""
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return
+        self.release(waiter)
+
+    def release(self, waiter):
+        with self._lock:
+            self._running[waiter.request_class] -= 1
+            remaining = self._running_by_session.get(waiter.session_id, 1) - 1
+            if remaining:
+                self._running_by_session[waiter.session_id] = remaining
+            else:
+                self._running_by_session.pop(waiter.session_id, None)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, request_class=None, session_id=None, tokens=0):
+        """Hold a request slot for the duration of the block"""
+        waiter = self.acquire(request_class, session_id, tokens)
+        try:
+            yield
+        finally:
+            self.release(waiter)
+
+    def snapshot(self):
+        """Running requests, queue depth and wait statistics per class"""
+        with self._lock:
+            classes = {}
+            for name in self.priorities:
+                stats = self._stats[name]
+                classes[name] = {
+                    "running": self._running[name],
+                    "queued": sum(1 for w in self._waiters if w.request_class == name),
+                    "max_queue_depth": stats["max_queue_depth"],
+                    "granted": stats["granted"],
+                    "mean_wait_s": stats["wait_seconds"] / stats["granted"] if stats["granted"] else 0.0
+                }
+            return {
+                "classes": classes,
+                "sessions_running": len(self._running_by_session),
+                "rate_limited": self._stats_total["rate_limited"]
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide LLM scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -0,0 +1,129 @@
+"""
+Single-flight coalescing of identical in-flight requests
+"""
+
+import json
+import hashlib
+import threading
+import contextvars
+
+
+def request_fingerprint(**parts):
+    """Stable hash of everything that determines a request's result"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SharedStream:
+    """A result produced once and read by any number of callers.
+
+    The producer runs in its own thread and appends chunks to a buffer; every
+    reader iterates the buffer from the start and waits for new chunks, so a
+    reader that joins late still sees the whole stream and one that stops
+    early does not stall the others.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._chunks = []
+        self._done = False
+        self._error = None
+        self._ready = threading.Event()
+        self.value = None
+
+    def _produce(self, start):
+        try:
+            value, chunks = start()
+            self.value = value
+            self._ready.set()
+            for chunk in chunks:
+                with self._cond:
+                    self._chunks.append(chunk)
+                    self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+            self._ready.set()
+
+    def result(self):
+        """Wait for the value returned alongside the stream (e.g. the query response)"""
+        self._ready.wait()
+        if self._error is not None and self.value is None:
+            raise self._error
+        return self.value
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._chunks) and not self._done:
+                    self._cond.wait()
+                if index < len(self._chunks):
+                    chunk = self._chunks[index]
+                    index += 1
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            yield chunk
+
+
+class SingleFlight:
+    """Share one upstream call between concurrent identical requests.
+
+    A flight lasts while its call is running: callers arriving with the same
+    key in the meantime join it instead of starting their own. Finished
+    results are not kept here (the answer cache and question bank do that).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "in_flight": 0}
+
+    def stream(self, key, start):
+        """Join or start the flight for ``key``; returns (SharedStream, coalesced).
+
+        ``start`` is called once, in a worker thread, and returns a
+        ``(value, chunk iterator)`` pair. It must not call Streamlit.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.stats["coalesced"] += 1
+                return flight, True
+            flight = SharedStream()
+            self._flights[key] = flight
+            self.stats["leaders"] += 1
+            self.stats["in_flight"] = len(self._flights)
+
+        # The leader's context (e.g. its scheduling priority and session) follows the call
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(self._run, key, flight, start),
+                         name="single-flight", daemon=True).start()
+        return flight, False
+
+    def do(self, key, fn):
+        """Run ``fn()`` once for all concurrent callers with the same key and return its result"""
+        flight, _ = self.stream(key, lambda: (fn(), iter(())))
+        return flight.result()
+
+    def _run(self, key, flight, start):
+        try:
+            flight._produce(start)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                self.stats["in_flight"] = len(self._flights)
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight():
+    """Return the process-wide single-flight registry"""
+    return _single_flight
@@ -0,0 +1,193 @@
+"""
+Adaptive response synthesis for the subject engines
+"""
+
+import logging
+from llama_index.core.async_utils import asyncio_run, run_jobs
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.indices.prompt_helper import PromptHelper
+from llama_index.core.prompts import ChatPromptTemplate
+from llama_index.core.prompts.default_prompts import (
+    DEFAULT_TEXT_QA_PROMPT_TMPL,
+    DEFAULT_TREE_SUMMARIZE_TMPL
+)
+from llama_index.core.response_synthesizers.base import BaseSynthesizer
+from config.settings import SYNTHESIS_COMPACT_TOKEN_LIMIT, SYNTHESIS_MAX_PARALLEL_SUMMARIES
+from processors.token_budget import TokenBudget, count_tokens as _count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def build_chat_template(system_prompt, template_str):
+    """Build a chat prompt template carrying the subject system prompt"""
+    return ChatPromptTemplate(message_templates=[
+        ChatMessage(role=MessageRole.SYSTEM, content=system_prompt),
+        ChatMessage(role=MessageRole.USER, content=template_str)
+    ])
+
+
+def count_tokens(text):
+    """Count tokens with the shared memoized tokenizer"""
+    return _count_tokens(text)
+
+
+class AdaptiveSynthesizer(BaseSynthesizer):
+    """Pick the cheapest synthesis strategy for the retrieved context.
+
+    When every retrieved chunk fits in a single prompt the answer is produced
+    with one LLM call (compact mode). Otherwise the chunks are repacked and
+    summarized hierarchically, with the leaf summaries of each level run
+    concurrently. The number of LLM calls and tokens used is attached to the
+    response metadata under ``"synthesis"``.
+    """
+
+    def __init__(self, llm=None, system_prompt=None, streaming=False,
+                 compact_token_limit=SYNTHESIS_COMPACT_TOKEN_LIMIT,
+                 max_parallel_summaries=SYNTHESIS_MAX_PARALLEL_SUMMARIES):
+        super().__init__(llm=llm, streaming=streaming)
+        if system_prompt:
+            self._qa_template = build_chat_template(system_prompt, DEFAULT_TEXT_QA_PROMPT_TMPL)
+            self._summary_template = build_chat_template(system_prompt, DEFAULT_TREE_SUMMARIZE_TMPL)
+        else:
+            self._qa_template = ChatPromptTemplate.from_messages([("user", DEFAULT_TEXT_QA_PROMPT_TMPL)])
+            self._summary_template = ChatPromptTemplate.from_messages([("user", DEFAULT_TREE_SUMMARIZE_TMPL)])
+        self._compact_token_limit = compact_token_limit
+        self._max_parallel_summaries = max_parallel_summaries
+
+    def _get_prompts(self):
+        return {"text_qa_template": self._qa_template, "summary_template": self._summary_template}
+
+    def _update_prompts(self, prompts):
+        if "text_qa_template" in prompts:
+            self._qa_template = prompts["text_qa_template"]
+        if "summary_template" in prompts:
+            self._summary_template = prompts["summary_template"]
+
+    def _budget(self, template):
+        """Split the context window between the prompt, the reserved output and the context"""
+        return TokenBudget(
+            model=getattr(self._llm, "model", None),
+            output_tokens=self._prompt_helper.num_output,
+            prompt=template.format(context_str=""),
+            max_context_tokens=self._compact_token_limit,
+            context_window=self._prompt_helper.context_window
+        )
+
+    def _repack(self, template, chunks):
+        """Merge chunks so each one fills (but does not exceed) a single prompt"""
+        helper = self._prompt_helper
+        if self._compact_token_limit:
+            prompt_tokens = count_tokens(template.format(context_str=""))
+            helper = PromptHelper(
+                context_window=min(helper.context_window, self._compact_token_limit + helper.num_output + prompt_tokens),
+                num_output=helper.num_output
+            )
+        return helper.repack(template, chunks, llm=self._llm)
+
+    def _plan(self, query_str, text_chunks, stats):
+        """Choose the synthesis mode and return (template, chunks)"""
+        qa_template = self._qa_template.partial_format(query_str=query_str)
+        stats["context_tokens"] = sum(count_tokens(chunk) for chunk in text_chunks)
+        budget = self._budget(qa_template)
+        budget.used_context_tokens = stats["context_tokens"]
+        budget.log("synthesis")
+
+        if stats["context_tokens"] <= budget.context_tokens:
+            stats["mode"] = "compact"
+            return qa_template, ["\n\n".join(chunk.strip() for chunk in text_chunks)]
+
+        stats["mode"] = "tree_summarize"
+        summary_template = self._summary_template.partial_format(query_str=query_str)
+        return summary_template, self._repack(summary_template, text_chunks)
+
+    def _record_call(self, stats, template, context, output=None):
+        stats["llm_calls"] += 1
+        stats["input_tokens"] += count_tokens(template.format(context_str=context))
+        if output is not None:
+            stats["output_tokens"] += count_tokens(output)
+
+    async def _summarize_level(self, template, chunks, stats, **response_kwargs):
+        """Summarize one level of the tree with bounded concurrency"""
+        jobs = [self._llm.apredict(template, context_str=chunk, **response_kwargs) for chunk in chunks]
+        summaries = await run_jobs(jobs, workers=self._max_parallel_summaries)
+        for chunk, summary in zip(chunks, summaries):
+            self._record_call(stats, template, chunk, summary)
+        stats["levels"] += 1
+        return self._repack(template, summaries)
+
+    def _count_stream(self, token_gen, stats):
+        text = ""
+        for token in token_gen:
+            text += token
+            yield token
+        stats["output_tokens"] += count_tokens(text)
+
+    async def _acount_stream(self, token_gen, stats):
+        text = ""
+        async for token in token_gen:
+            text += token
+            yield token
+        stats["output_tokens"] += count_tokens(text)
+
+    @staticmethod
+    def _new_stats():
+        return {"mode": None, "llm_calls": 0, "levels": 0, "context_tokens": 0, "input_tokens": 0, "output_tokens": 0}
+
+    def get_response(self, query_str, text_chunks, synthesis_stats=None, **response_kwargs):
+        """Answer the query with a single call when possible, hierarchically otherwise"""
+        stats = synthesis_stats if synthesis_stats is not None else self._new_stats()
+        template, chunks = self._plan(query_str, text_chunks, stats)
+
+        while len(chunks) > 1:
+            chunks = asyncio_run(self._summarize_level(template, chunks, stats, **response_kwargs))
+
+        logger.debug("synthesis mode %s (%s context tokens)", stats["mode"], stats["context_tokens"])
+
+        if self._streaming:
+            self._record_call(stats, template, chunks[0])
+            token_gen = self._llm.stream(template, context_str=chunks[0], **response_kwargs)
+            return self._count_stream(token_gen, stats)
+
+        response = self._llm.predict(template, context_str=chunks[0], **response_kwargs)
+        self._record_call(stats, template, chunks[0], response)
+        return response
+
+    async def aget_response(self, query_str, text_chunks, synthesis_stats=None, **response_kwargs):
+        """Async variant of get_response"""
+        stats = synthesis_stats if synthesis_stats is not None else self._new_stats()
+        template, chunks = self._plan(query_str, text_chunks, stats)
+
+        while len(chunks) > 1:
+            chunks = await self._summarize_level(template, chunks, stats, **response_kwargs)
+
+        if self._streaming:
+            self._record_call(stats, template, chunks[0])
+            token_gen = await self._llm.astream(template, context_str=chunks[0], **response_kwargs)
+            return self._acount_stream(token_gen, stats)
+
+        response = await self._llm.apredict(template, context_str=chunks[0], **response_kwargs)
+        self._record_call(stats, template, chunks[0], response)
+        return response
+
+    def synthesize(self, query, nodes, additional_source_nodes=None, **response_kwargs):
+        stats = self._new_stats()
+        response = super().synthesize(query, nodes, additional_source_nodes, synthesis_stats=stats, **response_kwargs)
+        return _attach_stats(response, stats)
+
+    async def asynthesize(self, query, nodes, additional_source_nodes=None, **response_kwargs):
+        stats = self._new_stats()
+        response = await super().asynthesize(query, nodes, additional_source_nodes, synthesis_stats=stats, **response_kwargs)
+        return _attach_stats(response, stats)
+
+
+def _attach_stats(response, stats):
+    # Streamed output tokens are added to the same dict once the stream is consumed
+    response.metadata = dict(response.metadata or {})
+    response.metadata["synthesis"] = stats
+    return response
+
+
+def get_synthesis_stats(response):
+    """Return the synthesis statistics attached to a query response, if any"""
+    metadata = getattr(response, "metadata", None) or {}
+    return metadata.get("synthesis")
@@ -0,0 +1,124 @@
+"""
+Token budget utilities for prompts and retrieved context
+"""
+
+import logging
+from functools import lru_cache
+
+import tiktoken
+from llama_index.core.utils import get_tokenizer
+from llama_index.llms.openai.utils import openai_modelname_to_contextsize
+from config.settings import DEFAULT_CONTEXT_WINDOW, TOKEN_COUNT_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=None):
+    """Return the (cached) tiktoken encoding for a model"""
+    # Also points tiktoken at the encoding files bundled with llama_index
+    get_tokenizer()
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except (KeyError, ValueError, OSError):
+            # Unknown model, or its encoding file cannot be downloaded
+            pass
+    return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def count_tokens(text, model=None):
+    """Count the tokens of a string, memoized per (text, model)"""
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model=None):
+    """Cut a string to at most ``max_tokens`` tokens"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = get_encoding(model)
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+@lru_cache(maxsize=None)
+def get_context_window(model):
+    """Context window of an OpenAI model, with a conservative default for unknown models"""
+    if not model:
+        return DEFAULT_CONTEXT_WINDOW
+    try:
+        return openai_modelname_to_contextsize(model)
+    except ValueError:
+        return DEFAULT_CONTEXT_WINDOW
+
+
+class TokenBudget:
+    """Split a model's context window between prompt, examples, context and output.
+
+    The output reservation and the fixed prompt come first, examples get what
+    they need up to ``max_example_tokens`` and the retrieved context gets the
+    rest, capped at ``max_context_tokens``.
+    """
+
+    def __init__(self, model, output_tokens, prompt="", examples="", max_example_tokens=None,
+                 max_context_tokens=None, context_window=None):
+        self.model = model
+        self.context_window = context_window or get_context_window(model)
+        self.output_tokens = output_tokens
+        self.prompt_tokens = count_tokens(prompt, model)
+        example_tokens = count_tokens(examples, model) if examples else 0
+        if max_example_tokens is not None:
+            example_tokens = min(example_tokens, max_example_tokens)
+        self.example_tokens = example_tokens
+        available = self.context_window - self.output_tokens - self.prompt_tokens - self.example_tokens
+        if max_context_tokens is not None:
+            available = min(available, max_context_tokens)
+        self.context_tokens = max(available, 0)
+        self.used_context_tokens = 0
+        self.dropped = 0
+
+    def fit_examples(self, examples):
+        """Trim the examples block to its allocation"""
+        return truncate_to_tokens(examples, self.example_tokens, self.model)
+
+    def fit_passages(self, passages, key="text"):
+        """Keep passages in rank order while they fit; lower-ranked ones are dropped first.
+
+        ``passages`` are strings or dicts holding their text under ``key``,
+        ordered from most to least relevant.
+        """
+        kept, used = [], 0
+        for passage in passages:
+            text = passage[key] if isinstance(passage, dict) else passage
+            tokens = count_tokens(text, self.model)
+            if used + tokens > self.context_tokens:
+                continue
+            kept.append(passage)
+            used += tokens
+        if not kept and passages and self.context_tokens:
+            # Even the best passage is too long: keep its beginning rather than nothing
+            best = passages[0]
+            text = truncate_to_tokens(best[key] if isinstance(best, dict) else best, self.context_tokens, self.model)
+            kept = [dict(best, **{key: text}) if isinstance(best, dict) else text]
+            used = count_tokens(text, self.model)
+        self.used_context_tokens = used
+        self.dropped = len(passages) - len(kept)
+        return kept
+
+    def as_dict(self):
+        return {
+            "model": self.model,
+            "context_window": self.context_window,
+            "output": self.output_tokens,
+            "prompt": self.prompt_tokens,
+            "examples": self.example_tokens,
+            "context": self.context_tokens,
+            "context_used": self.used_context_tokens,
+            "passages_dropped": self.dropped
+        }
+
+    def log(self, name):
+        """Log the allocation of one call"""
+        logger.info("token budget [%s] %s", name, " ".join(f"{k}={v}" for k, v in self.as_dict().items()))
@@ -3,4 +3,13 @@ Export all utility functions
 """
 
 from .translation import get_translation
-from .session import init_session_state
+from .session import init_session_state, enforce_session_budget
+from .streaming import (
+    TimedStream,
+    iter_response_text,
+    format_timing_caption,
+    format_synthesis_stats,
+    format_compression_stats,
+    format_concept_map_stats,
+    format_chat_usage
+)
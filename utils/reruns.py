@@ -0,0 +1,58 @@
+"""
+Rerun isolation utilities
+"""
+
+import functools
+from collections import OrderedDict
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from config.settings import SESSION_MEMO_MAX_ENTRIES
+from processors.llm_client import count_upstream_calls
+from processors.scheduler import request_context
+from utils.streaming import format_upstream_calls
+from utils.session import enforce_session_budget
+
+
+def tab_fragment(request_class):
+    """Render a tab as a Streamlit fragment running in the given scheduler class.
+
+    Interacting with the tab's widgets reruns only that tab, and each run ends
+    with a caption counting the upstream API requests it made.
+    """
+    def decorator(render):
+        @st.fragment
+        @functools.wraps(render)
+        def run(*args, **kwargs):
+            # Fragment reruns skip the main script, so the request context is set here
+            script_ctx = get_script_run_ctx()
+            session_id = script_ctx.session_id if script_ctx else None
+            with request_context(request_class, session_id), count_upstream_calls() as counter:
+                result = render(*args, **kwargs)
+            st.caption(format_upstream_calls(st.session_state.get("language", "fr"), counter["calls"]))
+            return result
+        return run
+    return decorator
+
+
+def memo_get(key):
+    """Return this session's memoized result for ``key``, or None"""
+    memo = st.session_state.get("result_memo")
+    if memo is None or key not in memo:
+        return None
+    memo.move_to_end(key)
+    return memo[key]
+
+
+def memo_put(key, result):
+    """Memoize a result for this session, keeping the most recent entries"""
+    if "result_memo" not in st.session_state:
+        st.session_state.result_memo = OrderedDict()
+    memo = st.session_state.result_memo
+    memo[key] = result
+    memo.move_to_end(key)
+    while len(memo) > SESSION_MEMO_MAX_ENTRIES:
+        memo.popitem(last=False)
+    # Fragment reruns skip the end of the main script, where the budget is otherwise enforced
+    script_ctx = get_script_run_ctx()
+    enforce_session_budget(session_id=script_ctx.session_id if script_ctx else None)
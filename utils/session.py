@@ -3,9 +3,30 @@ Session state management utilities
 """
 
 import os
+import sys
 import json
+import time
+import types
+import threading
 import streamlit as st
-from config.settings import PERSIST_DIR, DEFAULT_EMBED_MODEL, DEFAULT_SUBJECT, DEFAULT_LANGUAGE
+from config.settings import (
+    PERSIST_DIR,
+    DEFAULT_EMBED_MODEL,
+    DEFAULT_SUBJECT,
+    DEFAULT_LANGUAGE,
+    SESSION_MEMORY_BUDGET_BYTES,
+    SESSION_EVICTABLE_KEYS,
+    SESSION_MEMORY_REPORT_TTL_SECONDS
+)
+from processors.engine_cache import shared_object_ids
+
+# Objects that are not session data: never measured
+_SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+_MAX_SIZE_DEPTH = 16
+
+# Latest measurement of each session of this process: session id -> (bytes, time)
+_session_usage = {}
+_session_usage_lock = threading.Lock()
 
 
 def init_session_state():
@@ -37,3 +58,98 @@ def init_session_state():
     else:
         st.session_state.last_embed_model = DEFAULT_EMBED_MODEL
         st.session_state.last_subject = DEFAULT_SUBJECT
+
+
+def approx_size(obj, shared_ids=frozenset(), seen=None):
+    """Approximate bytes held by ``obj`` and what it references.
+
+    Objects in ``shared_ids`` (held by process-wide caches) and objects
+    already in ``seen`` are not counted again.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [(obj, 0)]
+    while stack:
+        current, depth = stack.pop()
+        if id(current) in seen or id(current) in shared_ids or isinstance(current, _SKIPPED_TYPES):
+            continue
+        seen.add(id(current))
+        try:
+            total += sys.getsizeof(current)
+        except TypeError:
+            continue
+        if depth >= _MAX_SIZE_DEPTH or isinstance(current, (str, bytes, bytearray, int, float)):
+            continue
+        if isinstance(current, dict):
+            children = [item for pair in current.items() for item in pair]
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            children = list(current)
+        else:
+            children = list(getattr(current, "__dict__", {}).values())
+            for slot in getattr(type(current), "__slots__", ()):
+                if hasattr(current, slot):
+                    children.append(getattr(current, slot))
+        stack.extend((child, depth + 1) for child in children)
+    return total
+
+
+def measure_session_state():
+    """Approximate bytes per session state key, largest first, and the keys held by reference"""
+    shared_ids = shared_object_ids()
+    seen = set()
+    sizes, shared = {}, []
+    for key in list(st.session_state.keys()):
+        value = st.session_state[key]
+        if id(value) in shared_ids:
+            shared.append(key)
+            continue
+        sizes[key] = approx_size(value, shared_ids, seen)
+    sizes = dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+    return {"total": sum(sizes.values()), "keys": sizes, "shared": sorted(shared)}
+
+
+def record_session_usage(session_id, total):
+    """Remember a session's latest measurement for the process-wide report"""
+    now = time.time()
+    with _session_usage_lock:
+        _session_usage[session_id] = (total, now)
+        for stale in [sid for sid, (_, seen_at) in _session_usage.items()
+                      if now - seen_at > SESSION_MEMORY_REPORT_TTL_SECONDS]:
+            del _session_usage[stale]
+
+
+def get_process_session_usage():
+    """Sessions measured recently in this process and their combined bytes"""
+    with _session_usage_lock:
+        sizes = [total for total, _ in _session_usage.values()]
+    return {"sessions": len(sizes), "total": sum(sizes), "largest": max(sizes, default=0)}
+
+
+def enforce_session_budget(budget=SESSION_MEMORY_BUDGET_BYTES, session_id=None):
+    """Evict cached results until session state fits ``budget``; returns the measurement.
+
+    The oldest memoized results go first, then the other evictable keys, largest
+    first. Anything evicted is simply recomputed the next time it is asked for.
+    """
+    report = measure_session_state()
+    total = report["total"]
+    evicted = 0
+    memo = st.session_state.get("result_memo")
+    while total > budget and memo:
+        _, result = memo.popitem(last=False)
+        total -= approx_size(result, shared_object_ids())
+        evicted += 1
+    for key in sorted((key for key in SESSION_EVICTABLE_KEYS if key != "result_memo" and key in report["keys"]),
+                      key=lambda key: report["keys"][key], reverse=True):
+        if total <= budget:
+            break
+        if st.session_state.get(key) is not None:
+            total -= report["keys"][key]
+            st.session_state[key] = None
+            evicted += 1
+    if evicted:
+        report = measure_session_state()
+        st.session_state.memory_evictions = st.session_state.get("memory_evictions", 0) + evicted
+    if session_id is not None:
+        record_session_usage(session_id, report["total"])
+    return report
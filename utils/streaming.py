@@ -0,0 +1,111 @@
+"""
+Token streaming and timing utilities
+"""
+
+import time
+
+
+class TimedStream:
+    """Wrap a token generator and record time-to-first-token and total time"""
+
+    def __init__(self, tokens, start_time=None):
+        self.tokens = tokens
+        self.start_time = start_time or time.time()
+        self.first_token_time = None
+        self.end_time = None
+
+    def __iter__(self):
+        for token in self.tokens:
+            if self.first_token_time is None:
+                self.first_token_time = time.time()
+            yield token
+        self.end_time = time.time()
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
+
+    @property
+    def total_time(self):
+        return (self.end_time or time.time()) - self.start_time
+
+
+def iter_response_text(response):
+    """Yield text from a llama_index response, streaming when the engine supports it"""
+    response_gen = getattr(response, "response_gen", None)
+    if response_gen is None:
+        yield str(response)
+    else:
+        yield from response_gen
+
+
+def format_timing_caption(language, total_time, time_to_first_token=None, note=""):
+    """Format the response-time caption shown under generated content"""
+    if language == "fr":
+        caption = f"⏱️ Temps de réponse: {total_time:.2f} secondes"
+        if time_to_first_token is not None:
+            caption += f" | Premier jeton: {time_to_first_token:.2f} s"
+    else:
+        caption = f"⏱️ Response time: {total_time:.2f} seconds"
+        if time_to_first_token is not None:
+            caption += f" | First token: {time_to_first_token:.2f} s"
+    return caption + note
+
+
+def format_synthesis_stats(language, stats):
+    """Format the LLM call and token counts reported by the adaptive synthesizer"""
+    if not stats:
+        return ""
+    tokens = stats["input_tokens"] + stats["output_tokens"]
+    if language == "fr":
+        return f" | {stats['llm_calls']} appel(s) LLM, {tokens} jetons ({stats['mode']})"
+    return f" | {stats['llm_calls']} LLM call(s), {tokens} tokens ({stats['mode']})"
+
+
+def format_compression_stats(language, stats):
+    """Format how much of the retrieved context was kept by extractive compression"""
+    if not stats:
+        return ""
+    saved = stats["original_tokens"] - stats["compressed_tokens"]
+    if language == "fr":
+        return f" | contexte compressé à {stats['ratio']:.0%} (-{saved} jetons)"
+    return f" | context compressed to {stats['ratio']:.0%} (-{saved} tokens)"
+
+
+def format_concept_map_stats(language, stats):
+    """Format the work done by the map-reduce concept extractor"""
+    if not stats:
+        return ""
+    if language == "fr":
+        return (f" | {stats['documents']} document(s) ({stats['cached_documents']} en cache), "
+                f"{stats['sections']} section(s), {stats['llm_calls']} appel(s) LLM")
+    return (f" | {stats['documents']} document(s) ({stats['cached_documents']} cached), "
+            f"{stats['sections']} section(s), {stats['llm_calls']} LLM call(s)")
+
+
+def format_memo_note(language):
+    """Note appended to a result shown again from the session memo"""
+    return " | résultat mémorisé" if language == "fr" else " | memoized result"
+
+
+def format_upstream_calls(language, calls):
+    """Format how many upstream API requests a rerun of a tab made"""
+    if language == "fr":
+        return f"🔌 Appels API pour cette exécution : {calls}"
+    return f"🔌 API calls in this run: {calls}"
+
+
+def format_chat_usage(language, usage):
+    """Format the per-turn token usage of a chat answer"""
+    synthesis = usage.get("synthesis") or {"input_tokens": 0, "output_tokens": 0}
+    if language == "fr":
+        retrieval = "passages réutilisés" if usage["retrieval"] == "reused" else "nouvelle recherche"
+        return (f" | jetons : reformulation {usage['condense_tokens']}, embedding {usage['embedding_tokens']}, "
+                f"réponse {synthesis['input_tokens']} + {synthesis['output_tokens']}, résumé {usage['summary_tokens']}"
+                f" | mémoire {usage['memory_tokens']}/{usage['memory_limit']} | {retrieval}")
+    retrieval = "reused passages" if usage["retrieval"] == "reused" else "new retrieval"
+    return (f" | tokens: condense {usage['condense_tokens']}, embedding {usage['embedding_tokens']}, "
+            f"answer {synthesis['input_tokens']} + {synthesis['output_tokens']}, summary {usage['summary_tokens']}"
+            f" | memory {usage['memory_tokens']}/{usage['memory_limit']} | {retrieval}")